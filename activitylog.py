@@ -0,0 +1,572 @@
+"""
+The activitylog module keeps the full history of a simulation's activities
+on disk, so that the history of a run is limited by disk space rather than
+by memory.
+
+An ActivityLog appends each activity as a fixed-width record to a segment
+file mapped into memory. When a segment is full, it is flushed and closed,
+and the next one is started; only the segment being written is kept
+mapped. Queries and the report read the segments back in chunks, so they
+too use a bounded amount of memory.
+
+A record is the timestamp, the category, the description, a handle for
+the identifier and the location's row and column. The names file of the
+log lists the identifiers, one JSON value per line, in the order they are
+first seen, and the handle of an identifier is where its line starts.
+Identifiers are found by an open-addressing hash table in the mapped index
+file, so only a bounded cache of recently used identifiers is kept in
+memory.
+
+LogMonitor is a LifecycleMonitor that writes every activity it is notified
+of to an ActivityLog; a snapshot of it restores a LifecycleMonitor, and
+leaves the log on disk.
+"""
+
+import json
+import mmap
+import os
+from collections import OrderedDict
+from struct import Struct
+
+from location import Location
+from monitor import Activity, LifecycleMonitor, RIDER, DRIVER, REQUEST, \
+    CANCEL, PICKUP, DROPOFF
+
+# timestamp, category, description, identifier handle, row, column
+_RECORD = Struct("<qBBQii")
+
+# A slot of the index: the hash of an identifier, and its handle plus one,
+# or 0 for an empty slot.
+_SLOT = Struct("<qQ")
+
+_CATEGORIES = [RIDER, DRIVER]
+_DESCRIPTIONS = [REQUEST, CANCEL, PICKUP, DROPOFF]
+_RIDER = _CATEGORIES.index(RIDER)
+_PICKUP = _DESCRIPTIONS.index(PICKUP)
+_DROPOFF = _DESCRIPTIONS.index(DROPOFF)
+
+# The records read at a time by a scan.
+CHUNK = 4096
+
+# The slots of a new index.
+_INDEX_SLOTS = 1 << 12
+
+
+class ActivityLog:
+    """An append-only log of activities in memory-mapped segment files.
+
+    === Attributes ===
+    @type directory: str
+        The directory holding the segment files and the names file.
+    @type segment_records: int
+        The number of records in a full segment.
+    @type cache_names: int
+        The most identifiers to keep in memory.
+    """
+
+    # === Private Attributes ===
+    # @type _handles: OrderedDict[str | int, int]
+    #     The handle of each recently used identifier, least recently used
+    #     first.
+    # @type _names_file: file
+    #     The names file, open for appending.
+    # @type _names_reader: file | None
+    #     The names file, open for reading, or None if the log is closed.
+    # @type _names_size: int
+    #     The size of the names file.
+    # @type _index_file: file | None
+    # @type _index: mmap.mmap | None
+    #     The map of the index file, or None if the log is closed.
+    # @type _slots: int
+    #     The number of slots in the index, a power of two.
+    # @type _used: int
+    #     The number of identifiers in the index.
+    # @type _segments: int
+    #     The number of segments, including the one being written.
+    # @type _file: file | None
+    #     The segment being written.
+    # @type _map: mmap.mmap | None
+    #     The memory map of the segment being written.
+    # @type _count: int
+    #     The number of records in the segment being written.
+    # @type _total: int
+    #     The number of records in the log.
+
+    def __init__(self, directory, segment_records=1 << 16,
+                 cache_names=1 << 16):
+        """Initialize an empty ActivityLog in <directory>, creating it if
+        needed.
+
+        @type self: ActivityLog
+        @type directory: str
+        @type segment_records: int
+        @type cache_names: int
+        @rtype: None
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_records = segment_records
+        self.cache_names = cache_names
+        self._handles = OrderedDict()
+        names = os.path.join(directory, "names")
+        self._names_file = open(names, "wb")
+        self._names_reader = open(names, "rb")
+        self._names_size = 0
+        self._index_file = None
+        self._index = None
+        self._slots = 0
+        self._used = 0
+        self._start_index(_INDEX_SLOTS)
+        self._segments = 0
+        self._file = None
+        self._map = None
+        self._count = 0
+        self._total = 0
+        self._start_segment()
+
+    def __len__(self):
+        """Return the number of activities in the log.
+
+        @type self: ActivityLog
+        @rtype: int
+        """
+
+        return self._total
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: ActivityLog
+        @rtype: str
+        """
+
+        return "ActivityLog ({} activities in {} segments)".format(
+            self._total, self._segments)
+
+    def append(self, timestamp, category, description, identifier, location):
+        """Append an activity to the log.
+
+        @type self: ActivityLog
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROPOFF
+        @type identifier: str | int
+        @type location: Location
+        @rtype: None
+        """
+
+        if self._count == self.segment_records:
+            self._finish_segment()
+            self._start_segment()
+        handle = self._handles.get(identifier)
+        if handle is None:
+            handle = self._handle(identifier)
+            self._handles[identifier] = handle
+            if len(self._handles) > self.cache_names:
+                self._handles.popitem(last=False)
+        else:
+            self._handles.move_to_end(identifier)
+        _RECORD.pack_into(self._map, self._count * _RECORD.size, timestamp,
+                          _CATEGORIES.index(category),
+                          _DESCRIPTIONS.index(description), handle,
+                          location.row, location.column)
+        self._count += 1
+        self._total += 1
+
+    def scan(self):
+        """Yield the records of the log in order, as (timestamp, category,
+        description, identifier, row, column) tuples.
+
+        @type self: ActivityLog
+        @rtype: iterator[(int, str, str, str | int, int, int)]
+        """
+
+        if self._map is not None:
+            self._names_file.flush()
+        names = OrderedDict()
+        with open(os.path.join(self.directory, "names"), "rb") as file:
+            for timestamp, category, description, handle, row, column \
+                    in self._records():
+                identifier = names.get(handle)
+                if identifier is None:
+                    file.seek(handle)
+                    identifier = json.loads(file.readline().decode())
+                    names[handle] = identifier
+                    if len(names) > self.cache_names:
+                        names.popitem(last=False)
+                yield (timestamp, _CATEGORIES[category],
+                       _DESCRIPTIONS[description], identifier, row, column)
+
+    def activities(self, category, identifier):
+        """Return the activities of <identifier> in <category>, in order.
+
+        @type self: ActivityLog
+        @type category: DRIVER | RIDER
+        @type identifier: str | int
+        @rtype: list[Activity]
+
+        >>> import tempfile
+        >>> log = ActivityLog(tempfile.mkdtemp(), segment_records=2,
+        ...                   cache_names=1)
+        >>> log.append(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        >>> log.append(1, RIDER, REQUEST, 'Bo', Location(0, 2))
+        >>> log.append(3, DRIVER, PICKUP, 'Ann', Location(0, 2))
+        >>> print(log)
+        ActivityLog (3 activities in 2 segments)
+        >>> [(activity.time, activity.description)
+        ...  for activity in log.activities(DRIVER, 'Ann')]
+        [(0, 'request'), (3, 'pickup')]
+        >>> log.close()
+        >>> [record[3] for record in log.scan()]
+        ['Ann', 'Bo', 'Ann']
+        """
+
+        handle = self._handles.get(identifier)
+        if handle is None:
+            if self._index is not None:
+                handle = self._find(identifier)[0]
+            else:
+                handle = self._search(identifier)
+            if handle is None:
+                return []
+        wanted = _CATEGORIES.index(category)
+        return [Activity(timestamp, _DESCRIPTIONS[description], identifier,
+                         Location(row, column))
+                for timestamp, kind, description, record_handle, row, column
+                in self._records()
+                if record_handle == handle and kind == wanted]
+
+    def report(self):
+        """Return the report of the activities in the log, as
+        Monitor.report would give it.
+
+        Only the first activity of each rider and the last activity of each
+        driver are kept during the scan.
+
+        @type self: ActivityLog
+        @rtype: dict[str, object]
+        """
+
+        wait_time = waits = total_distance = ride_distance = 0
+        requested = {}
+        last = {}
+        for timestamp, category, description, handle, row, column \
+                in self._records():
+            if category == _RIDER:
+                if handle not in requested:
+                    requested[handle] = timestamp
+                elif requested[handle] is not None:
+                    wait_time += timestamp - requested[handle]
+                    waits += 1
+                    requested[handle] = None
+            else:
+                previous = last.get(handle)
+                if previous is not None:
+                    distance = abs(previous[0] - row) \
+                        + abs(previous[1] - column)
+                    total_distance += distance
+                    if previous[2] == _PICKUP and description == _DROPOFF:
+                        ride_distance += distance
+                last[handle] = (row, column, description)
+        drivers = len(last)
+        return {"rider_wait_time": wait_time / waits if waits else 0.0,
+                "driver_total_distance":
+                    total_distance / drivers if drivers else 0.0,
+                "driver_ride_distance":
+                    ride_distance / drivers if drivers else 0.0}
+
+    def flush(self):
+        """Write the segment being written and the names file to disk.
+
+        @type self: ActivityLog
+        @rtype: None
+        """
+
+        self._map.flush()
+        self._names_file.flush()
+
+    def close(self):
+        """Flush the log and close its files. The log may still be scanned.
+
+        @type self: ActivityLog
+        @rtype: None
+        """
+
+        if self._map is not None:
+            self._finish_segment()
+            self._names_file.close()
+            self._names_reader.close()
+            self._names_reader = None
+            self._index.close()
+            self._index = None
+            self._index_file.close()
+            self._index_file = None
+            os.remove(self._index_path())
+
+    def _handle(self, identifier):
+        """Return the handle of <identifier>, adding it to the names file
+        and the index if it is new.
+
+        @type self: ActivityLog
+        @type identifier: str | int
+        @rtype: int
+        """
+
+        handle, slot = self._find(identifier)
+        if handle is not None:
+            return handle
+        handle = self._names_size
+        line = (json.dumps(identifier) + "\n").encode()
+        self._names_file.write(line)
+        self._names_size += len(line)
+        _SLOT.pack_into(self._index, slot * _SLOT.size, hash(identifier),
+                        handle + 1)
+        self._used += 1
+        if 2 * self._used > self._slots:
+            self._start_index(2 * self._slots)
+        return handle
+
+    def _find(self, identifier):
+        """Return the handle of <identifier> in the index, or None if it is
+        not there, and the slot it is in or would go in.
+
+        @type self: ActivityLog
+        @type identifier: str | int
+        @rtype: (int | None, int)
+        """
+
+        code = hash(identifier)
+        mask = self._slots - 1
+        slot = code & mask
+        while True:
+            stored, handle = _SLOT.unpack_from(self._index, slot * _SLOT.size)
+            if handle == 0:
+                return None, slot
+            if stored == code and self._name(handle - 1) == identifier:
+                return handle - 1, slot
+            slot = (slot + 1) & mask
+
+    def _name(self, handle):
+        """Return the identifier with <handle>, from the names file.
+
+        @type self: ActivityLog
+        @type handle: int
+        @rtype: str | int
+        """
+
+        self._names_file.flush()
+        self._names_reader.seek(handle)
+        return json.loads(self._names_reader.readline().decode())
+
+    def _search(self, identifier):
+        """Return the handle of <identifier> in the names file of a closed
+        log, or None if it is not there.
+
+        @type self: ActivityLog
+        @type identifier: str | int
+        @rtype: int | None
+        """
+
+        handle = 0
+        with open(os.path.join(self.directory, "names"), "rb") as file:
+            for line in file:
+                if json.loads(line.decode()) == identifier:
+                    return handle
+                handle += len(line)
+        return None
+
+    def _index_path(self):
+        """Return the path of the index file.
+
+        @type self: ActivityLog
+        @rtype: str
+        """
+
+        return os.path.join(self.directory, "index")
+
+    def _start_index(self, slots):
+        """Replace the index by one with <slots> slots holding the same
+        identifiers.
+
+        @type self: ActivityLog
+        @type slots: int
+        @rtype: None
+        """
+
+        path = self._index_path()
+        file = open(path + ".new", "w+b")
+        file.truncate(slots * _SLOT.size)
+        index = mmap.mmap(file.fileno(), 0)
+        mask = slots - 1
+        if self._index is not None:
+            for code, handle in _SLOT.iter_unpack(self._index):
+                if handle:
+                    slot = code & mask
+                    while _SLOT.unpack_from(index, slot * _SLOT.size)[1]:
+                        slot = (slot + 1) & mask
+                    _SLOT.pack_into(index, slot * _SLOT.size, code, handle)
+            self._index.close()
+            self._index_file.close()
+        os.replace(path + ".new", path)
+        self._index_file = file
+        self._index = index
+        self._slots = slots
+
+    def _records(self):
+        """Yield the raw records of the log in order.
+
+        @type self: ActivityLog
+        @rtype: iterator[(int, int, int, int, int, int)]
+        """
+
+        for index in range(self._segments):
+            for chunk in self._chunks(index):
+                yield from _RECORD.iter_unpack(chunk)
+
+    def _chunks(self, index):
+        """Yield the records of segment <index> as bytes, CHUNK records at a
+        time.
+
+        @type self: ActivityLog
+        @type index: int
+        @rtype: iterator[bytes]
+        """
+
+        step = CHUNK * _RECORD.size
+        if self._map is not None and index == self._segments - 1:
+            used = self._count * _RECORD.size
+            for start in range(0, used, step):
+                yield self._map[start:min(start + step, used)]
+            return
+        with open(self._segment_path(index), "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) \
+                    as mapped:
+                for start in range(0, len(mapped), step):
+                    yield mapped[start:start + step]
+
+    def _segment_path(self, index):
+        """Return the path of segment <index>.
+
+        @type self: ActivityLog
+        @type index: int
+        @rtype: str
+        """
+
+        return os.path.join(self.directory, "segment-{:06d}".format(index))
+
+    def _start_segment(self):
+        """Create and map the next segment, at its full size.
+
+        @type self: ActivityLog
+        @rtype: None
+        """
+
+        self._file = open(self._segment_path(self._segments), "w+b")
+        self._file.truncate(self.segment_records * _RECORD.size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._segments += 1
+        self._count = 0
+
+    def _finish_segment(self):
+        """Flush and unmap the segment being written, trimmed to its
+        records.
+
+        @type self: ActivityLog
+        @rtype: None
+        """
+
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(self._count * _RECORD.size)
+        self._file.close()
+        self._file = None
+        self._names_file.flush()
+
+
+class LogMonitor(LifecycleMonitor):
+    """A LifecycleMonitor that also writes every activity to an
+    ActivityLog.
+
+    The report is kept from the running statistics; the log holds the
+    history, for audit and queries.
+
+    === Attributes ===
+    @type log: ActivityLog
+    """
+
+    def __init__(self, log):
+        """Initialize a LogMonitor writing to <log>.
+
+        @type self: LogMonitor
+        @type log: ActivityLog
+        @rtype: None
+        """
+
+        super().__init__()
+        self.log = log
+
+    def notify(self, timestamp, category, description, identifier, location):
+        """Notify the monitor of the activity.
+
+        @type self: LogMonitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROPOFF
+        @type identifier: str | int
+        @type location: Location
+        @rtype: None
+
+        >>> import tempfile
+        >>> monitor = LogMonitor(ActivityLog(tempfile.mkdtemp()))
+        >>> monitor.notify(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        >>> monitor.notify(1, RIDER, REQUEST, 'Bo', Location(0, 2))
+        >>> monitor.notify(3, DRIVER, PICKUP, 'Ann', Location(0, 2))
+        >>> monitor.notify(3, RIDER, PICKUP, 'Bo', Location(0, 2))
+        >>> monitor.notify(5, DRIVER, DROPOFF, 'Ann', Location(3, 2))
+        >>> monitor.report() == monitor.log.report()
+        True
+        >>> monitor.log.close()
+        """
+
+        super().notify(timestamp, category, description, identifier,
+                       location)
+        self.log.append(timestamp, category, description, identifier,
+                        location)
+
+    def activities(self, category, identifier):
+        """Return the activities of <identifier> in <category>, in order.
+
+        @type self: LogMonitor
+        @type category: DRIVER | RIDER
+        @type identifier: str | int
+        @rtype: list[Activity]
+        """
+
+        return self.log.activities(category, identifier)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from event import create_event_list
+    from simulation import Simulation
+
+    parser = argparse.ArgumentParser(
+        description="Run a simulation, keeping its history on disk.")
+    parser.add_argument("filename", nargs="?", default="events.txt")
+    parser.add_argument("--directory", default="activities")
+    parser.add_argument("--segment-records", type=int, default=1 << 16)
+    parser.add_argument("--cache-names", type=int, default=1 << 16)
+    arguments = parser.parse_args()
+
+    log = ActivityLog(arguments.directory, arguments.segment_records,
+                      arguments.cache_names)
+    simulation = Simulation(monitor=LogMonitor(log))
+    print(simulation.run(create_event_list(arguments.filename)))
+    log.close()
+    print(log)
+    print("from the log:", log.report())
@@ -0,0 +1,448 @@
+"""
+The approximate module estimates the report of a large scenario quickly,
+by simulating only a prefix of it.
+
+A scaled-down copy of a scenario cannot keep both the distance between
+drivers and the length of rides, so the approximation simulates the
+scenario itself, with every driver but only the riders who request before
+the cut. A rider is only given an idle driver when no earlier rider is
+waiting, so no later rider can change what happens to these riders: their
+waits, and the distance driven to pick them up and carry them, are exactly
+those of the full run.
+
+The rest of the riders are extrapolated. Each report metric is a sum over
+riders of a per-rider outcome, divided by the number of riders or of
+drivers; the outcomes of the riders who request once every driver is
+online, after the warm-up, are grouped in request order, and a line fitted
+through the group means predicts the mean outcome of the riders not
+simulated. The half width is that of the prediction, which allows for the
+uncertainty of the fitted trend and for the variation of the riders
+predicted.
+
+This only holds for a scenario that is stationary after the warm-up: the
+later riders must arrive, and be served, much as the simulated ones were.
+A prefix cannot see more demand, or more drivers, arriving after the cut,
+so stationary() compares the later arrivals with the simulated ones, and
+an approximation that fails the check has an infinite half width.
+Changes that keep the arrival rate, such as riders going further, are not
+detected. calibrate() measures the error and whether the intervals cover
+the full run, for a range of fractions.
+"""
+
+from bisect import bisect_left
+from math import sqrt
+from time import perf_counter
+
+from event import create_event_list
+from location import manhattan_distance
+from monitor import Monitor, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+from replication import Estimate, t_quantile
+from scenario import Scenario, RIDER_REQUEST, DRIVER_REQUEST
+from simulation import Simulation
+from steadystate import BATCH, mser
+
+# The share of the riders by which every driver must be online for a prefix
+# to wait for them before it settles.
+SETTLED = 0.5
+
+# How many standard deviations the number of riders in a window after the
+# cut may be from the number the arrival rate before it predicts, for the
+# scenario to count as stationary.
+DEVIATIONS = 4.0
+
+
+class OutcomeMonitor(Monitor):
+    """A Monitor that also keeps the outcome of each rider.
+
+    === Attributes ===
+    @type outcomes: list[list[int]]
+        The request time, wait, distance driven for and ride distance of
+        each rider, in the order they requested. The distance driven for a
+        rider is the distance to pick them up plus the ride; both are 0 if
+        the rider cancelled, and the wait is None until they are picked up
+        or cancel.
+    """
+
+    # === Private Attributes ===
+    # @type _riders: dict[str, list[int]]
+    #     The outcome of each rider, by identifier.
+    # @type _carrying: dict[str, list[int]]
+    #     The outcome of the rider each driver is carrying, by driver.
+    # @type _pickup: (str, int)
+    #     The driver of the last pickup and the distance they drove to it.
+
+    def __init__(self):
+        """Initialize an OutcomeMonitor.
+
+        @type self: OutcomeMonitor
+        @rtype: None
+        """
+
+        super().__init__()
+        self.outcomes = []
+        self._riders = {}
+        self._carrying = {}
+        self._pickup = None
+
+    def notify(self, timestamp, category, description, identifier, location):
+        """Notify the monitor of the activity, and add it to the outcome of
+        the rider it concerns.
+
+        A driver's pickup is notified just before the rider's.
+
+        @type self: OutcomeMonitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROPOFF
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+
+        >>> from location import Location
+        >>> monitor = OutcomeMonitor()
+        >>> monitor.notify(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        >>> monitor.notify(1, RIDER, REQUEST, 'Bo', Location(0, 2))
+        >>> monitor.notify(2, RIDER, REQUEST, 'Cy', Location(5, 5))
+        >>> monitor.notify(3, DRIVER, PICKUP, 'Ann', Location(0, 2))
+        >>> monitor.notify(3, RIDER, PICKUP, 'Bo', Location(0, 2))
+        >>> monitor.notify(5, DRIVER, DROPOFF, 'Ann', Location(3, 2))
+        >>> monitor.notify(7, RIDER, CANCEL, 'Cy', Location(5, 5))
+        >>> monitor.outcomes
+        [[1, 2, 5, 3], [2, 5, 0, 0]]
+        """
+
+        if category == RIDER:
+            if description == REQUEST:
+                outcome = [timestamp, None, 0, 0]
+                self.outcomes.append(outcome)
+                self._riders[identifier] = outcome
+            elif description == PICKUP or description == CANCEL:
+                outcome = self._riders.pop(identifier, None)
+                if outcome is not None:
+                    outcome[1] = timestamp - outcome[0]
+                    if description == PICKUP:
+                        driver, distance = self._pickup
+                        outcome[2] += distance
+                        self._carrying[driver] = outcome
+        elif description == PICKUP or description == DROPOFF:
+            previous = self._activities[DRIVER][identifier][-1]
+            distance = manhattan_distance(previous.location, location)
+            if description == PICKUP:
+                self._pickup = (identifier, distance)
+            else:
+                outcome = self._carrying.pop(identifier)
+                outcome[2] += distance
+                outcome[3] += distance
+        super().notify(timestamp, category, description, identifier,
+                       location)
+
+
+def prefix(scenario, fraction):
+    """Return the prefix of <scenario> to simulate to approximate it from
+    <fraction> of its riders, with the start of its settled part and its
+    cut.
+
+    The settled part starts once every driver is online, or once SETTLED
+    of the riders have requested if that is sooner, and the cut comes
+    after <fraction> of the riders who request after that. The
+    prefix holds every driver and the riders who request before the cut.
+    If there is no rider left to extrapolate, the prefix is the whole
+    scenario, and the cut is infinite.
+
+    @type scenario: Scenario
+    @type fraction: float
+        A number in [0, 1].
+    @rtype: (Scenario, int, int | float)
+
+    >>> scenario = Scenario(
+    ...     [str(i) for i in range(6)],
+    ...     [(1, 0, 0, 0, 0, 0, 0, 2)]
+    ...     + [(0, 10 * i, i, 0, 0, 0, 4, 5) for i in range(1, 6)])
+    >>> part, start, cut = prefix(scenario, 0.4)
+    >>> start, cut
+    (0, 30)
+    >>> [record[1] for record in part.records]
+    [0, 10, 20]
+    >>> late = Scenario(scenario.names, scenario.records
+    ...                 + [(1, 50, 0, 0, 0, 0, 0, 2)])
+    >>> prefix(late, 0.4)[1:]
+    (30, 50)
+    """
+
+    records = scenario.records
+    times = sorted(record[1] for record in records
+                   if record[0] == RIDER_REQUEST)
+    drivers = [record[1] for record in records
+               if record[0] == DRIVER_REQUEST]
+    if not drivers or not times:
+        return scenario, 0, float("inf")
+
+    start = min(max(drivers), times[int(SETTLED * (len(times) - 1))])
+    later = times[bisect_left(times, start + 1):]
+    count = int(round(fraction * len(later)))
+    if count >= len(later):
+        return scenario, start, float("inf")
+    cut = later[count]
+    return Scenario(scenario.names, [
+        record for record in records
+        if record[0] != RIDER_REQUEST or record[1] < cut]), start, cut
+
+
+def stationary(scenario, start, cut):
+    """Return whether <scenario> is stationary after <start>, as far as a
+    prefix cut at <cut> can tell: no driver comes online after <start>,
+    and the riders after the cut arrive at the rate of those between
+    <start> and <cut>.
+
+    The riders from the cut to the last are counted in windows about as
+    long as the span from <start> to <cut>; a count more than DEVIATIONS
+    standard deviations from the count the earlier rate predicts fails the
+    check.
+
+    @type scenario: Scenario
+    @type start: int
+    @type cut: int | float
+    @rtype: bool
+
+    >>> steady = Scenario([str(i) for i in range(9)],
+    ...     [(1, 0, 0, 0, 0, 0, 0, 2)]
+    ...     + [(0, 100 * i, i, 0, 0, 0, 4, 5) for i in range(1, 9)])
+    >>> stationary(steady, 0, 400)
+    True
+    >>> busier = Scenario(steady.names + ['x'] * 400, steady.records
+    ...     + [(0, 500 + i, 9 + i, 0, 0, 0, 4, 5) for i in range(400)])
+    >>> stationary(busier, 0, 400)
+    False
+    """
+
+    if cut == float("inf"):
+        return True
+    times = []
+    for record in scenario.records:
+        if record[0] == DRIVER_REQUEST and record[1] > start:
+            return False
+        if record[0] == RIDER_REQUEST and record[1] > start:
+            times.append(record[1])
+    times.sort()
+    span = cut - start
+    before = bisect_left(times, cut)
+    if before == 0:
+        return False
+    rate = before / span
+    end = times[-1] + 1
+    windows = max(1, (end - cut) // span)
+    for window in range(windows):
+        low = cut + (end - cut) * window / windows
+        high = cut + (end - cut) * (window + 1) / windows
+        expected = rate * (high - low)
+        count = bisect_left(times, high) - bisect_left(times, low)
+        if abs(count - expected) > DEVIATIONS * sqrt(
+                expected + expected * expected / before):
+            return False
+    return True
+
+
+def extrapolate(series, remaining, groups=5, confidence=0.95):
+    """Return an Estimate of the mean of the next <remaining> values of
+    <series>, from the line fitted through the means of <groups> groups of
+    its values.
+
+    Leading values that do not fill a group are dropped. The half width is
+    that of the prediction interval, taking the group means to be
+    independent about the line.
+
+    @type series: list[float]
+    @type remaining: int
+    @type groups: int
+    @type confidence: float
+    @rtype: Estimate
+
+    >>> result = extrapolate(list(range(20)), 10)
+    >>> result.mean, result.half_width
+    (24.5, 0.0)
+    >>> extrapolate([1, 2, 3], 10).half_width
+    inf
+    """
+
+    size = len(series) // groups
+    if size == 0 or groups < 3:
+        return Estimate(sum(series) / max(len(series), 1), float("inf"), 0)
+    start = len(series) - size * groups
+    positions = []
+    means = []
+    for group in range(groups):
+        first = start + group * size
+        positions.append(first + (size - 1) / 2)
+        means.append(sum(series[first:first + size]) / size)
+
+    mean_position = sum(positions) / groups
+    mean = sum(means) / groups
+    spread = sum((position - mean_position) ** 2 for position in positions)
+    slope = sum((position - mean_position) * (value - mean)
+                for position, value in zip(positions, means)) / spread
+    variance = sum((value - mean - slope * (position - mean_position)) ** 2
+                   for position, value in zip(positions, means)) \
+        / (groups - 2)
+
+    # The mean of the remaining values is predicted at their middle.
+    target = len(series) + (remaining - 1) / 2 - mean_position
+    prediction = variance * (1 / groups + target ** 2 / spread
+                             + size / max(remaining, 1))
+    return Estimate(mean + slope * target,
+                    t_quantile((1 + confidence) / 2, groups - 2)
+                    * sqrt(prediction), groups)
+
+
+def approximate(events, fraction, groups=5, confidence=0.95):
+    """Return an Estimate of each report metric of <events>, from a run of
+    a prefix of the scenario (see prefix).
+
+    The error bounds assume that the scenario is stationary once the
+    prefix is past its warm-up. A metric is exact, with a half width of
+    0.0, if the prefix is the whole scenario. It has an infinite half width
+    if the prefix is too short to be past its warm-up, or if the scenario
+    fails stationary(), for example because more riders arrive later.
+    The prefix always holds the warm-up, so the run time saved is at most
+    1 - <fraction> of the time after it.
+
+    @type events: list[Event] | Scenario
+    @type fraction: float
+        The fraction of the riders who request once every driver is
+        online to simulate.
+    @type groups: int
+        The number of groups the settled outcomes are fitted from.
+    @type confidence: float
+    @rtype: dict[str, Estimate]
+
+    >>> from workload import generate
+    >>> scenario = Scenario.from_events(generate(1000, 30, seed=2))
+    >>> estimates = approximate(scenario, 0.5)
+    >>> sorted(estimates)
+    ['driver_ride_distance', 'driver_total_distance', 'rider_wait_time']
+    >>> report = Simulation().run(scenario.events())
+    >>> all(estimate.low() <= report[metric] <= estimate.high()
+    ...     for metric, estimate in estimates.items())
+    True
+    >>> estimates = approximate(scenario, 1.0)
+    >>> all(estimates[metric].mean == report[metric]
+    ...     and estimates[metric].half_width == 0.0 for metric in report)
+    True
+    >>> later = generate(500, 0, seed=3, duration=1000)
+    >>> for event in later:
+    ...     event.timestamp += 1000
+    ...     event.rider.id += 'b'
+    >>> doubled = Scenario.from_events(scenario.events() + later)
+    >>> sorted(estimate.half_width
+    ...        for estimate in approximate(doubled, 0.2).values())
+    [inf, inf, inf]
+    """
+
+    scenario = events if isinstance(events, Scenario) \
+        else Scenario.from_events(events)
+    riders = sum(1 for record in scenario.records
+                 if record[0] == RIDER_REQUEST)
+    drivers = scenario.driver_count()
+    part, start, cut = prefix(scenario, fraction)
+    steady = stationary(scenario, start, cut)
+
+    monitor = OutcomeMonitor()
+    Simulation(monitor=monitor).run(part.events())
+    done = monitor.outcomes
+    remaining = riders - len(done)
+
+    estimates = {}
+    for metric, column, count in (("rider_wait_time", 1, riders),
+                                  ("driver_total_distance", 2, drivers),
+                                  ("driver_ride_distance", 3, drivers)):
+        total = sum(outcome[column] for outcome in done)
+        if remaining == 0:
+            estimates[metric] = Estimate(total / count if count else 0.0,
+                                         0.0, 1)
+            continue
+        series = [outcome[column] for outcome in done if outcome[0] > start]
+        means = [sum(series[start:start + BATCH]) / BATCH
+                 for start in range(0, len(series) - BATCH + 1, BATCH)]
+        truncation = mser(means)
+        if truncation is None or not steady:
+            result = Estimate(sum(series) / max(len(series), 1),
+                              float("inf"), 0)
+        else:
+            result = extrapolate(series[truncation * BATCH:], remaining,
+                                 groups, confidence)
+        # No outcome is negative, whatever the trend.
+        estimates[metric] = Estimate(
+            (total + remaining * max(result.mean, 0.0)) / count,
+            remaining * result.half_width / count, result.replications)
+    return estimates
+
+
+def calibrate(events, fractions, groups=5, confidence=0.95):
+    """Compare approximations of <events> at each of <fractions> with the
+    full run.
+
+    Return one row per fraction with the relative error and relative half
+    width of each metric, whether its interval covers the full run, and
+    the run time of the full run against the approximation's.
+
+    @type events: list[Event] | Scenario
+    @type fractions: list[float]
+    @type groups: int
+    @type confidence: float
+    @rtype: list[dict[str, float]]
+
+    >>> from workload import generate
+    >>> rows = calibrate(generate(1000, 30, seed=2), [0.5, 1.0])
+    >>> [row["rider_wait_time_error"] == 0.0 for row in rows]
+    [False, True]
+    >>> [row["rider_wait_time_covered"] for row in rows]
+    [1.0, 1.0]
+    """
+
+    scenario = events if isinstance(events, Scenario) \
+        else Scenario.from_events(events)
+    started = perf_counter()
+    exact = Simulation().run(scenario.events())
+    full_time = perf_counter() - started
+
+    rows = []
+    for fraction in fractions:
+        started = perf_counter()
+        estimates = approximate(scenario, fraction, groups, confidence)
+        row = {"fraction": fraction,
+               "speedup": full_time / (perf_counter() - started)}
+        for metric, value in exact.items():
+            scale = abs(value) or 1.0
+            estimate = estimates[metric]
+            row[metric + "_error"] = abs(estimate.mean - value) / scale
+            row[metric + "_half_width"] = estimate.half_width / scale
+            row[metric + "_covered"] = float(
+                estimate.low() <= value <= estimate.high())
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Approximate a simulation from a prefix of its "
+                    "scenario.")
+    parser.add_argument("filename", nargs="?", default="events.txt")
+    parser.add_argument("--fraction", type=float, default=0.2)
+    parser.add_argument("--groups", type=int, default=5)
+    parser.add_argument("--calibrate", type=float, nargs="*", default=None,
+                        metavar="FRACTION",
+                        help="compare with the full run at these fractions")
+    arguments = parser.parse_args()
+
+    events = create_event_list(arguments.filename)
+    if arguments.calibrate is None:
+        for metric, metric_estimate in approximate(
+                events, arguments.fraction, arguments.groups).items():
+            print("{}: {:.3f} +- {:.3f}".format(
+                metric, metric_estimate.mean, metric_estimate.half_width))
+    else:
+        for row in calibrate(events, arguments.calibrate
+                             or [0.05, 0.1, 0.2, 0.5, 1.0], arguments.groups):
+            print(", ".join("{} {:.3f}".format(key, value)
+                            for key, value in row.items()))
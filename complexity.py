@@ -0,0 +1,345 @@
+"""
+The complexity module checks that the engine's components scale no worse
+than their declared complexity.
+
+Each check runs a component on generated workloads of geometrically
+increasing size n, measures its cost, and fits the exponent k of
+cost ~ n ** k, or of cost ~ n ** k * log n for components declared
+logarithmic, on a log-log scale. A check fails if k exceeds its declared
+bound by more than the tolerance.
+
+Cost is the number of function calls the component makes, counted with
+sys.setprofile, so the checks do not depend on the speed or load of the
+machine. Work done inside builtins makes one call however long it takes,
+so where that work is what matters, the workload makes it visible: the
+EventQueue check uses timestamps whose comparisons are Python calls, so
+every comparison the heap makes is counted, and the waiting riders check
+uses riders whose equality is a Python call, so every rider a list scan
+such as list.remove or "in" looks at is counted.
+
+Run "python complexity.py" to run every check; it exits with status 1 if
+any fails.
+"""
+
+import sys
+from math import log
+from random import Random
+
+from container import EventQueue
+from dispatcher import Dispatcher
+from driver import Driver
+from event import Event
+from location import Location
+from lookahead import LookaheadDispatcher
+from monitor import Monitor, RIDER, DRIVER, REQUEST, PICKUP
+from rider import Rider
+from simulation import Simulation
+from workload import generate
+
+# How far a fitted exponent may exceed its bound before a check fails.
+TOLERANCE = 0.25
+
+
+class Check:
+    """A component whose cost must grow no faster than n ** bound.
+
+    === Attributes ===
+    @type name: str
+    @type bound: float
+        The declared exponent of the component's complexity.
+    @type sizes: list[int]
+        The values of n to measure at.
+    @type logarithmic: bool
+        True if the declared complexity is n ** bound * log n.
+    """
+
+    # === Private Attributes ===
+    # @type _setup: callable
+    #     A function that takes n and returns a function doing the work to
+    #     measure, so that building the workload is not measured.
+
+    def __init__(self, name, setup, bound, sizes, logarithmic=False):
+        """Initialize a Check.
+
+        @type self: Check
+        @type name: str
+        @type setup: callable
+        @type bound: float
+        @type sizes: list[int]
+        @type logarithmic: bool
+        @rtype: None
+        """
+
+        self.name = name
+        self._setup = setup
+        self.bound = bound
+        self.sizes = sizes
+        self.logarithmic = logarithmic
+
+    def measure(self):
+        """Return the (n, cost) of the component at each size, with the
+        cost divided by log n if the check is logarithmic.
+
+        @type self: Check
+        @rtype: list[(int, float)]
+        """
+
+        points = []
+        for n in self.sizes:
+            cost = count_calls(self._setup(n))
+            if self.logarithmic:
+                cost /= log(n)
+            points.append((n, cost))
+        return points
+
+    def run(self):
+        """Return the fitted exponent of the component, and whether it is
+        within the bound.
+
+        @type self: Check
+        @rtype: (float, bool)
+
+        >>> [check.name for check in CHECKS if not check.run()[1]]
+        []
+        """
+
+        exponent = growth_exponent(self.measure())
+        return exponent, exponent <= self.bound + TOLERANCE
+
+
+def count_calls(function):
+    """Return the number of Python and builtin function calls made by
+    calling <function>.
+
+    @type function: callable
+    @rtype: int
+
+    >>> count_calls(lambda: [len("a"), len("b")]) - count_calls(lambda: 0)
+    2
+    """
+
+    calls = 0
+
+    def tally(frame, event, argument):
+        nonlocal calls
+        if event == "call" or event == "c_call":
+            calls += 1
+
+    sys.setprofile(tally)
+    try:
+        function()
+    finally:
+        sys.setprofile(None)
+    return calls
+
+
+def growth_exponent(points):
+    """Return the slope of the least-squares line through <points> on a
+    log-log scale.
+
+    @type points: list[(int, float)]
+    @rtype: float
+
+    >>> round(growth_exponent([(10, 300), (20, 1200), (40, 4800)]), 6)
+    2.0
+    """
+
+    xs = [log(n) for n, _ in points]
+    ys = [log(max(cost, 1e-12)) for _, cost in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) \
+        / sum((x - mean_x) ** 2 for x in xs)
+
+
+class _Timestamp(int):
+    """An int whose comparisons are Python calls, so that count_calls
+    counts the comparisons made with it.
+    """
+
+    __hash__ = int.__hash__
+
+    def __eq__(self, other):
+        """Return True iff this timestamp equals <other>.
+
+        @type self: _Timestamp
+        @type other: int
+        @rtype: bool
+        """
+
+        return int(self) == int(other)
+
+    def __lt__(self, other):
+        """Return True iff this timestamp is less than <other>.
+
+        @type self: _Timestamp
+        @type other: int
+        @rtype: bool
+        """
+
+        return int(self) < int(other)
+
+
+def _event_queue(n):
+    """Return a function that adds <n> events in random order to an
+    EventQueue and removes them all.
+    """
+
+    random = Random(n)
+    timestamps = [_Timestamp(random.randrange(n)) for _ in range(n)]
+    events = [Event(timestamp) for timestamp in timestamps]
+
+    def work():
+        queue = EventQueue()
+        for event in events:
+            queue.add(event)
+        while not queue.is_empty():
+            queue.remove()
+    return work
+
+
+def _request_driver(n, dispatcher=None):
+    """Return a function that asks a dispatcher with <n> idle drivers for
+    a driver 100 times.
+    """
+
+    random = Random(n)
+    dispatcher = Dispatcher() if dispatcher is None else dispatcher
+    for i in range(n):
+        dispatcher.request_rider(Driver(i, Location(random.randrange(50),
+                                                    random.randrange(50)), 1))
+    riders = [Rider(i, Location(random.randrange(50), random.randrange(50)),
+                    Location(0, 0), 10) for i in range(100)]
+
+    def work():
+        for rider in riders:
+            dispatcher.request_driver(rider)
+    return work
+
+
+def _indexed_request_driver(n):
+    """Return a function that asks a LookaheadDispatcher with <n> idle
+    drivers for a driver 100 times.
+    """
+
+    return _request_driver(n, LookaheadDispatcher())
+
+
+class _Rider(Rider):
+    """A rider whose equality is a Python call, so that count_calls counts
+    the riders a scan compares.
+    """
+
+    __hash__ = Rider.__hash__
+
+    def __eq__(self, other):
+        """Return True iff this rider is <other>.
+
+        @type self: _Rider
+        @type other: object
+        @rtype: bool
+        """
+
+        return self is other
+
+
+def _waiting_riders(n, dispatcher_class=Dispatcher):
+    """Return a function that puts <n> riders on the waiting list of a
+    <dispatcher_class>, cancels every third, and hands the rest to
+    drivers.
+
+    A waiting list kept in a Python list fails the check, since each
+    cancellation scans it:
+
+    >>> class ListDispatcher(Dispatcher):
+    ...     def __init__(self):
+    ...         super().__init__()
+    ...         self.waiting = []
+    ...     def request_driver(self, rider, timestamp=None):
+    ...         self.waiting.append(rider)
+    ...     def cancel_ride(self, rider):
+    ...         if rider in self.waiting:
+    ...             self.waiting.remove(rider)
+    ...     def request_rider(self, driver):
+    ...         return self.waiting.pop(0) if self.waiting else None
+    >>> check = Check("list waiting riders",
+    ...               lambda n: _waiting_riders(n, ListDispatcher), 1.0,
+    ...               [250, 500, 1000])
+    >>> check.run()[1]
+    False
+    """
+
+    riders = [_Rider(i, Location(0, 0), Location(1, 1), 10)
+              for i in range(n)]
+    driver = Driver(0, Location(0, 0), 1)
+
+    def work():
+        dispatcher = dispatcher_class()
+        for rider in riders:
+            dispatcher.request_driver(rider)
+        for rider in riders[::3]:
+            dispatcher.cancel_ride(rider)
+        while dispatcher.request_rider(driver) is not None:
+            pass
+    return work
+
+
+def _notify(n):
+    """Return a function that gives a monitor the activities of <n> rides.
+    """
+
+    def work():
+        monitor = Monitor()
+        for i in range(n):
+            location = Location(i % 50, i % 7)
+            monitor.notify(i, RIDER, REQUEST, i, location)
+            monitor.notify(i, DRIVER, REQUEST, i % 20, location)
+            monitor.notify(i + 1, RIDER, PICKUP, i, location)
+            monitor.notify(i + 1, DRIVER, PICKUP, i % 20, location)
+    return work
+
+
+def _report(n):
+    """Return a function that reports on a monitor of <n> rides."""
+
+    monitor = Monitor()
+    for i in range(n):
+        monitor.notify(i, RIDER, REQUEST, i, Location(0, 0))
+        monitor.notify(i + 1, RIDER, PICKUP, i, Location(0, 0))
+    return monitor.report
+
+
+def _simulation(n):
+    """Return a function that runs a generated scenario of <n> riders and a
+    fleet of 20 drivers.
+    """
+
+    events = generate(n, 20, seed=n)
+    return lambda: Simulation().run(events)
+
+
+CHECKS = [
+    Check("EventQueue add and remove", _event_queue, 1.0,
+          [4000, 8000, 16000, 32000], logarithmic=True),
+    Check("Dispatcher.request_driver", _request_driver, 1.0,
+          [250, 500, 1000, 2000]),
+    Check("LookaheadDispatcher.request_driver", _indexed_request_driver, 0.5,
+          [250, 500, 1000, 2000]),
+    Check("Dispatcher waiting riders", _waiting_riders, 1.0,
+          [4000, 8000, 16000, 32000]),
+    Check("Monitor.notify", _notify, 1.0, [500, 1000, 2000, 4000]),
+    Check("Simulation.run", _simulation, 1.0, [500, 1000, 2000, 4000]),
+    Check("Monitor.report", _report, 0.0, [500, 1000, 2000, 4000]),
+]
+
+
+if __name__ == "__main__":
+    failed = False
+    for check in CHECKS:
+        exponent, passed = check.run()
+        failed = failed or not passed
+        print("{:<36} n^{:.2f}{} (bound n^{:.1f}{}) {}".format(
+            check.name, exponent, " log n" if check.logarithmic else "",
+            check.bound, " log n" if check.logarithmic else "",
+            "ok" if passed else "FAILED"))
+    sys.exit(1 if failed else 0)
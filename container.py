@@ -1,3 +1,6 @@
+from heapq import heappush, heappop
+
+
 class Container:
     """A container that holds objects.
 
@@ -108,6 +111,20 @@ class PriorityQueue(Container):
 
         return len(self._items) == 0
 
+    def __len__(self):
+        """Return the number of items in this PriorityQueue.
+
+        @type self: PriorityQueue
+        @rtype: int
+
+        >>> pq = PriorityQueue()
+        >>> pq.add("thing")
+        >>> len(pq)
+        1
+        """
+
+        return len(self._items)
+
     def add(self, item):
         """Add <item> to this PriorityQueue.
 
@@ -128,6 +145,152 @@ class PriorityQueue(Container):
         self._items.sort()
 
 
+class EventQueue(Container):
+    """A queue of events that operates in timestamp order.
+
+    This behaves like a PriorityQueue of Events: the event with the oldest
+    timestamp is removed first, and ties are resolved in FIFO order. The
+    queue is a binary heap of (timestamp, sequence, event) entries, so
+    ordering is decided by comparing ints in C rather than by calling the
+    Event rich comparison methods. The sequence number is unique, so two
+    events are never compared directly.
+
+    All items in the container must have an int timestamp attribute.
+    """
+
+    # === Private Attributes ===
+    # @type _items: list[(int, int, Event)]
+    #     A heap of (timestamp, sequence, event) entries.
+    # @type _sequence: int
+    #     The sequence number to give the next event that is added.
+    #
+    # === Representation Invariants ===
+    # _items satisfies the heap invariant, and every sequence number in it
+    # is less than _sequence.
+
+    def __init__(self):
+        """Initialize an empty EventQueue.
+
+        @type self: EventQueue
+        @rtype: None
+        """
+
+        self._items = []
+        self._sequence = 0
+
+    def add(self, item):
+        """Add <item> to this EventQueue.
+
+        @type self: EventQueue
+        @type item: Event
+        @rtype: None
+
+        >>> from event import Event
+        >>> eq = EventQueue()
+        >>> eq.add(Event(3))
+        >>> eq.add(Event(1))
+        >>> [(timestamp, sequence) for timestamp, sequence, _ in eq._items]
+        [(1, 1), (3, 0)]
+        """
+
+        heappush(self._items, (item.timestamp, self._sequence, item))
+        self._sequence += 1
+
+    def remove(self):
+        """Remove and return the next event from this EventQueue.
+
+        Precondition: <self> should not be empty.
+
+        @type self: EventQueue
+        @rtype: Event
+
+        >>> from event import Event
+        >>> eq = EventQueue()
+        >>> first, second, third = Event(2), Event(1), Event(2)
+        >>> for event in (first, second, third):
+        ...     eq.add(event)
+        >>> eq.remove() is second
+        True
+        >>> eq.remove() is first
+        True
+        >>> eq.remove() is third
+        True
+        """
+
+        return heappop(self._items)[2]
+
+    def is_empty(self):
+        """Return true iff this EventQueue is empty.
+
+        @type self: EventQueue
+        @rtype: bool
+
+        >>> from event import Event
+        >>> eq = EventQueue()
+        >>> eq.is_empty()
+        True
+        >>> eq.add(Event(0))
+        >>> eq.is_empty()
+        False
+        """
+
+        return not self._items
+
+    def next_timestamp(self):
+        """Return the timestamp of the next event in this EventQueue.
+
+        Precondition: <self> should not be empty.
+
+        @type self: EventQueue
+        @rtype: int
+
+        >>> from event import Event
+        >>> eq = EventQueue()
+        >>> eq.add(Event(4))
+        >>> eq.add(Event(2))
+        >>> eq.next_timestamp()
+        2
+        """
+
+        return self._items[0][0]
+
+    def __len__(self):
+        """Return the number of events in this EventQueue.
+
+        @type self: EventQueue
+        @rtype: int
+        """
+
+        return len(self._items)
+
+
+class ListEventQueue(PriorityQueue):
+    """A PriorityQueue of Events, which also gives the timestamp of its
+    next event.
+
+    This is the sorted list the simulation used before EventQueue, kept as
+    the reference to check EventQueue against.
+    """
+
+    def next_timestamp(self):
+        """Return the timestamp of the next event in this ListEventQueue.
+
+        Precondition: <self> should not be empty.
+
+        @type self: ListEventQueue
+        @rtype: int
+
+        >>> from event import Event
+        >>> eq = ListEventQueue()
+        >>> eq.add(Event(4))
+        >>> eq.add(Event(2))
+        >>> eq.next_timestamp()
+        2
+        """
+
+        return self._items[0].timestamp
+
+
 class Queue(Container):
     """A queue of items that operates in FIFO order.
     """
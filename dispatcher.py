@@ -1,7 +1,7 @@
 from driver import Driver
 from rider import Rider
 from location import Location
-from container import Queue
+from collections import OrderedDict
 
 
 class Dispatcher:
@@ -19,6 +19,15 @@ class Dispatcher:
     rider requests.
     """
 
+    # === Private Attributes ===
+    # @type _registered: set[str | int]
+    #     The ids of the drivers in _available_drivers, so registering is
+    #     a set lookup rather than a scan of the list.
+    # @type _waiting_riders: OrderedDict[int, Rider]
+    #     The waiting riders in the order they asked for a driver, keyed by
+    #     object id, so both handing out the longest waiting rider and
+    #     cancelling any rider take constant time.
+
     def __init__(self):
         """Initialize a Dispatcher.
 
@@ -29,7 +38,8 @@ class Dispatcher:
         """
 
         self._available_drivers = []
-        self._waiting_riders = Queue()
+        self._registered = set()
+        self._waiting_riders = OrderedDict()
 
     def __str__(self):
         """Return a string representation.
@@ -39,33 +49,37 @@ class Dispatcher:
         """
 
         return "Dispatcher:\n   waiting_riders {0}, \n  availalbe_drivers {1}"\
-            .format(self._waiting_riders, self._available_drivers)
+            .format(list(self._waiting_riders.values()),
+                    self._available_drivers)
 
-    def request_driver(self, rider):
+    def request_driver(self, rider, timestamp=None):
         """Return a driver for the rider, or None if no driver is available.
 
-        Add the rider to the waiting list if there is no available driver.
-        If there are available drivers, return the one that can reach the driver fastest
-
+        Only idle drivers are considered. If there are idle drivers, return
+        the one that can reach the rider fastest, or the first to register
+        among those tied. Otherwise, add the rider to the waiting list.
 
         @type self: Dispatcher
         @type rider: Rider
+        @type timestamp: int | None
+            The time of the request, for dispatchers that plan ahead.
         @rtype: Driver | None
         """
 
-        if len(self._available_drivers) == 0:
-            self._waiting_riders.add(rider)
-            return None
-
-        DriverTimes = []
+        # Only idle drivers can take the ride; ties go to the driver that
+        # registered first.
+        fastest_driver = None
+        shortest_time = None
         for driver in self._available_drivers:
             if driver.is_idle:
-                DriverTimes.append(driver.get_travel_time(rider.origin))
-        shortestTime = min(DriverTimes)
+                travel_time = driver.get_travel_time(rider.origin)
+                if shortest_time is None or travel_time < shortest_time:
+                    fastest_driver = driver
+                    shortest_time = travel_time
 
-        for driver in self._available_drivers:
-            if driver.get_travel_time(rider.origin) == shortestTime:
-                return driver
+        if fastest_driver is None:
+            self._waiting_riders[id(rider)] = rider
+        return fastest_driver
 
     def request_rider(self, driver):
         """Return a rider for the driver, or None if no rider is available.
@@ -78,14 +92,83 @@ class Dispatcher:
         @rtype: Rider | None
         """
 
-        if not driver in self._available_drivers:
+        if driver.id not in self._registered:
+            self._registered.add(driver.id)
             self._available_drivers.append(driver)
 
-        if self._waiting_riders.is_empty():
+        if not self._waiting_riders:
             return None
 
         # The longest waiting rider if the first element of self.waiting_riders
-        return self._waiting_riders.remove()
+        return self._waiting_riders.popitem(last=False)[1]
+
+    def remove_driver(self, driver, timestamp=None):
+        """Stop using <driver> to fulfill rider requests.
+
+        A dispatcher that reserves riders for drivers on a ride finds
+        another driver for a rider reserved for <driver>, and returns the
+        (rider, driver) match if it finds one; a Dispatcher returns None.
+
+        @type self: Dispatcher
+        @type driver: Driver
+        @type timestamp: int | None
+            The time the driver leaves.
+        @rtype: (Rider, Driver) | None
+
+        >>> dispatcher = Dispatcher()
+        >>> driver = Driver('Ann', Location(1, 2), 1)
+        >>> dispatcher.request_rider(driver)
+        >>> dispatcher.remove_driver(driver)
+        >>> dispatcher._available_drivers
+        []
+        """
+
+        if driver.id in self._registered:
+            self._registered.discard(driver.id)
+            self._available_drivers.remove(driver)
+
+    def driver_busy(self, driver, free_at):
+        """Note that <driver> has started a ride that ends at simulated time
+        <free_at>. This dispatcher only offers idle drivers, so there is
+        nothing to do.
+
+        @type self: Dispatcher
+        @type driver: Driver
+        @type free_at: int
+        @rtype: None
+        """
+
+        pass
+
+    def driver_free(self, driver):
+        """Note that <driver> has become idle, before asking for a rider.
+        This dispatcher finds idle drivers by scanning, so there is nothing
+        to do.
+
+        @type self: Dispatcher
+        @type driver: Driver
+        @rtype: None
+        """
+
+        pass
+
+    def idle_drivers(self):
+        """Return the registered drivers that are idle.
+
+        @type self: Dispatcher
+        @rtype: list[Driver]
+        """
+
+        return [driver for driver in self._available_drivers if driver.is_idle]
+
+    def waiting_count(self):
+        """Return the number of riders waiting for a driver.
+
+        @type self: Dispatcher
+        @rtype: int
+        """
+
+        return len(self._waiting_riders)
 
     def cancel_ride(self, rider):
         """Cancel the ride for rider.
@@ -96,13 +179,12 @@ class Dispatcher:
 
         >>> John = Dispatcher()
         >>> Bobby = Rider('Bobby', Location(1,2), Location(3,4), 10)
-        >>> John._waiting_riders.items = [Bobby]
+        >>> John.request_driver(Bobby)
         >>> John.cancel_ride(Bobby)
-        >>> print(John._waiting_riders.items)
+        >>> print(list(John._waiting_riders.values()))
         []
 
         """
 
-        if rider in self._waiting_riders.items:
-            self._waiting_riders.items.remove(rider)
+        self._waiting_riders.pop(id(rider), None)
 
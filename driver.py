@@ -6,14 +6,17 @@ class Driver:
     """A driver for a ride-sharing service.
 
     === Attributes ===
-    @type id: str
-        A unique identifier for the driver.
+    @type id: str | int
+        A unique identifier for the driver: their name, or their handle in a
+        Registry.
     @type location: Location
         The current location of the driver.
     @type speed: int
         The speed of the driver.
     @type is_idle: bool
         A property that is True if the driver is idle and False otherwise.
+    @type off_shift: bool
+        True if the driver leaves once they are next idle.
     """
 
     def __init__(self, identifier, location, speed):
@@ -39,6 +42,7 @@ class Driver:
         self.speed = int(speed)
         self.destination = None
         self.is_idle = True
+        self.off_shift = False
 
     def __str__(self):
         """Return a string representation.
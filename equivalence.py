@@ -0,0 +1,406 @@
+"""
+The equivalence module checks that two configurations of the simulation,
+such as two event queues or two dispatchers, do exactly the same thing.
+
+Both configurations run the same scenario through Simulation.run, so
+that the engine does its events exactly as in any other run, and an
+observer records each event done, the match it made, the notifications it
+gave the monitor and the report after it. The two traces are then compared
+event by event, and the first difference found is returned as a
+Divergence, with the events that led up to it.
+
+The reference configuration does the events with the loop Simulation.run
+had at first: every event, including those for the current time, goes
+through a sorted list, and no event is reused.
+
+A corpus of random scenarios from the workload module is checked by the
+doctests, and by "python equivalence.py", which exits with status 1 if any
+scenario diverges.
+"""
+
+import sys
+from itertools import zip_longest
+from random import Random
+
+from container import ListEventQueue
+from dispatcher import Dispatcher
+from event import Pickup
+from lookahead import LookaheadDispatcher
+from monitor import Monitor
+from recorder import TraceEvent, Tap
+from regions import RegionDispatcher
+from simulation import Simulation
+from workload import generate
+
+
+class Configuration:
+    """A way of setting up a Simulation.
+
+    === Attributes ===
+    @type name: str
+    """
+
+    # === Private Attributes ===
+    # @type _reference: bool
+    #     Whether to do the events with the reference loop instead of a
+    #     Simulation.
+    # @type _queue: callable | None
+    #     Returns a new, empty event queue, or None for the default.
+    # @type _dispatcher: callable | None
+    #     Returns a new dispatcher, or None for the default.
+    # @type _monitor: callable | None
+    #     Returns a new monitor, or None for the default.
+
+    def __init__(self, name, queue=None, dispatcher=None, monitor=None,
+                 reference=False):
+        """Initialize a Configuration.
+
+        @type self: Configuration
+        @type name: str
+        @type queue: callable | None
+            Ignored by the reference loop, which has its own sorted list.
+        @type dispatcher: callable | None
+        @type monitor: callable | None
+        @type reference: bool
+        @rtype: None
+        """
+
+        self.name = name
+        self._reference = reference
+        self._queue = queue
+        self._dispatcher = dispatcher
+        self._monitor = monitor
+
+    def build(self, observer):
+        """Return a new Simulation in this configuration, observed by
+        <observer>.
+
+        @type self: Configuration
+        @type observer: object
+        @rtype: Simulation
+        """
+
+        return Simulation(
+            observer=observer,
+            queue=None if self._queue is None else self._queue(),
+            dispatcher=None if self._dispatcher is None
+            else self._dispatcher(),
+            monitor=None if self._monitor is None else self._monitor())
+
+    def trace(self, load):
+        """Run the scenario <load> in this configuration, and return its
+        trace: each event done with the report after it.
+
+        @type self: Configuration
+        @type load: callable
+        @rtype: list[(TraceEvent, dict[str, object])]
+        """
+
+        observer = _Steps()
+        if not self._reference:
+            self.build(observer).run(load())
+            return observer.steps
+
+        events = ListEventQueue()
+        for event in load():
+            events.add(event)
+        dispatcher = Dispatcher() if self._dispatcher is None \
+            else self._dispatcher()
+        monitor = observer.tap(Monitor() if self._monitor is None
+                               else self._monitor())
+        while not events.is_empty():
+            event_to_do = events.remove()
+            observer.begin(event_to_do)
+            returned_events = event_to_do.do(dispatcher, monitor)
+            observer.end(returned_events)
+            for event in returned_events or ():
+                events.add(event)
+        return observer.steps
+
+
+class Divergence:
+    """The first point at which two runs of a scenario differ.
+
+    === Attributes ===
+    @type index: int
+        The number of events both runs did alike before they differed.
+    @type reason: str
+        "event" if the events done differ, or "report" if the events are
+        the same but the reports differ.
+    @type names: (str, str)
+        The names of the two configurations.
+    @type events: (TraceEvent | None, TraceEvent | None)
+        The event each run did, or None if it had none left.
+    @type reports: (dict[str, object], dict[str, object])
+        The report of each run after the event.
+    @type context: list[TraceEvent]
+        The events both runs did alike just before they differed.
+    """
+
+    def __init__(self, index, reason, names, events, reports, context):
+        """Initialize a Divergence.
+
+        @type self: Divergence
+        @type index: int
+        @type reason: str
+        @type names: (str, str)
+        @type events: (TraceEvent | None, TraceEvent | None)
+        @type reports: (dict[str, object], dict[str, object])
+        @type context: list[TraceEvent]
+        @rtype: None
+        """
+
+        self.index = index
+        self.reason = reason
+        self.names = names
+        self.events = events
+        self.reports = reports
+        self.context = context
+
+    def __str__(self):
+        """Return a string representation, with the events leading up to
+        the divergence and each run's event, notifications and report.
+
+        @type self: Divergence
+        @rtype: str
+        """
+
+        lines = ["{} diverges from {} at event {} ({}):".format(
+            self.names[1], self.names[0], self.index, self.reason)]
+        for event in self.context:
+            lines.append("    {}".format(event))
+        for name, event, report in zip(self.names, self.events,
+                                       self.reports):
+            lines.append("{}:".format(name))
+            lines.append("  > {}".format(
+                "no more events" if event is None else event))
+            for category, description, identifier, location in \
+                    (() if event is None else event.notes):
+                lines.append("      {} {} {} at {}".format(
+                    category, identifier, description, location))
+            lines.append("    report {}".format(report))
+        return "\n".join(lines)
+
+
+class _Steps:
+    """A Simulation observer that keeps every event done, as a TraceEvent,
+    with the monitor's report after it.
+
+    === Attributes ===
+    @type steps: list[(TraceEvent, dict[str, object])]
+        The events done, in order, with the report after each.
+    """
+
+    # === Private Attributes ===
+    # @type _monitor: Monitor | None
+    #     The monitor the events notify.
+    # @type _event: (str, int, str | None, str | None)
+    #     The class name, timestamp, rider and driver of the event being
+    #     done.
+    # @type _notes: list[tuple]
+    #     The notifications given by the event being done.
+
+    def __init__(self):
+        """Initialize a _Steps with no events.
+
+        @type self: _Steps
+        @rtype: None
+        """
+
+        self.steps = []
+        self._monitor = None
+        self._event = None
+        self._notes = []
+
+    def tap(self, monitor):
+        """Return a monitor that records the notifications it gets, and
+        passes them on to <monitor>.
+
+        @type self: _Steps
+        @type monitor: Monitor
+        @rtype: Tap
+        """
+
+        self._monitor = monitor
+        return Tap(self._notes, monitor)
+
+    def begin(self, event):
+        """Note that <event> is about to be done.
+
+        @type self: _Steps
+        @type event: Event
+        @rtype: None
+        """
+
+        rider = getattr(event, "rider", None)
+        driver = getattr(event, "driver", None)
+        self._event = (type(event).__name__, event.timestamp,
+                       None if rider is None else rider.id,
+                       None if driver is None else driver.id)
+
+    def end(self, spawned):
+        """Keep the event that was just done, which returned <spawned>.
+
+        @type self: _Steps
+        @type spawned: list[Event] | None
+        @rtype: None
+        """
+
+        kind, timestamp, rider, driver = self._event
+        decision = None
+        for new_event in spawned or ():
+            if type(new_event) is Pickup:
+                decision = new_event.driver.id if driver is None \
+                    else new_event.rider.id
+        event = TraceEvent(kind, timestamp, rider, driver, decision)
+        event.notes = list(self._notes)
+        self._notes.clear()
+        self.steps.append((event, self._monitor.report()))
+
+
+def _key(event):
+    """Return what must be the same for <event> to match in both runs.
+
+    @type event: TraceEvent | None
+    @rtype: tuple | None
+    """
+
+    if event is None:
+        return None
+    return (event.kind, event.timestamp, event.rider, event.driver,
+            event.decision,
+            [(category, description, identifier, location.row,
+              location.column)
+             for category, description, identifier, location in event.notes])
+
+
+def compare(first, second, load, context=5):
+    """Run the scenario <load> in configurations <first> and <second>, and
+    return the first Divergence between them, or None if they do exactly
+    the same thing.
+
+    @type first: Configuration
+    @type second: Configuration
+    @type load: callable
+        A function that returns a fresh list of the scenario's initial
+        events each time it is called.
+    @type context: int
+        The number of matching events to keep before a divergence.
+    @rtype: Divergence | None
+
+    >>> print(compare(Configuration("reference", reference=True),
+    ...               Configuration("heap"),
+    ...               lambda: generate(40, 5, seed=3)))
+    None
+    >>> divergence = compare(
+    ...     Configuration("city-wide"),
+    ...     Configuration("regional",
+    ...                   dispatcher=lambda: RegionDispatcher([10])),
+    ...     lambda: generate(40, 5, seed=3))
+    >>> divergence.index, divergence.reason
+    (2, 'event')
+    >>> [event.decision for event in divergence.events]
+    ['R14', 'R12']
+    """
+
+    traces = (first.trace(load), second.trace(load))
+    for index, steps in enumerate(zip_longest(*traces)):
+        events = tuple(None if step is None else step[0] for step in steps)
+        reports = tuple(
+            trace[min(index, len(trace) - 1)][1] if trace else {}
+            for trace in traces)
+        if _key(events[0]) != _key(events[1]):
+            reason = "event"
+        elif reports[0] != reports[1]:
+            reason = "report"
+        else:
+            continue
+        return Divergence(index, reason, (first.name, second.name), events,
+                          reports, [event for event, _ in
+                                    traces[0][max(0, index - context):index]])
+    return None
+
+
+def corpus(count, seed=0):
+    """Return <count> loaders of random scenarios of varied size, grid and
+    pace, determined by <seed>.
+
+    @type count: int
+    @type seed: int
+    @rtype: list[callable]
+    """
+
+    random = Random(seed)
+    loaders = []
+    for _ in range(count):
+        riders = random.randint(1, 60)
+        drivers = random.randint(1, 12)
+        size = random.randint(2, 25)
+        duration = random.randint(1, 3 * riders)
+        scenario_seed = random.randrange(1 << 30)
+        loaders.append(lambda riders=riders, drivers=drivers, size=size,
+                       scenario_seed=scenario_seed, duration=duration:
+                       generate(riders, drivers, size, scenario_seed,
+                                duration))
+    return loaders
+
+
+def check_corpus(first, second, loaders):
+    """Return the Divergence of each scenario in <loaders> where <first>
+    and <second> differ, as (scenario index, Divergence) pairs.
+
+    @type first: Configuration
+    @type second: Configuration
+    @type loaders: list[callable]
+    @rtype: list[(int, Divergence)]
+
+    >>> check_corpus(Configuration("reference", reference=True),
+    ...              Configuration("heap"), corpus(25))
+    []
+    """
+
+    divergences = []
+    for position, load in enumerate(loaders):
+        divergence = compare(first, second, load)
+        if divergence is not None:
+            divergences.append((position, divergence))
+    return divergences
+
+
+# The configurations checked against the reference by "python
+# equivalence.py".
+PAIRS = [
+    (Configuration("reference engine", reference=True),
+     Configuration("heap queue")),
+    (Configuration("reference engine", reference=True),
+     Configuration("list queue", queue=ListEventQueue)),
+    (Configuration("city-wide dispatch"),
+     Configuration("one-region dispatch",
+                   dispatcher=lambda: RegionDispatcher([]))),
+    (Configuration("linear dispatch"),
+     Configuration("indexed dispatch",
+                   dispatcher=lambda: LookaheadDispatcher(lookahead=False))),
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Check alternative engines against the reference.")
+    parser.add_argument("--scenarios", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    failed = False
+    loaders = corpus(arguments.scenarios, arguments.seed)
+    for reference, alternative in PAIRS:
+        divergences = check_corpus(reference, alternative, loaders)
+        print("{} vs {}: {} of {} scenarios diverge".format(
+            reference.name, alternative.name, len(divergences),
+            len(loaders)))
+        if divergences:
+            failed = True
+            position, divergence = divergences[0]
+            print("scenario {}: {}".format(position, divergence))
+    sys.exit(1 if failed else 0)
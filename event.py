@@ -24,6 +24,10 @@ class Event:
         A timestamp for this event.
     """
 
+    # Events are created and discarded by the million in a long run, so
+    # none of them carry a __dict__.
+    __slots__ = ("timestamp",)
+
     def __init__(self, timestamp):
         """Initialize an Event with a given timestamp.
 
@@ -190,6 +194,8 @@ class RiderRequest(Event):
         The rider.
     """
 
+    __slots__ = ("rider",)
+
     def __init__(self, timestamp, rider):
         """Initialize a RiderRequest event.
 
@@ -219,7 +225,7 @@ class RiderRequest(Event):
                        self.rider.id, self.rider.origin)
 
         events = []
-        driver = dispatcher.request_driver(self.rider)
+        driver = dispatcher.request_driver(self.rider, self.timestamp)
         if driver is not None:
             travel_time = driver.start_drive(self.rider.origin)
             events.append(Pickup(self.timestamp + travel_time, self.rider, driver))
@@ -244,6 +250,13 @@ class DriverRequest(Event):
         The driver.
     """
 
+    # === Private Attributes ===
+    # @type _pool: list[DriverRequest] | None
+    #     The pool this event came from through DriverRequest.reissue, and
+    #     goes back to once it has been done, or None.
+
+    __slots__ = ("driver", "_pool")
+
     def __init__(self, timestamp, driver):
         """Initialize a DriverRequest event.
 
@@ -254,12 +267,58 @@ class DriverRequest(Event):
 
         super().__init__(timestamp)
         self.driver = driver
+        self._pool = None
+
+    @classmethod
+    def reissue(cls, timestamp, driver):
+        """Return a DriverRequest for a driver that is asking for another
+        rider, reusing a spent event from the pool in use when there is
+        one (see use_driver_request_pool).
+
+        A reissued event is returned to the pool it came from at the end of
+        its do(), so it must not be used after it has been done. With no
+        pool in use, a new event is returned, and is not recycled.
+
+        @type timestamp: int
+        @type driver: Driver
+        @rtype: DriverRequest
+
+        >>> from location import Location
+        >>> previous = use_driver_request_pool([])
+        >>> first = DriverRequest.reissue(3, Driver('Ann', Location(1, 2), 1))
+        >>> first.timestamp, first.driver.id
+        (3, 'Ann')
+        >>> _ = first.do(Dispatcher(), Monitor())
+        >>> second = DriverRequest.reissue(5, Driver('Bo', Location(2, 2), 1))
+        >>> second is first
+        True
+        >>> second.timestamp, second.driver.id
+        (5, 'Bo')
+        >>> _ = use_driver_request_pool(previous)
+        >>> DriverRequest.reissue(6, Driver('Cy', Location(0, 0), 1)) is first
+        False
+        """
+
+        pool = _driver_request_pool
+        if pool is None:
+            return cls(timestamp, driver)
+        if pool:
+            event = pool.pop()
+            event.timestamp = timestamp
+            event.driver = driver
+            return event
+
+        event = cls(timestamp, driver)
+        event._pool = pool
+        return event
 
     def do(self, dispatcher, monitor):
         """Register the driver, if this is the first request, and
         assign a rider to the driver, if one is available.
 
-        If a rider is available, return a Pickup event.
+        If a rider is available, return a Pickup event. A driver who is off
+        shift leaves the simulation instead; if the dispatcher sends another
+        driver to a rider it had reserved for them, return that Pickup.
 
         @type self: DriverRequest
         @type dispatcher: Dispatcher
@@ -273,15 +332,25 @@ class DriverRequest(Event):
         # rider, and the method returns a Pickup event for when the driver
         # arrives at the riders location.
 
-        monitor.notify(self.timestamp, DRIVER, REQUEST,
-                       self.driver.id, self.driver.location)
-
         events = []
-        rider = dispatcher.request_rider(self.driver)
+        driver = self.driver
+        if driver.off_shift:
+            # A rider reserved for the driver may be sent another driver.
+            match = dispatcher.remove_driver(driver, self.timestamp)
+            monitor.retire(driver.id)
+            rider, driver = match or (None, None)
+        else:
+            monitor.notify(self.timestamp, DRIVER, REQUEST,
+                           driver.id, driver.location)
+            rider = dispatcher.request_rider(driver)
 
         if rider is not None:
-            travel_time = self.driver.start_drive(rider.origin)
-            events.append(Pickup(self.timestamp + travel_time, rider, self.driver))
+            travel_time = driver.start_drive(rider.origin)
+            events.append(Pickup(self.timestamp + travel_time, rider, driver))
+
+        if self._pool is not None:
+            self.driver = None
+            self._pool.append(self)
 
         return events
 
@@ -303,6 +372,8 @@ class Cancellation(Event):
         The rider.
     """
 
+    __slots__ = ("rider",)
+
     def __init__(self, timestamp, rider):
         """Initialize a Cancellation event.
 
@@ -350,6 +421,8 @@ class Pickup(Event):
         The driver.
     """
 
+    __slots__ = ("rider", "driver")
+
     def __init__(self, timestamp, rider, driver):
         """Initialize a Pickup event.
 
@@ -387,12 +460,14 @@ class Pickup(Event):
             monitor.notify(self.timestamp, DRIVER, PICKUP, self.driver.id, self.rider.origin)
             monitor.notify(self.timestamp, RIDER, PICKUP, self.rider.id, self.rider.origin)
             travel_time = self.driver.start_ride(self.rider)
+            dispatcher.driver_busy(self.driver, self.timestamp + travel_time)
             events.append(Dropoff((self.timestamp + travel_time), self.driver, self.rider))
 
         else:
             self.driver.is_idle = True
             self.driver.destination = None
-            events.append(DriverRequest(self.timestamp,self.driver))
+            dispatcher.driver_free(self.driver)
+            events.append(DriverRequest.reissue(self.timestamp, self.driver))
 
         return events
 
@@ -417,6 +492,8 @@ class Dropoff(Event):
         The driver.
     """
 
+    __slots__ = ("driver", "rider")
+
     def __init__(self, timestamp, driver, rider):
         """Initialize a Dropoff event.
 
@@ -447,7 +524,8 @@ class Dropoff(Event):
         events = []
         self.driver.end_ride()
         self.driver.destination = None
-        events.append(DriverRequest(self.timestamp, self.driver))
+        dispatcher.driver_free(self.driver)
+        events.append(DriverRequest.reissue(self.timestamp, self.driver))
 
         return events
 
@@ -460,18 +538,107 @@ class Dropoff(Event):
 
         return "{0} -- {1}: Dropoff {2}".format(self.timestamp, self.driver.id, self.rider.id)
 
-def create_event_list(filename):
+class EndShift(Event):
+    """A driver ends their shift.
+
+    An idle driver leaves the simulation at once. A busy driver finishes
+    their current ride and then leaves, instead of requesting another
+    rider.
+
+    === Attributes ===
+    @type driver: Driver
+        The driver.
+    """
+
+    __slots__ = ("driver",)
+
+    def __init__(self, timestamp, driver):
+        """Initialize an EndShift event.
+
+        @type self: EndShift
+        @type driver: Driver
+        @rtype: None
+        """
+
+        super().__init__(timestamp)
+        self.driver = driver
+
+    def do(self, dispatcher, monitor):
+        """Take the driver off shift, and retire them if they are idle.
+
+        @type self: EndShift
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @rtype: list[Event]
+
+        >>> from location import Location
+        >>> dispatcher = Dispatcher()
+        >>> driver = Driver('Ann', Location(1, 2), 1)
+        >>> _ = DriverRequest(0, driver).do(dispatcher, Monitor())
+        >>> EndShift(5, driver).do(dispatcher, Monitor())
+        []
+        >>> dispatcher.idle_drivers()
+        []
+        """
+
+        self.driver.off_shift = True
+        if self.driver.is_idle:
+            dispatcher.remove_driver(self.driver)
+            monitor.retire(self.driver.id)
+        return []
+
+    def __str__(self):
+        """Return a string representation of this event.
+
+        @type self: EndShift
+        @rtype: str
+        """
+
+        return "{} -- {}: End shift".format(self.timestamp, self.driver)
+
+
+# The pool of spent DriverRequest events that DriverRequest.reissue uses,
+# or None. Every Dropoff, and every Pickup of a rider who has cancelled,
+# asks for another rider at the same timestamp; recycling those events
+# keeps a long run from allocating one per ride.
+_driver_request_pool = None
+
+
+def use_driver_request_pool(pool):
+    """Make <pool> the pool of spent DriverRequest events that
+    DriverRequest.reissue takes from, and return the pool it replaces.
+
+    Each Simulation owns a pool and uses it only while it is doing events,
+    so simulations in the same process never share event objects. Pass
+    None to stop recycling.
+
+    @type pool: list[DriverRequest] | None
+    @rtype: list[DriverRequest] | None
+    """
+
+    global _driver_request_pool
+    previous = _driver_request_pool
+    _driver_request_pool = pool
+    return previous
+
+
+def create_event_list(filename, registry=None):
     """Return a list of Events based on raw list of events in <filename>.
 
+    If <registry> is given, riders and drivers are identified by their
+    integer handles in it instead of by their names.
+
     Precondition: the file stored at <filename> is in the format specified
     by the assignment handout.
 
     @param filename: str
         The name of a file that contains the list of events.
+    @type registry: Registry | None
     @rtype: list[Event]
     """
 
     events = []
+    drivers = {}
     with open(filename, "r") as file:
         for line in file:
             line = line.strip()
@@ -488,14 +655,23 @@ def create_event_list(filename):
 
             if event_type == "DriverRequest":
                 #Create DriverRequest event.
-                driverObject = Driver(tokens[2], deserialize_location(tokens[3]), int(tokens[4]))
+                identifier = tokens[2] if registry is None \
+                    else registry.handle(DRIVER, tokens[2])
+                driverObject = Driver(identifier, deserialize_location(tokens[3]), int(tokens[4]))
                 event = DriverRequest(timestamp, driverObject)
+                drivers[tokens[2]] = driverObject
 
             elif event_type == "RiderRequest":
                 # Create a RiderRequest event.
-                riderObject = Rider(tokens[2], deserialize_location(tokens[3]),
+                identifier = tokens[2] if registry is None \
+                    else registry.handle(RIDER, tokens[2])
+                riderObject = Rider(identifier, deserialize_location(tokens[3]),
                                     deserialize_location(tokens[4]), int(tokens[5]))
                 event = RiderRequest(timestamp, riderObject)
 
+            elif event_type == "EndShift":
+                # End the shift of a driver requested earlier in the file.
+                event = EndShift(timestamp, drivers[tokens[2]])
+
             events.append(event)
     return events
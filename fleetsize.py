@@ -0,0 +1,291 @@
+"""
+The fleetsize module finds the smallest fleet that meets a target on the
+report of a scenario.
+
+A fleet of k drivers is the first k drivers of the scenario to come
+online, as in Scenario.events. Fleets of different sizes are therefore
+identical until the first driver that one has and another has not comes
+online, and a batch of fleet sizes only needs the common prefix up to that
+driver's request simulated once: the batch is run by forking a simulation
+of the smallest fleet at that point, and each child adds the drivers of
+its own fleet (see Simulation.fork).
+
+The search assumes that a larger fleet does no worse. Each round evaluates
+a batch of fleet sizes spread over the range still in doubt, in parallel,
+and narrows the range to between the largest size that fails the target
+and the smallest that meets it. With several speeds, each is searched in
+turn.
+"""
+
+import os
+from math import ceil
+
+from event import Event, DriverRequest, create_event_list
+from scenario import Scenario, DRIVER_REQUEST
+from simulation import Simulation
+
+
+class _Slot(Event):
+    """The place in the event queue of a driver who is in some of the
+    fleets being evaluated, and comes online only once opened.
+
+    === Attributes ===
+    @type request: DriverRequest
+    @type is_open: bool
+    """
+
+    __slots__ = ("request", "is_open")
+
+    def __init__(self, request):
+        """Initialize a closed _Slot for <request>.
+
+        @type self: _Slot
+        @type request: DriverRequest
+        @rtype: None
+        """
+
+        super().__init__(request.timestamp)
+        self.request = request
+        self.is_open = False
+
+    def do(self, dispatcher, monitor):
+        """Do the driver's request if the slot is open.
+
+        @type self: _Slot
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @rtype: list[Event] | None
+        """
+
+        if self.is_open:
+            return self.request.do(dispatcher, monitor)
+        return None
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: _Slot
+        @rtype: str
+        """
+
+        return "{} ({})".format(self.request,
+                                "open" if self.is_open else "closed")
+
+
+class _Open(Event):
+    """Open a fleet's slots, before any event still queued.
+
+    === Attributes ===
+    @type slots: list[_Slot]
+    """
+
+    __slots__ = ("slots",)
+
+    def __init__(self, timestamp, slots):
+        """Initialize an _Open of <slots>.
+
+        @type self: _Open
+        @type timestamp: int
+        @type slots: list[_Slot]
+        @rtype: None
+        """
+
+        super().__init__(timestamp)
+        self.slots = slots
+
+    def do(self, dispatcher, monitor):
+        """Open the slots.
+
+        @type self: _Open
+        @type dispatcher: Dispatcher
+        @type monitor: Monitor
+        @rtype: None
+        """
+
+        for slot in self.slots:
+            slot.is_open = True
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: _Open
+        @rtype: str
+        """
+
+        return "{} -- Open {} drivers".format(self.timestamp, len(self.slots))
+
+
+def evaluate(scenario, fleet_sizes, speed=None, processes=None):
+    """Return the report of <scenario> with each of <fleet_sizes>, in order.
+
+    The drivers in some fleets but not others are queued as closed slots,
+    so that each child of the fork does its events in exactly the order a
+    run of its own fleet would.
+
+    @type scenario: Scenario
+    @type fleet_sizes: list[int]
+    @type speed: int | None
+        If given, every driver has this speed.
+    @type processes: int | None
+        The most runs at once, or None for one per core.
+    @rtype: list[dict[str, object]]
+
+    >>> from workload import generate
+    >>> scenario = Scenario.from_events(generate(60, 12, seed=4))
+    >>> evaluate(scenario, [9, 3, 6]) == [
+    ...     Simulation().run(scenario.events(size)) for size in (9, 3, 6)]
+    True
+    """
+
+    smallest = min(fleet_sizes)
+    driver_times = [record[1] for record in scenario.records
+                    if record[0] == DRIVER_REQUEST]
+    # Every fleet has the same events until the next driver comes online.
+    at = driver_times[smallest] if smallest < len(driver_times) else None
+    if not at or not hasattr(os, "fork"):
+        # There is no prefix to share, or no way to share it.
+        return Simulation().fork(
+            [scenario.events(size, speed) for size in fleet_sizes],
+            processes=processes)
+
+    events = []
+    slots = []
+    for event in scenario.events(max(fleet_sizes), speed):
+        if isinstance(event, DriverRequest):
+            if len(slots) < smallest:
+                slots.append(None)
+            else:
+                event = _Slot(event)
+                slots.append(event)
+        events.append(event)
+    branches = [[_Open(at - 1, slots[smallest:size])] for size in fleet_sizes]
+    return Simulation().fork(branches, at, events, processes)
+
+
+def meets(report, target):
+    """Return whether <report> is at or below each maximum in <target>.
+
+    @type report: dict[str, object]
+    @type target: dict[str, float]
+        The largest acceptable value of some of the report's metrics.
+    @rtype: bool
+
+    >>> meets({'rider_wait_time': 2.0, 'driver_total_distance': 9.0},
+    ...       {'rider_wait_time': 3})
+    True
+    """
+
+    return all(report[metric] <= value for metric, value in target.items())
+
+
+def _candidates(low, high, width, evaluated):
+    """Return up to <width> fleet sizes spread over (<low>, <high>] that
+    have not been evaluated.
+
+    @type low: int
+    @type high: int
+    @type width: int
+    @type evaluated: dict[int, dict[str, object]]
+    @rtype: list[int]
+
+    >>> _candidates(0, 20, 4, {})
+    [5, 10, 15, 20]
+    >>> _candidates(10, 20, 4, {20: {}})
+    [12, 14, 16, 18]
+    """
+
+    steps = width + (high in evaluated)
+    return sorted({low + ceil((high - low) * step / steps)
+                   for step in range(1, steps + 1)} - set(evaluated))
+
+
+def solve(events, target, speeds=(None,), width=None, processes=None):
+    """Search for the smallest fleet of the scenario of <events> that meets
+    <target>, at each of <speeds>.
+
+    Return the smallest configuration found, or None if even the whole
+    fleet fails, with every configuration evaluated. Configurations are
+    result rows as in the sweep module: the fleet size and speed followed
+    by the report, with whether it meets the target.
+
+    @type events: list[Event] | Scenario
+    @type target: dict[str, float]
+    @type speeds: list[int | None]
+        The speeds to try; None keeps each driver's own speed.
+    @type width: int | None
+        The fleet sizes evaluated in each round, or None for <processes>.
+    @type processes: int | None
+        The most runs at once, or None for one per core.
+    @rtype: (dict[str, object] | None, list[dict[str, object]])
+
+    >>> from workload import generate
+    >>> scenario = Scenario.from_events(generate(60, 12, seed=4))
+    >>> best, frontier = solve(scenario, {'rider_wait_time': 8},
+    ...                        width=3, processes=3)
+    >>> best["fleet_size"], best["rider_wait_time"] <= 8
+    (6, True)
+    >>> [(row["fleet_size"], row["meets_target"]) for row in frontier]
+    [(4, False), (5, False), (6, True), (7, True), (8, True), (12, True)]
+    """
+
+    scenario = events if isinstance(events, Scenario) \
+        else Scenario.from_events(events)
+    width = width or processes or 4
+    fleet = scenario.driver_count()
+
+    best = None
+    frontier = []
+    for speed in speeds:
+        evaluated = {}
+        # Every size up to low fails, and high is the smallest known to
+        # meet the target, if it has been evaluated.
+        low, high = 0, fleet
+        while high - low > 1 or high not in evaluated:
+            sizes = _candidates(low, high, width, evaluated)
+            for size, report in zip(sizes, evaluate(scenario, sizes, speed,
+                                                    processes)):
+                evaluated[size] = report
+            passing = [size for size in evaluated
+                       if meets(evaluated[size], target)]
+            if not passing:
+                break
+            high = min(passing)
+            low = max([size for size in evaluated if size < high],
+                      default=0)
+
+        for size in sorted(evaluated):
+            row = {"fleet_size": size, "speed": speed}
+            row.update(evaluated[size])
+            row["meets_target"] = meets(evaluated[size], target)
+            frontier.append(row)
+            if row["meets_target"] and (best is None
+                                        or size < best["fleet_size"]):
+                best = row
+    return best, frontier
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from sweep import format_row
+
+    parser = argparse.ArgumentParser(
+        description="Find the smallest fleet that meets a report target.")
+    parser.add_argument("filename", nargs="?", default="events.txt")
+    parser.add_argument("--target", nargs="+", default=["rider_wait_time=5"],
+                        metavar="METRIC=MAXIMUM")
+    parser.add_argument("--speed", type=int, nargs="+", default=[None])
+    parser.add_argument("--width", type=int, default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    arguments = parser.parse_args()
+
+    goal = {}
+    for item in arguments.target:
+        metric, maximum = item.split("=")
+        goal[metric] = float(maximum)
+    best_row, rows = solve(create_event_list(arguments.filename), goal,
+                           arguments.speed, arguments.width,
+                           arguments.processes)
+    for result in rows:
+        print(format_row(result))
+    print("smallest:", "none" if best_row is None else format_row(best_row))
@@ -0,0 +1,538 @@
+"""
+The lookahead module contains LookaheadDispatcher, a dispatcher that may
+give a rider to a driver who is still on a ride, when that driver will
+finish nearby and reach the rider sooner than any idle driver could.
+
+Idle drivers are indexed by the grid cell of their location, and drivers
+on a ride by the cell of their destination, along with the time the ride
+ends. A request searches the cells in rings outward from the rider, and
+stops once no driver further out could arrive sooner than the best found,
+so it looks at the drivers near the rider rather than at the whole fleet.
+
+A driver on a ride can hold one reservation. The reserved rider is given
+to them when they ask for a rider at the end of their ride, before any
+rider on the waiting list. If the driver leaves instead, the rider is
+dispatched again at once, as if they had just asked, but with the
+patience they have left.
+
+With lookahead off, LookaheadDispatcher makes the same matches as
+Dispatcher, ties included; "python equivalence.py" checks this.
+"""
+
+from heapq import heappush, heappop
+
+from dispatcher import Dispatcher
+from location import manhattan_distance
+
+# The average number of idle drivers per occupied cell above which the
+# cells are halved.
+CROWDED = 4
+
+
+class LookaheadDispatcher(Dispatcher):
+    """A dispatcher that indexes drivers by location, and looks ahead to
+    drivers finishing a ride.
+
+    Its reservations are not written to snapshots.
+
+    === Attributes ===
+    @type lookahead: bool
+        Whether riders may be matched with drivers still on a ride.
+    """
+
+    # === Private Attributes ===
+    # @type _cell_size: int
+    #     The side of a grid cell, halved as the idle drivers get crowded.
+    # @type _order: dict[str | int, int]
+    #     The position of each driver in order of registration, to break
+    #     ties as Dispatcher does.
+    # @type _idle: dict[(int, int), dict[str | int, Driver]]
+    #     The idle drivers in each cell.
+    # @type _idle_cells: dict[str | int, (int, int)]
+    #     The cell of each idle driver.
+    # @type _busy: dict[(int, int), dict[str | int, (int, Driver)]]
+    #     The time each driver on a ride and without a reservation will be
+    #     free, by the cell of their destination.
+    # @type _busy_cells: dict[str | int, (int, int)]
+    #     The cell of each driver in _busy.
+    # @type _free_times: list[(int, int, str | int)]
+    #     A heap of (free time, order, driver id) entries for the drivers in
+    #     _busy; entries for drivers no longer in _busy are skipped lazily.
+    # @type _reservations: dict[str | int, (Rider, int, int)]
+    #     The rider reserved for each driver, the time the driver's ride
+    #     ends, and the time the rider runs out of patience.
+    # @type _reserved_by: dict[int, Driver]
+    #     The driver of each reserved rider, by object id.
+    # @type _bounds: [int, int, int, int] | None
+    #     The lowest and highest row and column of any cell used so far.
+    # @type _fastest: int
+    #     The highest speed of any registered driver.
+
+    def __init__(self, lookahead=True, cell_size=4):
+        """Initialize a LookaheadDispatcher.
+
+        @type self: LookaheadDispatcher
+        @type lookahead: bool
+        @type cell_size: int
+            The side of a grid cell to start with.
+        @rtype: None
+        """
+
+        super().__init__()
+        self.lookahead = lookahead
+        self._cell_size = cell_size
+        self._order = {}
+        self._idle = {}
+        self._idle_cells = {}
+        self._busy = {}
+        self._busy_cells = {}
+        self._free_times = []
+        self._reservations = {}
+        self._reserved_by = {}
+        self._bounds = None
+        self._fastest = 0
+
+    def request_driver(self, rider, timestamp=None):
+        """Return an idle driver for the rider, or None if no idle driver
+        should take the ride.
+
+        The idle driver who can reach the rider fastest is chosen. If a
+        driver on a ride would reach the rider sooner, and before the rider
+        runs out of patience, the rider is reserved for them instead, and
+        None is returned; otherwise, if there is no idle driver, the rider
+        goes on the waiting list.
+
+        @type self: LookaheadDispatcher
+        @type rider: Rider
+        @type timestamp: int | None
+            The time of the request; without it, there is no lookahead.
+        @rtype: Driver | None
+
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> from rider import Rider
+        >>> dispatcher = LookaheadDispatcher()
+        >>> near, far = Driver('Ann', Location(1, 1), 1), \\
+        ...     Driver('Bo', Location(15, 15), 1)
+        >>> dispatcher.request_rider(near), dispatcher.request_rider(far)
+        (None, None)
+        >>> print(dispatcher.request_driver(
+        ...     Rider('Cy', Location(0, 0), Location(1, 0), 5), 0).id)
+        Ann
+        >>> _ = near.start_drive(Location(8, 9))
+        >>> dispatcher.driver_busy(near, 3)
+        >>> print(dispatcher.request_driver(
+        ...     Rider('Di', Location(8, 8), Location(0, 0), 5), 2))
+        None
+        >>> print(dispatcher.request_rider(near).id)
+        Di
+        """
+
+        return self._dispatch(rider, timestamp, None if timestamp is None
+                              else timestamp + rider.patience)
+
+    def request_rider(self, driver):
+        """Return the rider reserved for the driver, or else the longest
+        waiting rider, or None if there is none.
+
+        If this is a new driver, register the driver for future rider
+        requests. A driver left without a rider is idle.
+
+        @type self: LookaheadDispatcher
+        @type driver: Driver
+        @rtype: Rider | None
+        """
+
+        if driver.id not in self._registered:
+            self._order[driver.id] = len(self._order)
+            if driver.speed > self._fastest:
+                self._fastest = driver.speed
+        self._remove_busy(driver)
+        reservation = self._reservations.pop(driver.id, None)
+        if reservation is not None:
+            del self._reserved_by[id(reservation[0])]
+            self._remove_idle(driver)
+            return reservation[0]
+        rider = super().request_rider(driver)
+        if rider is None:
+            self._add_idle(driver)
+        else:
+            self._remove_idle(driver)
+        return rider
+
+    def driver_busy(self, driver, free_at):
+        """Index <driver>, who has started a ride that ends at simulated
+        time <free_at>, by their destination.
+
+        @type self: LookaheadDispatcher
+        @type driver: Driver
+        @type free_at: int
+        @rtype: None
+        """
+
+        if driver.id not in self._registered or driver.off_shift:
+            return
+        self._remove_idle(driver)
+        cell = self._cell(driver.destination)
+        self._busy.setdefault(cell, {})[driver.id] = (free_at, driver)
+        self._busy_cells[driver.id] = cell
+        heappush(self._free_times, (free_at, self._order[driver.id],
+                                    driver.id))
+
+    def driver_free(self, driver):
+        """Index <driver>, who has become idle, unless a rider is reserved
+        for them.
+
+        @type self: LookaheadDispatcher
+        @type driver: Driver
+        @rtype: None
+        """
+
+        self._remove_busy(driver)
+        if driver.id in self._registered \
+                and driver.id not in self._reservations:
+            self._add_idle(driver)
+
+    def remove_driver(self, driver, timestamp=None):
+        """Stop using <driver> to fulfill rider requests.
+
+        A rider reserved for them is dispatched again at once. Return the
+        rider and the idle driver now sent to them, or None if there is no
+        such driver, in which case the rider is reserved for another driver
+        on a ride or goes on the waiting list.
+
+        @type self: LookaheadDispatcher
+        @type driver: Driver
+        @type timestamp: int | None
+            The time the driver leaves.
+        @rtype: (Rider, Driver) | None
+
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> from rider import Rider
+        >>> dispatcher = LookaheadDispatcher()
+        >>> near, far = Driver('Ann', Location(8, 9), 1), \\
+        ...     Driver('Bo', Location(15, 15), 1)
+        >>> dispatcher.request_rider(near), dispatcher.request_rider(far)
+        (None, None)
+        >>> _ = near.start_drive(Location(8, 9))
+        >>> dispatcher.driver_busy(near, 3)
+        >>> dispatcher.request_driver(
+        ...     Rider('Di', Location(8, 8), Location(0, 0), 20), 2)
+        >>> rider, driver = dispatcher.remove_driver(near, 3)
+        >>> print(rider.id, driver.id)
+        Di Bo
+        """
+
+        super().remove_driver(driver)
+        self._remove_idle(driver)
+        self._remove_busy(driver)
+        reservation = self._reservations.pop(driver.id, None)
+        if reservation is None:
+            return None
+        rider, _, deadline = reservation
+        del self._reserved_by[id(rider)]
+        other = self._dispatch(rider, timestamp, deadline)
+        return None if other is None else (rider, other)
+
+    def idle_drivers(self):
+        """Return the registered drivers that are idle, in the order they
+        registered.
+
+        @type self: LookaheadDispatcher
+        @rtype: list[Driver]
+        """
+
+        return [driver for driver in self._available_drivers
+                if driver.id in self._idle_cells]
+
+    def waiting_count(self):
+        """Return the number of riders waiting for a driver, including
+        riders reserved for a driver still on a ride.
+
+        @type self: LookaheadDispatcher
+        @rtype: int
+        """
+
+        return len(self._waiting_riders) + len(self._reservations)
+
+    def cancel_ride(self, rider):
+        """Cancel the ride for rider, and any reservation for them.
+
+        @type self: LookaheadDispatcher
+        @type rider: Rider
+        @rtype: None
+        """
+
+        super().cancel_ride(rider)
+        driver = self._reserved_by.pop(id(rider), None)
+        if driver is not None:
+            free_at = self._reservations.pop(driver.id)[1]
+            if driver.is_idle:
+                self._add_idle(driver)
+            else:
+                self.driver_busy(driver, free_at)
+
+    def _dispatch(self, rider, timestamp, deadline):
+        """Return an idle driver for the rider, reserve the rider for a
+        driver on a ride, or put the rider on the waiting list, as
+        request_driver does for a rider who cancels at <deadline>.
+
+        @type self: LookaheadDispatcher
+        @type rider: Rider
+        @type timestamp: int | None
+        @type deadline: int | None
+        @rtype: Driver | None
+        """
+
+        idle = self._nearest(self._idle, rider.origin, 0, self._idle_time)
+        if self.lookahead and timestamp is not None:
+            # A driver on a ride must arrive before the rider cancels, and
+            # before the best idle driver would.
+            limit = deadline
+            if idle is not None:
+                limit = min(limit, timestamp + idle[0])
+            busy = self._nearest(self._busy, rider.origin,
+                                 self._earliest_free(timestamp),
+                                 self._busy_time, limit)
+            if busy is not None and busy[0] < limit:
+                self._reserve(busy[2], rider, deadline)
+                return None
+        if idle is None:
+            self._waiting_riders[id(rider)] = rider
+            return None
+        driver = idle[2]
+        self._remove_idle(driver)
+        return driver
+
+    def _reserve(self, driver, rider, deadline):
+        """Reserve <rider>, who cancels at <deadline>, for <driver>, who is
+        on a ride.
+
+        @type self: LookaheadDispatcher
+        @type driver: Driver
+        @type rider: Rider
+        @type deadline: int
+        @rtype: None
+        """
+
+        free_at = self._busy[self._busy_cells[driver.id]][driver.id][0]
+        self._remove_busy(driver)
+        self._reservations[driver.id] = (rider, free_at, deadline)
+        self._reserved_by[id(rider)] = driver
+
+    def _idle_time(self, entry, origin):
+        """Return the time the idle driver <entry> takes to reach <origin>.
+
+        @type self: LookaheadDispatcher
+        @type entry: Driver
+        @type origin: Location
+        @rtype: (int, Driver)
+        """
+
+        return entry.get_travel_time(origin), entry
+
+    def _busy_time(self, entry, origin):
+        """Return the time at which the driver on a ride <entry> would reach
+        <origin> after finishing their ride.
+
+        @type self: LookaheadDispatcher
+        @type entry: (int, Driver)
+        @type origin: Location
+        @rtype: (int, Driver)
+        """
+
+        free_at, driver = entry
+        return free_at + round(manhattan_distance(driver.destination, origin)
+                               / driver.speed), driver
+
+    def _earliest_free(self, timestamp):
+        """Return the earliest time any driver on a ride is free, but not
+        before <timestamp>.
+
+        @type self: LookaheadDispatcher
+        @type timestamp: int
+        @rtype: int
+        """
+
+        free_times = self._free_times
+        while free_times and free_times[0][2] not in self._busy_cells:
+            heappop(free_times)
+        if not free_times:
+            return timestamp
+        return max(free_times[0][0], timestamp)
+
+    def _nearest(self, index, origin, floor, cost, limit=None):
+        """Return the (cost, order, driver) of the cheapest driver in
+        <index> for <origin>, or None if there is none.
+
+        Cells are searched in rings outward from the cell of <origin>, and
+        the search stops when no driver further out could cost less, or
+        less than <limit>. Once the rings searched hold more cells than
+        <index> has occupied, the occupied cells further out are searched
+        instead, so a search never looks at more cells than twice the
+        number occupied, however sparse they are.
+
+        @type self: LookaheadDispatcher
+        @type index: dict[(int, int), dict]
+        @type origin: Location
+        @type floor: int
+            A lower bound on the cost of any driver beyond the travel time.
+        @type cost: callable
+            Returns the (cost, driver) of an entry of <index>.
+        @type limit: int | None
+            The cost below which a driver is wanted, if there is one.
+        @rtype: (int, int, Driver) | None
+        """
+
+        if not index:
+            return None
+        size = self._cell_size
+        row, column = self._cell(origin)
+        low_row, high_row, low_column, high_column = self._bounds
+        rings = max(row - low_row, high_row - row, column - low_column,
+                    high_column - column)
+        order = self._order
+        best = None
+        searched = 0
+        for ring in range(rings + 1):
+            if searched > len(index):
+                cells = [cell for cell in index
+                         if max(abs(cell[0] - row),
+                                abs(cell[1] - column)) >= ring]
+            else:
+                cells = _ring(row, column, ring)
+            for cell in cells:
+                entries = index.get(cell)
+                if entries:
+                    for entry in entries.values():
+                        time, driver = cost(entry, origin)
+                        candidate = (time, order[driver.id], driver)
+                        if best is None or candidate[:2] < best[:2]:
+                            best = candidate
+            if searched > len(index):
+                break
+            searched += 8 * ring or 1
+            # Every driver from the next ring out is at least <ring> cells
+            # away, and rounding takes at most half a unit off.
+            bound = floor + ring * size / self._fastest - 0.5
+            if best is not None and bound > best[0] \
+                    or limit is not None and bound >= limit:
+                break
+        return best
+
+    def _cell(self, location):
+        """Return the grid cell of <location>, widening the bounds of the
+        cells used to include it.
+
+        @type self: LookaheadDispatcher
+        @type location: Location
+        @rtype: (int, int)
+        """
+
+        row = location.row // self._cell_size
+        column = location.column // self._cell_size
+        bounds = self._bounds
+        if bounds is None:
+            self._bounds = [row, row, column, column]
+        else:
+            bounds[0] = min(bounds[0], row)
+            bounds[1] = max(bounds[1], row)
+            bounds[2] = min(bounds[2], column)
+            bounds[3] = max(bounds[3], column)
+        return row, column
+
+    def _add_idle(self, driver):
+        """Index the idle <driver> by their location.
+
+        @type self: LookaheadDispatcher
+        @type driver: Driver
+        @rtype: None
+        """
+
+        if driver.id in self._idle_cells:
+            return
+        cell = self._cell(driver.location)
+        self._idle.setdefault(cell, {})[driver.id] = driver
+        self._idle_cells[driver.id] = cell
+        if self._cell_size > 1 \
+                and len(self._idle_cells) > CROWDED * len(self._idle):
+            self._refine()
+
+    def _refine(self):
+        """Halve the side of the grid cells, and index every driver again.
+
+        @type self: LookaheadDispatcher
+        @rtype: None
+        """
+
+        self._cell_size //= 2
+        self._bounds = None
+        idle = [driver for drivers in self._idle.values()
+                for driver in drivers.values()]
+        busy = [entry for entries in self._busy.values()
+                for entry in entries.values()]
+        self._idle, self._idle_cells = {}, {}
+        self._busy, self._busy_cells = {}, {}
+        for driver in idle:
+            cell = self._cell(driver.location)
+            self._idle.setdefault(cell, {})[driver.id] = driver
+            self._idle_cells[driver.id] = cell
+        for free_at, driver in busy:
+            cell = self._cell(driver.destination)
+            self._busy.setdefault(cell, {})[driver.id] = (free_at, driver)
+            self._busy_cells[driver.id] = cell
+
+    def _remove_idle(self, driver):
+        """Remove <driver> from the idle index, if they are in it.
+
+        @type self: LookaheadDispatcher
+        @type driver: Driver
+        @rtype: None
+        """
+
+        cell = self._idle_cells.pop(driver.id, None)
+        if cell is not None:
+            drivers = self._idle[cell]
+            del drivers[driver.id]
+            if not drivers:
+                del self._idle[cell]
+
+    def _remove_busy(self, driver):
+        """Remove <driver> from the index of drivers on a ride, if they are
+        in it.
+
+        @type self: LookaheadDispatcher
+        @type driver: Driver
+        @rtype: None
+        """
+
+        cell = self._busy_cells.pop(driver.id, None)
+        if cell is not None:
+            drivers = self._busy[cell]
+            del drivers[driver.id]
+            if not drivers:
+                del self._busy[cell]
+
+
+def _ring(row, column, ring):
+    """Yield the cells at Chebyshev distance <ring> from (row, column).
+
+    @type row: int
+    @type column: int
+    @type ring: int
+    @rtype: iterator[(int, int)]
+
+    >>> sorted(_ring(0, 0, 1))
+    [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+    """
+
+    if ring == 0:
+        yield row, column
+        return
+    for offset in range(-ring, ring + 1):
+        yield row - ring, column + offset
+        yield row + ring, column + offset
+    for offset in range(-ring + 1, ring):
+        yield row + offset, column - ring
+        yield row + offset, column + ring
@@ -0,0 +1,311 @@
+"""
+The memprofile module measures the memory a simulation uses, and fits it
+against scenario size to predict the memory a run will need.
+
+A run is sampled at three phases: after its events are loaded, at the
+moment its event queue is deepest, and after its report. Each sample
+records the bytes traced by tracemalloc, the deep size of the event queue,
+the dispatcher and the monitor, and the number of live objects of each
+simulation class. An object reachable from more than one component, such
+as a driver held by both the dispatcher and a queued event, is counted
+once, for the first of queue, dispatcher and monitor that reaches it.
+
+Run "python memprofile.py profile events.txt" to sample one scenario and
+"python memprofile.py fit" to fit bytes per rider, per driver and per
+queued event over generated scenarios.
+"""
+
+import gc
+import tracemalloc
+from collections import Counter
+from sys import getsizeof
+from types import FunctionType, ModuleType
+
+from event import create_event_list
+from simulation import Simulation
+from workload import generate
+
+# The classes whose live instances are counted.
+_COUNTED = {"Rider", "Driver", "Location", "Activity", "RiderRequest",
+            "DriverRequest", "Cancellation", "Pickup", "Dropoff", "EndShift"}
+
+# Objects that belong to the program rather than to a simulation.
+_SHARED_TYPES = (type, ModuleType, FunctionType)
+
+
+class MemorySample:
+    """The memory use of a simulation at one phase of its run.
+
+    === Attributes ===
+    @type phase: str
+        "load", "peak" or "report".
+    @type traced: int
+        The bytes allocated by Python and not yet freed.
+    @type queued: int
+        The number of events in the event queue.
+    @type components: dict[str, int]
+        The deep size in bytes of the "queue", "dispatcher" and "monitor".
+    @type counts: dict[str, int]
+        The number of live objects of each simulation class.
+    """
+
+    def __init__(self, phase, traced, queued, components, counts):
+        """Initialize a MemorySample.
+
+        @type self: MemorySample
+        @type phase: str
+        @type traced: int
+        @type queued: int
+        @type components: dict[str, int]
+        @type counts: dict[str, int]
+        @rtype: None
+        """
+
+        self.phase = phase
+        self.traced = traced
+        self.queued = queued
+        self.components = components
+        self.counts = counts
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: MemorySample
+        @rtype: str
+
+        >>> print(MemorySample("load", 2048, 3, {"queue": 1024}, {"Rider": 2}))
+        load: 2048 bytes traced, 3 queued; queue 1024; Rider 2
+        """
+
+        return "{}: {} bytes traced, {} queued; {}; {}".format(
+            self.phase, self.traced, self.queued,
+            ", ".join("{} {}".format(name, size)
+                      for name, size in self.components.items()),
+            ", ".join("{} {}".format(name, count)
+                      for name, count in sorted(self.counts.items())))
+
+
+def deep_size(root, seen):
+    """Return the total size in bytes of <root> and every object reachable
+    from it that is not in <seen>, and add them all to <seen>.
+
+    Classes, modules and functions are not counted.
+
+    @type root: object
+    @type seen: set[int]
+        The ids of objects already counted.
+    @rtype: int
+
+    >>> deep_size([1000, 1000], set()) > deep_size([], set())
+    True
+    """
+
+    size = 0
+    stack = [root]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _SHARED_TYPES):
+            continue
+        seen.add(id(item))
+        size += getsizeof(item)
+        stack.extend(gc.get_referents(item))
+    return size
+
+
+def sample(phase, simulation):
+    """Return a MemorySample of <simulation> at <phase>.
+
+    @type phase: str
+    @type simulation: Simulation
+    @rtype: MemorySample
+    """
+
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0] \
+        if tracemalloc.is_tracing() else 0
+    seen = set()
+    components = {}
+    for name, component in (("queue", simulation._events),
+                            ("dispatcher", simulation._dispatcher),
+                            ("monitor", simulation._monitor)):
+        components[name] = deep_size(component, seen)
+    counts = Counter(type(item).__name__ for item in gc.get_objects()
+                     if type(item).__name__ in _COUNTED)
+    return MemorySample(phase, traced, simulation.pending(), components,
+                        dict(counts))
+
+
+def profile_memory(load):
+    """Return MemorySamples of a run at its "load", "peak" and "report"
+    phases.
+
+    The scenario is run once with profiling to find when its queue is
+    deepest, and then again under tracemalloc to take the samples.
+
+    @type load: callable
+        A function that returns a fresh list of the scenario's initial
+        events each time it is called.
+    @rtype: list[MemorySample]
+
+    >>> samples = profile_memory(lambda: generate(20, 4, seed=1))
+    >>> [memory.phase for memory in samples]
+    ['load', 'peak', 'report']
+    >>> samples[0].counts["Rider"], samples[0].queued
+    (20, 24)
+    """
+
+    peak_time = _peak_time(load())
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        simulation = Simulation()
+        simulation.schedule(load())
+        samples = [sample("load", simulation)]
+        simulation.run_until(peak_time - 1)
+        samples.append(sample("peak", simulation))
+        simulation.run([])
+        simulation.report()
+        samples.append(sample("report", simulation))
+    finally:
+        if started:
+            tracemalloc.stop()
+    return samples
+
+
+def _peak_time(initial_events):
+    """Return the simulated time at which the event queue of a run of
+    <initial_events> is deepest.
+
+    @type initial_events: list[Event]
+    @rtype: int
+    """
+
+    probe = Simulation(profile=True)
+    probe.run(initial_events)
+    return max(probe.profile.queue_depth, key=lambda depth: depth[1])[0]
+
+
+def least_squares(rows, targets):
+    """Return the coefficients x that minimize the squared error of
+    rows . x against <targets>.
+
+    @type rows: list[list[float]]
+    @type targets: list[float]
+    @rtype: list[float]
+
+    >>> [round(x, 6) for x in least_squares(
+    ...     [[1, 1, 0], [1, 2, 1], [1, 3, 0], [1, 4, 2]], [3, 6, 7, 11])]
+    [1.0, 2.0, 1.0]
+    """
+
+    width = len(rows[0])
+    # The normal equations, as an augmented matrix.
+    matrix = [[sum(row[i] * row[j] for row in rows) for j in range(width)]
+              + [sum(row[i] * target for row, target in zip(rows, targets))]
+              for i in range(width)]
+    for column in range(width):
+        pivot = max(range(column, width), key=lambda i: abs(matrix[i][column]))
+        matrix[column], matrix[pivot] = matrix[pivot], matrix[column]
+        for i in range(width):
+            if i != column:
+                factor = matrix[i][column] / matrix[column][column]
+                matrix[i] = [a - factor * b
+                             for a, b in zip(matrix[i], matrix[column])]
+    return [matrix[i][width] / matrix[i][i] for i in range(width)]
+
+
+def fit(sizes, grid=20, seed=0):
+    """Fit the memory of generated scenarios of <sizes> against their
+    numbers of riders and drivers.
+
+    Return a dictionary with the fixed bytes ("base") and the bytes per
+    rider and per driver at the "peak" and "report" phases, and the bytes
+    of queue per queued event at the peak.
+
+    @type sizes: list[(int, int)]
+        (riders, drivers) pairs, with at least three different ratios or
+        scales so the fit is determined.
+    @type grid: int
+        The side of the square grid of the scenarios.
+    @type seed: int
+    @rtype: dict[str, dict[str, float]]
+    """
+
+    rows = []
+    traced = {"peak": [], "report": []}
+    queue_bytes = 0
+    queued = 0
+    for riders, drivers in sizes:
+        samples = profile_memory(
+            lambda: generate(riders, drivers, grid, seed))
+        rows.append([1, riders, drivers])
+        for memory in samples[1:]:
+            traced[memory.phase].append(memory.traced)
+        queue_bytes += samples[1].components["queue"]
+        queued += samples[1].queued
+
+    result = {}
+    for phase, targets in traced.items():
+        base, per_rider, per_driver = least_squares(rows, targets)
+        result[phase] = {"base": base, "per_rider": per_rider,
+                         "per_driver": per_driver}
+    result["queue"] = {"per_queued_event": queue_bytes / max(queued, 1)}
+    return result
+
+
+def predict(model, riders, drivers, phase="peak"):
+    """Return the bytes a scenario of <riders> and <drivers> is predicted
+    to use at <phase>, by a model returned from fit.
+
+    @type model: dict[str, dict[str, float]]
+    @type riders: int
+    @type drivers: int
+    @type phase: str
+    @rtype: float
+
+    >>> predict({"peak": {"base": 100.0, "per_rider": 2.0,
+    ...                   "per_driver": 5.0}}, 10, 2)
+    130.0
+    """
+
+    coefficients = model[phase]
+    return coefficients["base"] + coefficients["per_rider"] * riders \
+        + coefficients["per_driver"] * drivers
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Measure and fit the memory a simulation uses.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    profile_parser = commands.add_parser("profile")
+    profile_parser.add_argument("filename", nargs="?", default="events.txt")
+    fit_parser = commands.add_parser("fit")
+    fit_parser.add_argument("--riders", type=int, nargs="+",
+                            default=[500, 1000, 2000, 4000])
+    fit_parser.add_argument("--drivers-per-rider", type=float, nargs="+",
+                            default=[0.05, 0.1, 0.2])
+    fit_parser.add_argument("--predict", type=int, nargs=2, default=None,
+                            metavar=("RIDERS", "DRIVERS"))
+    arguments = parser.parse_args()
+
+    if arguments.command == "profile":
+        for memory in profile_memory(
+                lambda: create_event_list(arguments.filename)):
+            print(memory)
+    else:
+        model = fit([(riders, max(1, int(riders * ratio)))
+                     for riders in arguments.riders
+                     for ratio in arguments.drivers_per_rider])
+        for phase, coefficients in model.items():
+            print("{}: {}".format(phase, ", ".join(
+                "{} {:.1f}".format(name, value)
+                for name, value in coefficients.items())))
+        if arguments.predict is not None:
+            riders, drivers = arguments.predict
+            for phase in ("peak", "report"):
+                print("predicted {} bytes: {:.0f}".format(
+                    phase, predict(model, riders, drivers, phase)))
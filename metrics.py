@@ -0,0 +1,256 @@
+"""
+The metrics module serves the progress of a long run as Prometheus text
+metrics, over HTTP on a local port.
+
+A MetricsExporter is passed to a Simulation as its observer, or ticked by
+a RealTimeDispatch for each request. Every so many events it takes the
+status of the run and publishes it as a single immutable tuple; the HTTP
+server thread only ever reads the latest tuple, so the simulation loop
+never waits on a lock or on a scrape.
+
+    exporter = MetricsExporter(port=9100)
+    simulation = Simulation(observer=exporter)
+    exporter.watch(simulation.status)
+    exporter.start()
+    simulation.run(events)
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter
+
+# The HELP text and type of each metric, by the status key it comes from.
+_METRICS = {
+    "simulated_time": ("The current simulated time.", "gauge"),
+    "queue_depth": ("Events waiting in the event queue.", "gauge"),
+    "waiting_riders": ("Riders waiting for a driver.", "gauge"),
+    "idle_drivers": ("Registered drivers that are idle.", "gauge"),
+    "rider_wait_time": ("Total time riders waited.", "counter"),
+    "riders_waited": ("Riders picked up or cancelled.", "counter"),
+    "driver_distance": ("Total distance driven.", "counter"),
+    "ride_distance": ("Total distance driven with a rider.", "counter"),
+    "drivers": ("Drivers that have come online.", "gauge"),
+}
+
+
+class MetricsExporter:
+    """A Simulation observer that serves the progress of the run as
+    Prometheus metrics.
+
+    === Attributes ===
+    @type every: int
+        The number of events between published snapshots.
+    """
+
+    # === Private Attributes ===
+    # @type _host: str
+    # @type _port: int
+    # @type _status: callable | None
+    #     A function returning the status of the run as a dictionary of
+    #     numbers, such as Simulation.status.
+    # @type _events: int
+    #     The number of events done so far.
+    # @type _next: int
+    #     The event count at which to publish next.
+    # @type _snapshot: (int, float, float, dict[str, int]) | None
+    #     The last published event count, publication time, events per
+    #     second, and status. Replaced whole, never changed in place.
+    # @type _server: ThreadingHTTPServer | None
+
+    def __init__(self, host="127.0.0.1", port=9100, every=1000):
+        """Initialize a MetricsExporter.
+
+        @type self: MetricsExporter
+        @type host: str
+        @type port: int
+            The port to serve on, or 0 for any free port.
+        @type every: int
+        @rtype: None
+        """
+
+        self._host = host
+        self._port = port
+        self.every = every
+        self._status = None
+        self._events = 0
+        self._next = every
+        self._snapshot = None
+        self._server = None
+
+    def watch(self, status):
+        """Publish the result of calling <status> with every snapshot.
+
+        @type self: MetricsExporter
+        @type status: callable
+        @rtype: None
+        """
+
+        self._status = status
+
+    def address(self):
+        """Return the (host, port) the server is listening on.
+
+        @type self: MetricsExporter
+        @rtype: (str, int)
+        """
+
+        return self._server.server_address[:2]
+
+    def start(self):
+        """Start serving metrics from a background thread.
+
+        @type self: MetricsExporter
+        @rtype: None
+        """
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self._host, self._port), Handler)
+        self._server.daemon_threads = True
+        Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        """Publish a final snapshot and stop serving.
+
+        @type self: MetricsExporter
+        @rtype: None
+        """
+
+        self.publish()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def tap(self, monitor):
+        """Return <monitor>; the exporter reads the monitor through the
+        status function instead.
+
+        @type self: MetricsExporter
+        @type monitor: Monitor
+        @rtype: Monitor
+        """
+
+        return monitor
+
+    def begin(self, event):
+        """Do nothing before an event.
+
+        @type self: MetricsExporter
+        @type event: Event
+        @rtype: None
+        """
+
+        pass
+
+    def end(self, spawned):
+        """Count an event, and publish a snapshot every so many events.
+
+        @type self: MetricsExporter
+        @type spawned: list[Event] | None
+        @rtype: None
+        """
+
+        self._events += 1
+        if self._events >= self._next:
+            self.publish()
+
+    def tick(self):
+        """Count an event done outside a Simulation, such as a request to a
+        RealTimeDispatch.
+
+        @type self: MetricsExporter
+        @rtype: None
+        """
+
+        self.end(None)
+
+    def publish(self):
+        """Publish a snapshot of the run now.
+
+        @type self: MetricsExporter
+        @rtype: None
+
+        >>> exporter = MetricsExporter()
+        >>> exporter.watch(lambda: {"queue_depth": 3})
+        >>> exporter.tick()
+        >>> exporter.publish()
+        >>> print(exporter.render(), end="")  # doctest: +ELLIPSIS
+        # HELP taxi_events_total Events done.
+        # TYPE taxi_events_total counter
+        taxi_events_total 1
+        ...
+        # HELP taxi_queue_depth Events waiting in the event queue.
+        # TYPE taxi_queue_depth gauge
+        taxi_queue_depth 3
+        """
+
+        now = perf_counter()
+        rate = 0.0
+        previous = self._snapshot
+        if previous is not None and now > previous[1]:
+            rate = (self._events - previous[0]) / (now - previous[1])
+        status = {} if self._status is None else self._status()
+        self._snapshot = (self._events, now, rate, status)
+        self._next = self._events + self.every
+
+    def render(self):
+        """Return the latest snapshot in the Prometheus text format.
+
+        @type self: MetricsExporter
+        @rtype: str
+        """
+
+        snapshot = self._snapshot
+        if snapshot is None:
+            return ""
+        events, _, rate, status = snapshot
+        lines = ["# HELP taxi_events_total Events done.",
+                 "# TYPE taxi_events_total counter",
+                 "taxi_events_total {}".format(events),
+                 "# HELP taxi_events_per_second Events done per second "
+                 "since the previous snapshot.",
+                 "# TYPE taxi_events_per_second gauge",
+                 "taxi_events_per_second {}".format(rate)]
+        for key, value in status.items():
+            help_text, kind = _METRICS.get(key, (key, "gauge"))
+            lines += ["# HELP taxi_{} {}".format(key, help_text),
+                      "# TYPE taxi_{} {}".format(key, kind),
+                      "taxi_{} {}".format(key, value)]
+        return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from event import create_event_list
+    from simulation import Simulation
+
+    parser = argparse.ArgumentParser(
+        description="Run a simulation and serve its progress as metrics.")
+    parser.add_argument("filename", nargs="?", default="events.txt")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--every", type=int, default=1000)
+    arguments = parser.parse_args()
+
+    exporter = MetricsExporter(arguments.host, arguments.port,
+                               arguments.every)
+    simulation = Simulation(observer=exporter)
+    exporter.watch(simulation.status)
+    exporter.start()
+    print(simulation.run(create_event_list(arguments.filename)))
+    exporter.close()
@@ -47,6 +47,10 @@ class Activity:
         The location at which the activity occurred.
     """
 
+    # One Activity is kept for every notification, so they carry no
+    # __dict__.
+    __slots__ = ("description", "time", "id", "location")
+
     def __init__(self, timestamp, description, identifier, location):
         """Initialize an Activity.
 
@@ -67,6 +71,9 @@ class Activity:
 class Monitor:
     """A monitor keeps a record of activities that it is notified about.
     When required, it generates a report of the activities it has recorded.
+
+    The report is kept up to date as activities arrive, so it can be read
+    at any point of a run without going back over the recorded activities.
     """
 
     # === Private Attributes ===
@@ -74,6 +81,15 @@ class Monitor:
     #       A dictionary whose key is a category, and value is another
     #       dictionary. The key of the second dictionary is an identifier
     #       and its value is a list of Activities.
+    # @type _wait_time: int
+    #       The total wait time of riders who have been picked up or have
+    #       cancelled.
+    # @type _waits: int
+    #       The number of riders who have been picked up or have cancelled.
+    # @type _total_distance: int
+    #       The total distance driven by all drivers.
+    # @type _ride_distance: int
+    #       The total distance driven by all drivers with a rider.
 
     def __init__(self):
         """Initialize a Monitor.
@@ -86,6 +102,10 @@ class Monitor:
             DRIVER: {}
         }
         """@type _activities: dict[str, dict[str, list[Activity]]]"""
+        self._wait_time = 0
+        self._waits = 0
+        self._total_distance = 0
+        self._ride_distance = 0
 
     def __str__(self):
         """Return a string representation.
@@ -114,82 +134,317 @@ class Monitor:
         @rtype: None
         """
 
-        if identifier not in self._activities[category]:
-            self._activities[category][identifier] = []
+        activities = self._activities[category].get(identifier)
+        if activities is None:
+            activities = []
+            self._activities[category][identifier] = activities
+
+        if activities:
+            previous = activities[-1]
+            if category == RIDER:
+                # The first activity is REQUEST, and the second is PICKUP
+                # or CANCEL. The wait time is the difference between the two.
+                if len(activities) == 1:
+                    self._wait_time += timestamp - previous.time
+                    self._waits += 1
+            else:
+                distance = manhattan_distance(previous.location, location)
+                self._total_distance += distance
+                if previous.description == PICKUP and description == DROPOFF:
+                    self._ride_distance += distance
+
+        activities.append(Activity(timestamp, description, identifier,
+                                   location))
+
+    def last_active(self, identifier):
+        """Return the time of the last activity of the driver <identifier>,
+        or None if there has been none.
+
+        @type self: Monitor
+        @type identifier: str
+        @rtype: int | None
+        """
+
+        activities = self._activities[DRIVER].get(identifier)
+        if not activities:
+            return None
+        return activities[-1].time
+
+    def retire(self, identifier):
+        """Note that the driver <identifier> has left the simulation.
+
+        This monitor keeps the full history of every driver, so there is
+        nothing to release.
 
-        activity = Activity(timestamp, description, identifier, location)
-        self._activities[category][identifier].append(activity)
+        @type self: Monitor
+        @type identifier: str
+        @rtype: None
+        """
+
+        pass
 
     def report(self):
         """Return a report of the activities that have occurred.
 
         @type self: Monitor
         @rtype: dict[str, object]
+
+        >>> from location import Location
+        >>> monitor = Monitor()
+        >>> monitor.notify(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        >>> monitor.notify(1, RIDER, REQUEST, 'Bo', Location(0, 2))
+        >>> monitor.notify(3, DRIVER, PICKUP, 'Ann', Location(0, 2))
+        >>> monitor.notify(3, RIDER, PICKUP, 'Bo', Location(0, 2))
+        >>> monitor.notify(5, DRIVER, DROPOFF, 'Ann', Location(3, 2))
+        >>> monitor.report()  # doctest: +NORMALIZE_WHITESPACE
+        {'rider_wait_time': 2.0, 'driver_total_distance': 5.0,
+         'driver_ride_distance': 3.0}
         """
 
         return {"rider_wait_time": self._average_wait_time(),
                 "driver_total_distance": self._average_total_distance(),
                 "driver_ride_distance": self._average_ride_distance()}
 
+    def totals(self):
+        """Return the running totals behind the report: the total rider
+        wait time, the number of riders waited for, the total driver
+        distance, the total ride distance and the number of drivers.
+
+        @type self: Monitor
+        @rtype: (int, int, int, int, int)
+
+        >>> from location import Location
+        >>> monitor = Monitor()
+        >>> monitor.notify(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        >>> monitor.notify(3, DRIVER, PICKUP, 'Ann', Location(0, 3))
+        >>> monitor.totals()
+        (0, 0, 3, 0, 1)
+        """
+
+        return (self._wait_time, self._waits, self._total_distance,
+                self._ride_distance, self._driver_count())
+
     def _average_wait_time(self):
         """Return the average wait time of riders that have either been picked
-        up or have cancelled their ride.
+        up or have cancelled their ride, or 0.0 if there are none yet.
 
         @type self: Monitor
         @rtype: float
         """
 
-        wait_time = 0
-        count = 0
-        for activities in self._activities[RIDER].values():
-            # A rider that has less than two activities hasn't finished
-            # waiting (they haven't cancelled or been picked up).
-            if len(activities) >= 2:
-                # The first activity is REQUEST, and the second is PICKUP
-                # or CANCEL. The wait time is the difference between the two.
-
-                wait_time += activities[1].time - activities[0].time
-
-                count += 1
-        return wait_time / count
+        if self._waits == 0:
+            return 0.0
+        return self._wait_time / self._waits
 
     def _average_total_distance(self):
-        """Return the average distance drivers have driven.
+        """Return the average distance drivers have driven, or 0.0 if there
+        are no drivers yet.
 
         @type self: Monitor
         @rtype: float
         """
 
-        distance = 0
-        count = 0   # Used to count the number of drivers
-
-        #Add up distances of all activities of all drivers
-        for activities in self._activities[DRIVER].values():
-            index = 0  # Used to index activity list
-            while index < (len(activities) - 1):
-                distance += manhattan_distance(activities[index].location, activities[index+1].location)
-                index += 1
-            count += 1
-        return distance / count
+        count = self._driver_count()
+        if count == 0:
+            return 0.0
+        return self._total_distance / count
 
     def _average_ride_distance(self):
-        """Return the average distance drivers have driven on rides.
+        """Return the average distance drivers have driven on rides, or 0.0
+        if there are no drivers yet.
 
         @type self: Monitor
         @rtype: float
         """
-        distance = 0
-        count = 0  # Used to count the number of drivers
-
-        # Add up ride distances of all activities of all drivers
-        for activities in self._activities[DRIVER].values():
-            index = 0  # Used to index activity list
-            while index < (len(activities) - 1):
-                if activities[index].description == PICKUP and activities[index+1].description == DROPOFF:
-                    distance += manhattan_distance(activities[index].location, activities[index+1].location)
-                    index += 1
-                else:
-                    index += 1
-            count += 1
-        return distance / count
 
+        count = self._driver_count()
+        if count == 0:
+            return 0.0
+        return self._ride_distance / count
+
+    def _driver_count(self):
+        """Return the number of drivers that have taken part.
+
+        @type self: Monitor
+        @rtype: int
+        """
+
+        return len(self._activities[DRIVER])
+
+
+class LifecycleMonitor(Monitor):
+    """A monitor that keeps the running statistics of a simulation, but
+    not the history of its activities.
+
+    A rider is tracked from their request until they are picked up or
+    cancel, and is then folded into the statistics and forgotten. A driver
+    is tracked by their last activity only, and is folded and forgotten
+    when they retire. Memory use is proportional to the number of riders
+    waiting and drivers on shift, however long the run.
+    """
+
+    # === Private Attributes ===
+    # @type _waiting: dict[str, int]
+    #       The request time of each rider who has not yet been picked up
+    #       or cancelled.
+    # @type _drivers: dict[str, (Location, str, int)]
+    #       The location, description and time of each driver's last
+    #       activity.
+    # @type _retired: int
+    #       The number of drivers who have retired.
+
+    def __init__(self):
+        """Initialize a LifecycleMonitor.
+
+        @type self: LifecycleMonitor
+        """
+
+        super().__init__()
+        self._waiting = {}
+        self._drivers = {}
+        self._retired = 0
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: LifecycleMonitor
+        @rtype: str
+        """
+
+        return "LifecycleMonitor ({} drivers, {} waiting riders)".format(
+                len(self._drivers), len(self._waiting))
+
+    def notify(self, timestamp, category, description, identifier, location):
+        """Notify the monitor of the activity.
+
+        @type self: LifecycleMonitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROP_OFF
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+
+        >>> from location import Location
+        >>> monitor = LifecycleMonitor()
+        >>> monitor.notify(1, RIDER, REQUEST, 'Bo', Location(0, 2))
+        >>> monitor.notify(4, RIDER, PICKUP, 'Bo', Location(0, 2))
+        >>> print(monitor)
+        LifecycleMonitor (0 drivers, 0 waiting riders)
+        >>> monitor.report()["rider_wait_time"]
+        3.0
+        """
+
+        if category == RIDER:
+            requested = self._waiting.pop(identifier, None)
+            if requested is None:
+                self._waiting[identifier] = timestamp
+            else:
+                self._wait_time += timestamp - requested
+                self._waits += 1
+        else:
+            last = self._drivers.get(identifier)
+            if last is not None:
+                distance = manhattan_distance(last[0], location)
+                self._total_distance += distance
+                if last[1] == PICKUP and description == DROPOFF:
+                    self._ride_distance += distance
+            self._drivers[identifier] = (location, description, timestamp)
+
+    def last_active(self, identifier):
+        """Return the time of the last activity of the driver <identifier>,
+        or None if there has been none.
+
+        @type self: LifecycleMonitor
+        @type identifier: str
+        @rtype: int | None
+        """
+
+        last = self._drivers.get(identifier)
+        if last is None:
+            return None
+        return last[2]
+
+    def retire(self, identifier):
+        """Fold the driver <identifier> into the statistics, and forget
+        them.
+
+        @type self: LifecycleMonitor
+        @type identifier: str
+        @rtype: None
+
+        >>> from location import Location
+        >>> monitor = LifecycleMonitor()
+        >>> monitor.notify(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        >>> monitor.notify(3, DRIVER, PICKUP, 'Ann', Location(0, 3))
+        >>> monitor.retire('Ann')
+        >>> print(monitor)
+        LifecycleMonitor (0 drivers, 0 waiting riders)
+        >>> monitor.report()["driver_total_distance"]
+        3.0
+        """
+
+        if self._drivers.pop(identifier, None) is not None:
+            self._retired += 1
+
+    def hand_off(self, identifier):
+        """Forget the driver <identifier> without retiring them, and return
+        the state of their last activity so another monitor can take them
+        over.
+
+        @type self: LifecycleMonitor
+        @type identifier: str
+        @rtype: (Location, str, int) | None
+        """
+
+        return self._drivers.pop(identifier, None)
+
+    def take_over(self, identifier, state):
+        """Track the driver <identifier> from the last activity <state>
+        handed off by another monitor.
+
+        @type self: LifecycleMonitor
+        @type identifier: str
+        @type state: (Location, str, int) | None
+        @rtype: None
+        """
+
+        if state is not None:
+            self._drivers[identifier] = state
+
+    def merge(self, other):
+        """Add the statistics of <other>, which tracked different riders
+        and drivers, to this monitor.
+
+        @type self: LifecycleMonitor
+        @type other: LifecycleMonitor
+        @rtype: None
+
+        >>> from location import Location
+        >>> first, second = LifecycleMonitor(), LifecycleMonitor()
+        >>> first.notify(0, DRIVER, REQUEST, 'Ann', Location(0, 0))
+        >>> first.notify(2, DRIVER, PICKUP, 'Ann', Location(0, 2))
+        >>> second.take_over('Ann', first.hand_off('Ann'))
+        >>> second.notify(5, DRIVER, DROPOFF, 'Ann', Location(3, 2))
+        >>> first.merge(second)
+        >>> report = first.report()
+        >>> report["driver_total_distance"], report["driver_ride_distance"]
+        (5.0, 3.0)
+        """
+
+        self._wait_time += other._wait_time
+        self._waits += other._waits
+        self._total_distance += other._total_distance
+        self._ride_distance += other._ride_distance
+        self._retired += other._retired
+        self._waiting.update(other._waiting)
+        self._drivers.update(other._drivers)
+
+    def _driver_count(self):
+        """Return the number of drivers that have taken part.
+
+        @type self: LifecycleMonitor
+        @rtype: int
+        """
+
+        return len(self._drivers) + self._retired
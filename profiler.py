@@ -0,0 +1,215 @@
+"""
+The profiler module contains the EventProfile class, which collects
+per-event-type timing counters while a Simulation runs.
+
+A Simulation only fills in a profile when it is created with
+profile=True; otherwise the uninstrumented loop is used and no counters
+are kept at all.
+"""
+
+
+class EventStats:
+    """Counters for a single kind of event.
+
+    === Attributes ===
+    @type count: int
+        The number of events of this kind that were done.
+    @type total_time: float
+        The cumulative wall time, in seconds, spent in do().
+    @type max_time: float
+        The longest wall time, in seconds, spent in a single do().
+    @type spawned: int
+        The total number of new events returned by do().
+    """
+
+    def __init__(self):
+        """Initialize an empty EventStats.
+
+        @type self: EventStats
+        @rtype: None
+
+        >>> stats = EventStats()
+        >>> stats.count, stats.total_time, stats.max_time, stats.spawned
+        (0, 0.0, 0.0, 0)
+        """
+
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.spawned = 0
+
+    def mean_time(self):
+        """Return the average wall time of one do(), in seconds.
+
+        @type self: EventStats
+        @rtype: float
+
+        >>> stats = EventStats()
+        >>> stats.mean_time()
+        0.0
+        >>> stats.count, stats.total_time = 4, 2.0
+        >>> stats.mean_time()
+        0.5
+        """
+
+        if self.count == 0:
+            return 0.0
+        return self.total_time / self.count
+
+    def fan_out(self):
+        """Return the average number of events spawned by one do().
+
+        @type self: EventStats
+        @rtype: float
+
+        >>> stats = EventStats()
+        >>> stats.count, stats.spawned = 4, 2
+        >>> stats.fan_out()
+        0.5
+        """
+
+        if self.count == 0:
+            return 0.0
+        return self.spawned / self.count
+
+
+class EventProfile:
+    """A profile of a simulation run, broken down by event class.
+
+    === Attributes ===
+    @type event_stats: dict[str, EventStats]
+        The counters for each event class, keyed by class name.
+    @type queue_time: float
+        The wall time, in seconds, spent adding to and removing from the
+        event queue.
+    @type wall_time: float
+        The total wall time, in seconds, spent in the simulation loop.
+    @type queue_depth: list[(int, int)]
+        (timestamp, depth) samples of the event queue, taken each time
+        the simulated clock advances.
+    @type max_queue_depth: int
+        The largest number of events that were waiting in the queue.
+    """
+
+    def __init__(self):
+        """Initialize an empty EventProfile.
+
+        @type self: EventProfile
+        @rtype: None
+        """
+
+        self.event_stats = {}
+        self.queue_time = 0.0
+        self.wall_time = 0.0
+        self.queue_depth = []
+        self.max_queue_depth = 0
+
+    def __str__(self):
+        """Return a table of the per-event-type counters.
+
+        @type self: EventProfile
+        @rtype: str
+
+        >>> profile = EventProfile()
+        >>> profile.record("Pickup", 0.5, 1)
+        >>> print(profile)  # doctest: +NORMALIZE_WHITESPACE
+        event count total (s) max (s) fan-out
+        Pickup 1 0.500000 0.500000 1.00
+        """
+
+        lines = ["{:<16} {:>10} {:>12} {:>12} {:>8}".format(
+            "event", "count", "total (s)", "max (s)", "fan-out")]
+        for name in sorted(self.event_stats):
+            stats = self.event_stats[name]
+            lines.append("{:<16} {:>10} {:>12.6f} {:>12.6f} {:>8.2f}".format(
+                name, stats.count, stats.total_time, stats.max_time,
+                stats.fan_out()))
+        return "\n".join(lines)
+
+    def record(self, name, elapsed, spawned):
+        """Record that an event of class <name> was done.
+
+        @type self: EventProfile
+        @type name: str
+            The name of the event class.
+        @type elapsed: float
+            The wall time, in seconds, spent in do().
+        @type spawned: int
+            The number of new events returned by do().
+        @rtype: None
+
+        >>> profile = EventProfile()
+        >>> profile.record("Dropoff", 0.25, 1)
+        >>> profile.record("Dropoff", 0.5, 1)
+        >>> stats = profile.event_stats["Dropoff"]
+        >>> stats.count, stats.total_time, stats.max_time, stats.spawned
+        (2, 0.75, 0.5, 2)
+        """
+
+        stats = self.event_stats.get(name)
+        if stats is None:
+            stats = EventStats()
+            self.event_stats[name] = stats
+        stats.count += 1
+        stats.total_time += elapsed
+        stats.spawned += spawned
+        if elapsed > stats.max_time:
+            stats.max_time = elapsed
+
+    def sample_queue(self, timestamp, depth):
+        """Record that <depth> events were queued at simulated <timestamp>.
+
+        @type self: EventProfile
+        @type timestamp: int
+        @type depth: int
+        @rtype: None
+
+        >>> profile = EventProfile()
+        >>> profile.sample_queue(0, 3)
+        >>> profile.sample_queue(4, 1)
+        >>> profile.queue_depth, profile.max_queue_depth
+        ([(0, 3), (4, 1)], 3)
+        """
+
+        self.queue_depth.append((timestamp, depth))
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def event_count(self):
+        """Return the total number of events that were done.
+
+        @type self: EventProfile
+        @rtype: int
+        """
+
+        return sum(stats.count for stats in self.event_stats.values())
+
+    def events_per_second(self):
+        """Return the overall throughput of the simulation loop.
+
+        @type self: EventProfile
+        @rtype: float
+        """
+
+        if self.wall_time == 0:
+            return 0.0
+        return self.event_count() / self.wall_time
+
+    def report(self):
+        """Return the profile as a dictionary.
+
+        @type self: EventProfile
+        @rtype: dict[str, object]
+        """
+
+        return {"events": self.event_count(),
+                "events_per_second": self.events_per_second(),
+                "wall_time": self.wall_time,
+                "queue_time": self.queue_time,
+                "max_queue_depth": self.max_queue_depth,
+                "event_stats": {name: {"count": stats.count,
+                                       "total_time": stats.total_time,
+                                       "max_time": stats.max_time,
+                                       "mean_time": stats.mean_time(),
+                                       "fan_out": stats.fan_out()}
+                                for name, stats in self.event_stats.items()}}
@@ -0,0 +1,488 @@
+"""
+The realtime module runs the Dispatcher and events as a live dispatch
+service, against the wall clock, behind a local TCP or Unix socket.
+
+Clients send one JSON object per line:
+
+    {"type": "driver", "id": "Ann", "location": [1, 2], "speed": 2}
+    {"type": "rider", "id": "Bo", "origin": [0, 0], "destination": [3, 4],
+     "patience": 10}
+
+and get one JSON object per line back, in order, with the dispatch
+decision made at the current simulated time:
+
+    {"id": "Bo", "time": 12, "driver": "Ann"}
+    {"id": "Ann", "time": 12, "rider": null}
+
+Simulated time is wall time since the service started, multiplied by the
+time compression. The Cancellation, Pickup, Dropoff and DriverRequest
+events that a request spawns are fired by loop timers when their
+timestamps come due. They wait in an EventQueue, with one loop timer per
+distinct timestamp; each timer does every queued event that is due, in the
+queue's order, so events at the same simulated time are done in exactly
+the order the simulation engine would do them.
+
+Requests go through a bounded queue to a single dispatch task; when the
+queue is full, connections stop reading, so bursts push back on the
+clients instead of growing memory.
+
+Run "python realtime.py serve" to start the service and
+"python realtime.py load" to drive it with generated requests.
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from math import log2
+from random import Random
+from time import perf_counter
+
+from container import EventQueue
+from dispatcher import Dispatcher
+from driver import Driver
+from event import RiderRequest, DriverRequest, Pickup
+from location import Location
+from monitor import Monitor
+from rider import Rider
+
+_log = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """A histogram of latencies, in power-of-two buckets of microseconds.
+
+    === Attributes ===
+    @type buckets: list[int]
+        buckets[i] counts latencies of less than 2 ** i microseconds that
+        are not counted by an earlier bucket.
+    @type count: int
+        The number of latencies recorded.
+    @type total: float
+        The sum of the latencies recorded, in seconds.
+    """
+
+    def __init__(self):
+        """Initialize an empty LatencyHistogram.
+
+        @type self: LatencyHistogram
+        @rtype: None
+        """
+
+        self.buckets = [0] * 40
+        self.count = 0
+        self.total = 0.0
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: LatencyHistogram
+        @rtype: str
+
+        >>> histogram = LatencyHistogram()
+        >>> histogram.record(0.000003)
+        >>> print(histogram)
+        1 requests, mean 3.0 us, p50 < 4 us, p99 < 4 us
+        """
+
+        if self.count == 0:
+            return "0 requests"
+        return "{} requests, mean {:.1f} us, p50 < {} us, p99 < {} us".format(
+            self.count, self.total / self.count * 1e6,
+            self.percentile(0.5), self.percentile(0.99))
+
+    def record(self, seconds):
+        """Record a latency of <seconds>.
+
+        @type self: LatencyHistogram
+        @type seconds: float
+        @rtype: None
+
+        >>> histogram = LatencyHistogram()
+        >>> histogram.record(0.0)
+        >>> histogram.record(0.000010)
+        >>> histogram.buckets[:5]
+        [1, 0, 0, 0, 1]
+        """
+
+        microseconds = seconds * 1e6
+        bucket = 0 if microseconds < 1 else int(log2(microseconds)) + 1
+        self.buckets[min(bucket, len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, fraction):
+        """Return the upper bound, in microseconds, of the bucket holding
+        the <fraction> percentile.
+
+        @type self: LatencyHistogram
+        @type fraction: float
+        @rtype: int
+        """
+
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= fraction * self.count:
+                return 2 ** bucket
+        return 2 ** (len(self.buckets) - 1)
+
+
+class RealTimeDispatch:
+    """A dispatch service that fires simulation events on the wall clock.
+
+    === Attributes ===
+    @type latency: LatencyHistogram
+        The time from reading each request to writing its reply.
+    """
+
+    # === Private Attributes ===
+    # @type _dispatcher: Dispatcher
+    # @type _monitor: Monitor
+    # @type _compression: float
+    #     Simulated time units per wall-clock second.
+    # @type _max_pending: int
+    #     The capacity of _requests.
+    # @type _requests: asyncio.Queue
+    #     Parsed requests waiting for the dispatch task.
+    # @type _started: float
+    #     The loop time at which the service started.
+    # @type _exporter: MetricsExporter | None
+    #     Counts each event fired, if given.
+    # @type _events: EventQueue
+    #     The spawned events that have not been done yet.
+    # @type _timers: set[int]
+    #     The simulated times for which a loop timer is pending.
+
+    def __init__(self, dispatcher=None, monitor=None, compression=1.0,
+                 max_pending=1024, exporter=None):
+        """Initialize a RealTimeDispatch.
+
+        @type self: RealTimeDispatch
+        @type dispatcher: Dispatcher | None
+        @type monitor: Monitor | None
+        @type compression: float
+            Simulated time units per wall-clock second.
+        @type max_pending: int
+            The most requests that may wait for dispatch before connections
+            stop reading.
+        @type exporter: MetricsExporter | None
+        @rtype: None
+        """
+
+        self._dispatcher = Dispatcher() if dispatcher is None else dispatcher
+        self._monitor = Monitor() if monitor is None else monitor
+        self._compression = compression
+        self._max_pending = max_pending
+        self._requests = None
+        self._started = None
+        self.latency = LatencyHistogram()
+        self._exporter = exporter
+        self._events = EventQueue()
+        self._timers = set()
+
+    def now(self):
+        """Return the current simulated time.
+
+        @type self: RealTimeDispatch
+        @rtype: int
+        """
+
+        loop = asyncio.get_running_loop()
+        return int((loop.time() - self._started) * self._compression)
+
+    def report(self):
+        """Return the monitor's report of the service so far.
+
+        @type self: RealTimeDispatch
+        @rtype: dict[str, object]
+        """
+
+        return self._monitor.report()
+
+    def status(self):
+        """Return the progress of the service so far, as in
+        Simulation.status.
+
+        @type self: RealTimeDispatch
+        @rtype: dict[str, int]
+        """
+
+        wait_time, waited, distance, ride_distance, drivers = \
+            self._monitor.totals()
+        return {"simulated_time": self.now() if self._started else 0,
+                "queue_depth": self._requests.qsize() if self._requests
+                else 0,
+                "waiting_riders": self._dispatcher.waiting_count(),
+                "idle_drivers": len(self._dispatcher.idle_drivers()),
+                "rider_wait_time": wait_time,
+                "riders_waited": waited,
+                "driver_distance": distance,
+                "ride_distance": ride_distance,
+                "drivers": drivers}
+
+    async def serve(self, host="127.0.0.1", port=8765, path=None):
+        """Accept requests on <host>:<port>, or on the Unix socket <path>,
+        until cancelled.
+
+        @type self: RealTimeDispatch
+        @type host: str
+        @type port: int
+        @type path: str | None
+        @rtype: None
+        """
+
+        loop = asyncio.get_running_loop()
+        self._started = loop.time()
+        self._requests = asyncio.Queue(self._max_pending)
+        if path is None:
+            server = await asyncio.start_server(self._handle, host, port)
+        else:
+            server = await asyncio.start_unix_server(self._handle, path)
+
+        dispatch = asyncio.create_task(self._dispatch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            dispatch.cancel()
+
+    async def _handle(self, reader, writer):
+        """Read the requests of one connection.
+
+        @type self: RealTimeDispatch
+        @type reader: asyncio.StreamReader
+        @type writer: asyncio.StreamWriter
+        @rtype: None
+        """
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await self._requests.put((perf_counter(), line, writer))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self):
+        """Do the queued requests, one at a time, and reply to each.
+
+        @type self: RealTimeDispatch
+        @rtype: None
+        """
+
+        while True:
+            received, line, writer = await self._requests.get()
+            try:
+                reply = self._request(json.loads(line))
+            except (ValueError, KeyError, TypeError) as error:
+                reply = {"error": str(error)}
+            except Exception as error:
+                # A bad event must not stop the service for everyone else.
+                _log.exception("Failed to dispatch %r", line)
+                reply = {"error": "internal error: {!r}".format(error)}
+            if not writer.is_closing():
+                writer.write(json.dumps(reply).encode() + b"\n")
+            self.latency.record(perf_counter() - received)
+
+    def _request(self, message):
+        """Do the request in <message> now, and return the reply.
+
+        @type self: RealTimeDispatch
+        @type message: dict[str, object]
+        @rtype: dict[str, object]
+        """
+
+        now = self.now()
+        if message["type"] == "rider":
+            rider = Rider(message["id"], Location(*message["origin"]),
+                          Location(*message["destination"]),
+                          int(message["patience"]))
+            pickup = self._fire(RiderRequest(now, rider))
+            return {"id": rider.id, "time": now,
+                    "driver": None if pickup is None else pickup.driver.id}
+        elif message["type"] == "driver":
+            driver = Driver(message["id"], Location(*message["location"]),
+                            message["speed"])
+            pickup = self._fire(DriverRequest(now, driver))
+            return {"id": driver.id, "time": now,
+                    "rider": None if pickup is None else pickup.rider.id}
+        raise ValueError("Unknown request type {}".format(message["type"]))
+
+    def _fire(self, event):
+        """Do <event> after every queued event already due, and return
+        the Pickup it spawns, if any.
+
+        @type self: RealTimeDispatch
+        @type event: Event
+        @rtype: Pickup | None
+        """
+
+        self._do_due(event.timestamp)
+        pickup = None
+        for new_event in self._do(event):
+            if type(new_event) is Pickup:
+                pickup = new_event
+        # A driver already at the rider's origin picks them up at once.
+        self._do_due(event.timestamp)
+        return pickup
+
+    def _do(self, event):
+        """Do <event>, queue the events it spawns, and return them.
+
+        @type self: RealTimeDispatch
+        @type event: Event
+        @rtype: list[Event]
+        """
+
+        spawned = event.do(self._dispatcher, self._monitor) or []
+        if self._exporter is not None:
+            self._exporter.tick()
+        for new_event in spawned:
+            self._events.add(new_event)
+            timestamp = new_event.timestamp
+            if timestamp not in self._timers:
+                self._timers.add(timestamp)
+                asyncio.get_running_loop().call_at(
+                    self._started + timestamp / self._compression,
+                    self._on_timer, timestamp)
+        return spawned
+
+    def _on_timer(self, timestamp):
+        """Do the events due at simulated time <timestamp>.
+
+        @type self: RealTimeDispatch
+        @type timestamp: int
+        @rtype: None
+        """
+
+        self._timers.discard(timestamp)
+        try:
+            self._do_due(timestamp)
+        except Exception:
+            _log.exception("Failed to do the events due at %d", timestamp)
+
+    def _do_due(self, time):
+        """Do every queued event at or before simulated time <time>, in
+        timestamp order with ties in the order they were queued.
+
+        @type self: RealTimeDispatch
+        @type time: int
+        @rtype: None
+        """
+
+        events = self._events
+        while not events.is_empty() and events.next_timestamp() <= time:
+            self._do(events.remove())
+
+
+async def generate_load(host="127.0.0.1", port=8765, path=None, riders=10000,
+                        drivers=500, rate=2000.0, connections=8, size=50,
+                        seed=0):
+    """Send <drivers> driver requests and then <riders> rider requests to a
+    RealTimeDispatch, at about <rate> requests per second in total over
+    <connections> connections, and return the round-trip latencies.
+
+    @type host: str
+    @type port: int
+    @type path: str | None
+    @type riders: int
+    @type drivers: int
+    @type rate: float
+    @type connections: int
+    @type size: int
+        The side of the square grid to place locations in.
+    @type seed: int
+    @rtype: LatencyHistogram
+    """
+
+    random = Random(seed)
+
+    def place():
+        return [random.randrange(size), random.randrange(size)]
+
+    messages = [{"type": "driver", "id": "D{}".format(i), "location": place(),
+                 "speed": random.randint(1, 3)} for i in range(drivers)]
+    messages += [{"type": "rider", "id": "R{}".format(i), "origin": place(),
+                  "destination": place(), "patience": random.randint(5, 30)}
+                 for i in range(riders)]
+    histogram = LatencyHistogram()
+
+    async def client(share):
+        if path is None:
+            reader, writer = await asyncio.open_connection(host, port)
+        else:
+            reader, writer = await asyncio.open_unix_connection(path)
+        interval = connections / rate
+        sent = deque()
+
+        async def receive():
+            for _ in share:
+                await reader.readline()
+                histogram.record(perf_counter() - sent.popleft())
+
+        receiving = asyncio.create_task(receive())
+        next_send = perf_counter()
+        for message in share:
+            sent.append(perf_counter())
+            writer.write(json.dumps(message).encode() + b"\n")
+            next_send += interval
+            delay = next_send - perf_counter()
+            if delay > 0:
+                await writer.drain()
+                await asyncio.sleep(delay)
+        await writer.drain()
+        await receiving
+        writer.close()
+
+    # Drivers come online before any rider asks for one.
+    await asyncio.gather(*(client(messages[i:drivers:connections])
+                           for i in range(connections)))
+    await asyncio.gather(*(client(messages[drivers + i::connections])
+                           for i in range(connections)))
+    return histogram
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Real-time dispatch.")
+    parser.add_argument("mode", choices=["serve", "load"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default=None,
+                        help="a Unix socket path to use instead of TCP")
+    parser.add_argument("--compression", type=float, default=1.0)
+    parser.add_argument("--riders", type=int, default=10000)
+    parser.add_argument("--drivers", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=2000.0)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on this port")
+    arguments = parser.parse_args()
+
+    if arguments.mode == "serve":
+        exporter = None
+        if arguments.metrics_port is not None:
+            from metrics import MetricsExporter
+            exporter = MetricsExporter(arguments.host, arguments.metrics_port,
+                                       every=100)
+        service = RealTimeDispatch(compression=arguments.compression,
+                                   exporter=exporter)
+        if exporter is not None:
+            exporter.watch(service.status)
+            exporter.start()
+        try:
+            asyncio.run(service.serve(arguments.host, arguments.port,
+                                      arguments.path))
+        except KeyboardInterrupt:
+            print(service.report())
+            print("dispatch latency:", service.latency)
+    else:
+        print("round trip:", asyncio.run(generate_load(
+            arguments.host, arguments.port, arguments.path, arguments.riders,
+            arguments.drivers, arguments.rate, arguments.connections)))
@@ -0,0 +1,405 @@
+"""
+The recorder module writes a compact, compressed binary trace of every
+event a Simulation does, and replays traces without a dispatcher.
+
+A trace is a stream of three kinds of records:
+
+    NAME   a new identifier (or event class name) for the string table
+    EVENT  an event's class, timestamp, rider, driver, and the dispatch
+           decision: the driver or rider it was matched with, if any
+    NOTE   a notification the event gave the monitor
+
+Identifiers are written once and referred to by index afterwards. When the
+simulation identifies riders and drivers by Registry handles, the recorder
+is given the Registry and writes their names. Records
+are collected in a buffer and compressed a block at a time.
+
+To record a run, pass a TraceRecorder as the observer of a Simulation and
+close it afterwards. replay() re-drives a Monitor from the NOTE records,
+and read_trace() yields the recorded events for computing new metrics.
+"""
+
+import zlib
+from struct import Struct
+
+from event import Pickup
+from location import Location
+from monitor import Monitor, RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+
+MAGIC = b"TAXITRC\x01"
+
+_NAME = 0
+_EVENT = 1
+_NOTE = 2
+
+# length of the name in bytes
+_NAME_RECORD = Struct("<BH")
+# event class, timestamp, rider, driver, decision
+_EVENT_RECORD = Struct("<Biqiii")
+# category, description, identifier, row, column
+_NOTE_RECORD = Struct("<Bbbiii")
+
+_CATEGORIES = [RIDER, DRIVER]
+_DESCRIPTIONS = [REQUEST, CANCEL, PICKUP, DROPOFF]
+
+
+class TraceRecorder:
+    """A Simulation observer that writes a binary trace to a file.
+
+    === Attributes ===
+    @type events: int
+        The number of events recorded so far.
+    """
+
+    # === Private Attributes ===
+    # @type _file: io.BufferedWriter
+    # @type _compressor: zlib.Compress
+    # @type _buffer: bytearray
+    #     Records not yet compressed.
+    # @type _buffer_size: int
+    #     The size at which _buffer is compressed and written.
+    # @type _names: dict[str, int]
+    #     The index of every name written so far.
+    # @type _registry: Registry | None
+    #     The registry to look up the names of rider and driver handles in.
+    # @type _event: (str, int, str | None, str | None)
+    #     The class name, timestamp, rider and driver of the event being
+    #     done.
+    # @type _notes: list[tuple]
+    #     The notifications given by the event being done.
+
+    def __init__(self, filename, buffer_size=1 << 20, level=1, registry=None):
+        """Initialize a TraceRecorder that writes to <filename>.
+
+        @type self: TraceRecorder
+        @type filename: str
+        @type buffer_size: int
+            How many bytes of records to collect before compressing them.
+        @type level: int
+            The zlib compression level.
+        @type registry: Registry | None
+            The registry of the handles that identify riders and drivers,
+            or None if they are identified by name.
+        @rtype: None
+        """
+
+        self._file = open(filename, "wb")
+        self._file.write(MAGIC)
+        self._compressor = zlib.compressobj(level)
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+        self._names = {}
+        self._registry = registry
+        self._event = None
+        self._notes = []
+        self.events = 0
+
+    def tap(self, monitor):
+        """Return a monitor that records the notifications it gets, and
+        passes them on to <monitor>.
+
+        @type self: TraceRecorder
+        @type monitor: Monitor
+        @rtype: Tap
+        """
+
+        return Tap(self._notes, monitor)
+
+    def begin(self, event):
+        """Note that <event> is about to be done.
+
+        @type self: TraceRecorder
+        @type event: Event
+        @rtype: None
+        """
+
+        rider = getattr(event, "rider", None)
+        driver = getattr(event, "driver", None)
+        self._event = (type(event).__name__, event.timestamp,
+                       None if rider is None
+                       else self._resolve(RIDER, rider.id),
+                       None if driver is None
+                       else self._resolve(DRIVER, driver.id))
+
+    def end(self, spawned):
+        """Record the event that was just done, which returned <spawned>.
+
+        @type self: TraceRecorder
+        @type spawned: list[Event] | None
+        @rtype: None
+        """
+
+        kind, timestamp, rider, driver = self._event
+        decision = -1
+        for new_event in spawned or ():
+            if type(new_event) is Pickup:
+                decision = self._name(
+                    self._resolve(DRIVER, new_event.driver.id)
+                    if driver is None
+                    else self._resolve(RIDER, new_event.rider.id))
+
+        buffer = self._buffer
+        buffer += _EVENT_RECORD.pack(
+            _EVENT, self._name(kind), timestamp,
+            -1 if rider is None else self._name(rider),
+            -1 if driver is None else self._name(driver), decision)
+        for category, description, identifier, location in self._notes:
+            buffer += _NOTE_RECORD.pack(
+                _NOTE, _CATEGORIES.index(category),
+                _DESCRIPTIONS.index(description),
+                self._name(self._resolve(category, identifier)),
+                location.row, location.column)
+        self._notes.clear()
+        self.events += 1
+
+        if len(buffer) >= self._buffer_size:
+            self._flush()
+
+    def close(self):
+        """Write out everything recorded, and close the trace file.
+
+        @type self: TraceRecorder
+        @rtype: None
+        """
+
+        self._flush()
+        self._file.write(self._compressor.flush())
+        self._file.close()
+
+    def _resolve(self, category, identifier):
+        """Return the name of the rider or driver <identifier>.
+
+        @type self: TraceRecorder
+        @type category: RIDER | DRIVER
+        @type identifier: str | int
+        @rtype: str | int
+        """
+
+        if self._registry is None:
+            return identifier
+        return self._registry.name(category, identifier)
+
+    def _name(self, name):
+        """Return the index of <name>, writing it to the trace if it is new.
+
+        @type self: TraceRecorder
+        @type name: str
+        @rtype: int
+        """
+
+        index = self._names.get(name)
+        if index is None:
+            index = len(self._names)
+            self._names[name] = index
+            encoded = str(name).encode("utf-8")
+            self._buffer += _NAME_RECORD.pack(_NAME, len(encoded)) + encoded
+        return index
+
+    def _flush(self):
+        """Compress and write the buffered records.
+
+        @type self: TraceRecorder
+        @rtype: None
+        """
+
+        if self._buffer:
+            self._file.write(self._compressor.compress(self._buffer))
+            self._buffer = bytearray()
+
+
+class Tap:
+    """A stand-in for a Monitor that records every notification before
+    passing it on.
+
+    Observers return one from their tap method to see what each event
+    tells the monitor.
+    """
+
+    def __init__(self, notes, monitor):
+        """Initialize a Tap.
+
+        @type self: Tap
+        @type notes: list[tuple]
+            The list to record (category, description, identifier,
+            location) notifications in.
+        @type monitor: Monitor
+        @rtype: None
+        """
+
+        self._notes = notes
+        self._monitor = monitor
+
+    def notify(self, timestamp, category, description, identifier, location):
+        """Record the activity, and notify the monitor of it.
+
+        @type self: Tap
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROPOFF
+        @type identifier: str
+        @type location: Location
+        @rtype: None
+        """
+
+        self._notes.append((category, description, identifier, location))
+        self._monitor.notify(timestamp, category, description, identifier,
+                             location)
+
+    def retire(self, identifier):
+        """Tell the monitor that the driver <identifier> has retired.
+
+        @type self: Tap
+        @type identifier: str
+        @rtype: None
+        """
+
+        self._monitor.retire(identifier)
+
+
+class TraceEvent:
+    """An event read back from a trace.
+
+    === Attributes ===
+    @type kind: str
+        The name of the event's class.
+    @type timestamp: int
+    @type rider: str | None
+    @type driver: str | None
+    @type decision: str | None
+        The driver or rider the event's rider or driver was matched with.
+    @type notes: list[(str, str, str, Location)]
+        The (category, description, identifier, location) notifications
+        the event gave the monitor.
+    """
+
+    def __init__(self, kind, timestamp, rider, driver, decision):
+        """Initialize a TraceEvent with no notifications.
+
+        @type self: TraceEvent
+        @type kind: str
+        @type timestamp: int
+        @type rider: str | None
+        @type driver: str | None
+        @type decision: str | None
+        @rtype: None
+        """
+
+        self.kind = kind
+        self.timestamp = timestamp
+        self.rider = rider
+        self.driver = driver
+        self.decision = decision
+        self.notes = []
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: TraceEvent
+        @rtype: str
+
+        >>> print(TraceEvent("RiderRequest", 3, "Bo", None, "Ann"))
+        3 -- RiderRequest rider=Bo driver=None -> Ann
+        """
+
+        return "{} -- {} rider={} driver={} -> {}".format(
+            self.timestamp, self.kind, self.rider, self.driver, self.decision)
+
+
+def _read_chunks(filename, chunk_size=1 << 20):
+    """Yield the decompressed contents of the trace in <filename>.
+
+    @type filename: str
+    @type chunk_size: int
+    @rtype: generator[bytes]
+    """
+
+    decompressor = zlib.decompressobj()
+    with open(filename, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a simulation trace")
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield decompressor.decompress(chunk)
+    yield decompressor.flush()
+
+
+def read_trace(filename):
+    """Yield the events recorded in the trace <filename>, in the order they
+    were done.
+
+    @type filename: str
+    @rtype: generator[TraceEvent]
+    """
+
+    names = []
+    pending = b""
+    event = None
+
+    def name(index):
+        return None if index < 0 else names[index]
+
+    for chunk in _read_chunks(filename):
+        data = pending + chunk
+        offset = 0
+        while offset < len(data):
+            tag = data[offset]
+            if tag == _NAME:
+                if offset + _NAME_RECORD.size > len(data):
+                    break
+                _, length = _NAME_RECORD.unpack_from(data, offset)
+                end = offset + _NAME_RECORD.size + length
+                if end > len(data):
+                    break
+                names.append(data[offset + _NAME_RECORD.size:end]
+                             .decode("utf-8"))
+                offset = end
+            elif tag == _EVENT:
+                if offset + _EVENT_RECORD.size > len(data):
+                    break
+                _, kind, timestamp, rider, driver, decision = \
+                    _EVENT_RECORD.unpack_from(data, offset)
+                offset += _EVENT_RECORD.size
+                if event is not None:
+                    yield event
+                event = TraceEvent(names[kind], timestamp, name(rider),
+                                   name(driver), name(decision))
+            else:
+                if offset + _NOTE_RECORD.size > len(data):
+                    break
+                _, category, description, identifier, row, column = \
+                    _NOTE_RECORD.unpack_from(data, offset)
+                offset += _NOTE_RECORD.size
+                event.notes.append((_CATEGORIES[category],
+                                    _DESCRIPTIONS[description],
+                                    names[identifier], Location(row, column)))
+        pending = data[offset:]
+
+    if event is not None:
+        yield event
+
+
+def replay(filename, monitor=None):
+    """Re-drive <monitor>, or a new Monitor, with the notifications in the
+    trace <filename>, and return it.
+
+    @type filename: str
+    @type monitor: Monitor | None
+    @rtype: Monitor
+    """
+
+    if monitor is None:
+        monitor = Monitor()
+    for event in read_trace(filename):
+        for category, description, identifier, location in event.notes:
+            monitor.notify(event.timestamp, category, description,
+                           identifier, location)
+    return monitor
+
+
+if __name__ == "__main__":
+    import sys
+
+    for traced in read_trace(sys.argv[1]):
+        print(traced)
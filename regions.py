@@ -0,0 +1,547 @@
+"""
+The regions module runs a simulation as a conservative parallel
+discrete-event simulation, with the grid split into bands of rows and each
+band simulated by its own process.
+
+Each region has its own event queue, dispatcher and LifecycleMonitor. A
+rider belongs to the region of their origin, and is only matched with
+drivers in that region; a driver belongs to the region they are in when
+they ask for a rider. When a ride ends in another region, the Pickup sends
+the Dropoff, with the driver and the state of their last activity, to that
+region as a message.
+
+The regions advance together in time windows. A message sent while a
+window is done cannot be due before the window ends, so long as the window
+is no longer than the lookahead: the shortest time any cross-region ride
+can take. When the lookahead is zero, the window is one time unit and is
+done again until no message is due inside it.
+
+Dispatch within regions is a different policy from the city-wide
+Dispatcher, which matches every rider with the nearest driver anywhere
+and so leaves no lookahead at all. RegionDispatcher is the same policy in
+a single process; compare() runs all three.
+
+Events are done in the order of the sequential engine, which does
+simultaneous events in the order they were scheduled: the initial events
+first, and then each other event in the order its creator was done. An
+event's ordering key holds the key of its creator, so keys of events
+created in different regions compare as they would in one queue. After
+each pass over a window the coordinator ranks the events the regions did,
+and the keys of pending events name their creator by this rank instead.
+When the lookahead is zero, each pass of a window goes one creation deeper
+into the chains of events created at the same time, so an event is never
+done before a message that should come first.
+"""
+
+import traceback
+from bisect import bisect_right
+from heapq import heappush, heappop, merge
+from multiprocessing import Pipe, Process
+
+from dispatcher import Dispatcher
+from event import RiderRequest, DriverRequest, Dropoff, create_event_list
+from location import manhattan_distance
+from monitor import LifecycleMonitor
+from simulation import Simulation
+
+
+def band_boundaries(initial_events, regions):
+    """Return the rows at which each region after the first starts, so that
+    <regions> bands of equal height cover the locations of
+    <initial_events>.
+
+    @type initial_events: list[Event]
+    @type regions: int
+    @rtype: list[int]
+
+    >>> from driver import Driver
+    >>> from location import Location
+    >>> band_boundaries([DriverRequest(0, Driver('Ann', Location(0, 0), 1)),
+    ...                  DriverRequest(0, Driver('Bo', Location(9, 0), 1))], 2)
+    [5]
+    """
+
+    rows = []
+    for event in initial_events:
+        if isinstance(event, RiderRequest):
+            rows += [event.rider.origin.row, event.rider.destination.row]
+        elif isinstance(event, DriverRequest):
+            rows.append(event.driver.location.row)
+        else:
+            raise ValueError("Cannot partition a {} event".format(
+                type(event).__name__))
+    low, high = min(rows), max(rows) + 1
+    return [low + (high - low) * i // regions for i in range(1, regions)]
+
+
+def lookahead(initial_events, boundaries):
+    """Return the shortest time any ride in <initial_events> that crosses
+    from one region to another can take, or None if none does.
+
+    @type initial_events: list[Event]
+    @type boundaries: list[int]
+    @rtype: int | None
+    """
+
+    speeds = [event.driver.speed for event in initial_events
+              if isinstance(event, DriverRequest)]
+    if not speeds:
+        return None
+    fastest = max(speeds)
+    shortest = None
+    for event in initial_events:
+        if isinstance(event, RiderRequest):
+            origin, destination = event.rider.origin, event.rider.destination
+            if bisect_right(boundaries, origin.row) \
+                    != bisect_right(boundaries, destination.row):
+                time = round(manhattan_distance(origin, destination) / fastest)
+                if shortest is None or time < shortest:
+                    shortest = time
+    return shortest
+
+
+class RegionDispatcher(Dispatcher):
+    """A dispatcher that only matches riders and drivers in the same band of
+    rows: the dispatch policy of a partitioned simulation, in one process.
+    """
+
+    # === Private Attributes ===
+    # @type _boundaries: list[int]
+    #     The row at which each region after the first starts.
+    # @type _shards: list[Dispatcher]
+    #     The dispatcher of each region.
+    # @type _regions: dict[str, int]
+    #     The region each driver last asked for a rider in.
+
+    def __init__(self, boundaries):
+        """Initialize a RegionDispatcher.
+
+        @type self: RegionDispatcher
+        @type boundaries: list[int]
+        @rtype: None
+        """
+
+        super().__init__()
+        self._boundaries = boundaries
+        self._shards = [Dispatcher() for _ in range(len(boundaries) + 1)]
+        self._regions = {}
+
+    def request_driver(self, rider, timestamp=None):
+        """Return a driver in the rider's region, or None if no driver
+        there is available.
+
+        @type self: RegionDispatcher
+        @type rider: Rider
+        @type timestamp: int | None
+        @rtype: Driver | None
+
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> from rider import Rider
+        >>> dispatcher = RegionDispatcher([5])
+        >>> dispatcher.request_rider(Driver('Ann', Location(6, 0), 1))
+        >>> print(dispatcher.request_driver(
+        ...     Rider('Bo', Location(1, 0), Location(2, 0), 5)))
+        None
+        """
+
+        region = bisect_right(self._boundaries, rider.origin.row)
+        return self._shards[region].request_driver(rider)
+
+    def request_rider(self, driver):
+        """Return a rider waiting in the driver's region, or None if there
+        is none, moving the driver to this region's dispatcher if they have
+        changed region.
+
+        @type self: RegionDispatcher
+        @type driver: Driver
+        @rtype: Rider | None
+        """
+
+        region = bisect_right(self._boundaries, driver.location.row)
+        previous = self._regions.get(driver.id)
+        if previous != region:
+            if previous is not None:
+                self._shards[previous].remove_driver(driver)
+            self._regions[driver.id] = region
+        return self._shards[region].request_rider(driver)
+
+    def remove_driver(self, driver, timestamp=None):
+        """Stop using <driver> to fulfill rider requests.
+
+        @type self: RegionDispatcher
+        @type driver: Driver
+        @type timestamp: int | None
+        @rtype: (Rider, Driver) | None
+        """
+
+        region = self._regions.pop(driver.id, None)
+        if region is not None:
+            return self._shards[region].remove_driver(driver, timestamp)
+        return None
+
+    def idle_drivers(self):
+        """Return the registered drivers that are idle.
+
+        @type self: RegionDispatcher
+        @rtype: list[Driver]
+        """
+
+        return [driver for shard in self._shards
+                for driver in shard.idle_drivers()]
+
+    def waiting_count(self):
+        """Return the number of riders waiting for a driver.
+
+        @type self: RegionDispatcher
+        @rtype: int
+        """
+
+        return sum(shard.waiting_count() for shard in self._shards)
+
+    def cancel_ride(self, rider):
+        """Cancel the ride for rider.
+
+        @type self: RegionDispatcher
+        @type rider: Rider
+        @rtype: None
+        """
+
+        region = bisect_right(self._boundaries, rider.origin.row)
+        self._shards[region].cancel_ride(rider)
+
+
+class _Region:
+    """One region of a partitioned simulation.
+
+    === Attributes ===
+    @type index: int
+        The position of this region, counting from the top row.
+    @type monitor: LifecycleMonitor
+    """
+
+    # === Private Attributes ===
+    # @type _boundaries: list[int]
+    # @type _events: list[(int, list, int, Event)]
+    #     A heap of (timestamp, order, depth, event) entries. The order is
+    #     [0, position] for an initial event, and [1, creator, index] for
+    #     the index-th event created by the event named by creator. The
+    #     depth is how many events created at the same time lead to this
+    #     one.
+    # @type _dispatcher: Dispatcher
+    # @type _created: list[list[list]]
+    #     The orders of the events created by each event done in the
+    #     current pass that created any, in the order they were done.
+
+    def __init__(self, index, boundaries):
+        """Initialize a _Region with no events.
+
+        @type self: _Region
+        @type index: int
+        @type boundaries: list[int]
+        @rtype: None
+        """
+
+        self.index = index
+        self._boundaries = boundaries
+        self._events = []
+        self._dispatcher = Dispatcher()
+        self.monitor = LifecycleMonitor()
+        self._created = []
+
+    def next_timestamp(self):
+        """Return the timestamp of the next event, or None if there is none.
+
+        @type self: _Region
+        @rtype: int | None
+        """
+
+        return self._events[0][0] if self._events else None
+
+    def receive(self, messages):
+        """Add the events in <messages> to this region.
+
+        @type self: _Region
+        @type messages: list[((int, list, int), Event, tuple | None)]
+            The ordering key, event and, for a driver arriving from another
+            region, the state of their last activity.
+        @rtype: None
+        """
+
+        for key, event, state in messages:
+            if state is not None:
+                self.monitor.take_over(event.driver.id, state)
+            heappush(self._events, key + (event,))
+
+    def rank(self, ranks):
+        """Name the creators of pending events by their <ranks> in the
+        order of the whole simulation, instead of by their keys.
+
+        @type self: _Region
+        @type ranks: list[int]
+            The rank of each event done in the last pass that created any.
+        @rtype: None
+        """
+
+        for created, rank in zip(self._created, ranks):
+            for order in created:
+                order[1] = (order[1][0], [-1, rank])
+        self._created = []
+
+    def process(self, until, depth):
+        """Do every event before simulated time <until> that is at most
+        <depth> deep, and return the messages for other regions as
+        (region, message) pairs and the keys of the events done that
+        created any.
+
+        @type self: _Region
+        @type until: int
+        @type depth: int | None
+            The deepest event to do, or None for every event.
+        @rtype: (list[(int, tuple)], list[(int, list)])
+        """
+
+        events = self._events
+        dispatcher = self._dispatcher
+        monitor = self.monitor
+        outgoing = []
+        done = []
+        while events and events[0][0] < until and (
+                depth is None or events[0][2] <= depth):
+            timestamp, order, deep, event = heappop(events)
+            spawned = event.do(dispatcher, monitor)
+            if not spawned:
+                continue
+            creator = (timestamp, order, self.index, len(self._created))
+            created = []
+            for position, new_event in enumerate(spawned):
+                new_order = [1, creator, position]
+                created.append(new_order)
+                key = (new_event.timestamp, new_order,
+                       deep + 1 if new_event.timestamp == timestamp else 0)
+                if type(new_event) is Dropoff:
+                    region = bisect_right(self._boundaries,
+                                          new_event.driver.destination.row)
+                    if region != self.index:
+                        dispatcher.remove_driver(new_event.driver)
+                        outgoing.append((region, (
+                            key, new_event,
+                            monitor.hand_off(new_event.driver.id))))
+                        continue
+                heappush(events, key + (new_event,))
+            self._created.append(created)
+            done.append((timestamp, order))
+        return outgoing, done
+
+
+def _serve_region(connection, index, boundaries, initial):
+    """Run a region in a child process, doing what the coordinator asks.
+
+    Every reply is (True, result), or (False, traceback) if the region
+    failed, after which the process ends.
+
+    @type connection: multiprocessing.connection.Connection
+    @type index: int
+    @type boundaries: list[int]
+    @type initial: list[tuple]
+        The region's initial messages.
+    @rtype: None
+    """
+
+    try:
+        region = _Region(index, boundaries)
+        region.receive(initial)
+        while True:
+            command, arguments = connection.recv()
+            if command == "report":
+                connection.send((True, region.monitor))
+                break
+            until, depth, messages, ranks = arguments
+            region.rank(ranks)
+            region.receive(messages)
+            outgoing, done = region.process(until, depth)
+            connection.send((True, (outgoing, done, region.next_timestamp())))
+    except Exception:
+        connection.send((False, traceback.format_exc()))
+    connection.close()
+
+
+def _receive(connection):
+    """Return the result of a region's reply on <connection>, raising a
+    RuntimeError if the region failed.
+
+    @type connection: multiprocessing.connection.Connection
+    @rtype: object
+    """
+
+    succeeded, result = connection.recv()
+    if not succeeded:
+        raise RuntimeError("Region worker failed:\n" + result)
+    return result
+
+
+def run_partitioned(initial_events, regions):
+    """Run <initial_events> as a parallel simulation of <regions> regions,
+    one process each, and return the merged report, which is the report of
+    Simulation(dispatcher=RegionDispatcher(boundaries)).run(initial_events)
+    for the boundaries band_boundaries(initial_events, regions).
+
+    If a region fails, for example because a driver with speed 0 is sent
+    to a rider, the other regions are stopped and a RuntimeError with the
+    region's traceback is raised.
+
+    @type initial_events: list[Event]
+        RiderRequest and DriverRequest events.
+    @type regions: int
+    @rtype: dict[str, object]
+
+    >>> from workload import generate
+    >>> from random import Random
+    >>> random = Random(5)
+    >>> matches = []
+    >>> for _ in range(6):
+    ...     arguments = (random.randrange(10, 80), random.randrange(1, 12),
+    ...                  random.randrange(3, 12), random.randrange(1000),
+    ...                  random.choice([None, 20]))
+    ...     regions = random.randrange(2, 5)
+    ...     events = generate(*arguments)
+    ...     sequential = Simulation(dispatcher=RegionDispatcher(
+    ...         band_boundaries(events, regions))).run(events)
+    ...     matches.append(
+    ...         run_partitioned(generate(*arguments), regions) == sequential)
+    >>> matches
+    [True, True, True, True, True, True]
+    >>> from driver import Driver
+    >>> from location import Location
+    >>> from rider import Rider
+    >>> run_partitioned([DriverRequest(0, Driver('Ann', Location(0, 0), 0)),
+    ...                  RiderRequest(1, Rider('Bo', Location(1, 1),
+    ...                                        Location(2, 2), 5))], 1)
+    ... # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Region worker failed:
+    ...ZeroDivisionError...
+    """
+
+    boundaries = band_boundaries(initial_events, regions)
+    shortest = lookahead(initial_events, boundaries)
+    # With no lookahead, a window is done in passes of increasing depth.
+    window = float("inf") if shortest is None else max(1, shortest)
+    first_depth = 0 if shortest == 0 else None
+
+    initial = [[] for _ in range(regions)]
+    for position, event in enumerate(initial_events):
+        location = event.rider.origin if isinstance(event, RiderRequest) \
+            else event.driver.location
+        initial[bisect_right(boundaries, location.row)].append(
+            ((event.timestamp, [0, position], 0), event, None))
+
+    connections = []
+    processes = []
+    for index in range(regions):
+        parent_end, child_end = Pipe()
+        process = Process(target=_serve_region,
+                          args=(child_end, index, boundaries, initial[index]))
+        process.start()
+        child_end.close()
+        connections.append(parent_end)
+        processes.append(process)
+
+    try:
+        inboxes = [[] for _ in range(regions)]
+        ranks = [[] for _ in range(regions)]
+        rank = 0
+        pending = [min((message[0][0] for message in messages), default=None)
+                   for messages in initial]
+        while True:
+            due = [time for time in pending if time is not None]
+            due += [message[0][0] for inbox in inboxes for message in inbox]
+            if not due:
+                break
+            until = min(due) + window
+
+            # Do the window, and do it again while messages sent during it
+            # are due inside it.
+            depth = first_depth
+            while True:
+                for index, connection in enumerate(connections):
+                    ready = [message for message in inboxes[index]
+                             if message[0][0] < until]
+                    inboxes[index] = [message for message in inboxes[index]
+                                      if message[0][0] >= until]
+                    connection.send(("process",
+                                     (until, depth, ready, ranks[index])))
+                outgoing = []
+                done = []
+                for index, connection in enumerate(connections):
+                    sent, created, pending[index] = _receive(connection)
+                    outgoing += sent
+                    done.append([(key, index, position)
+                                 for position, key in enumerate(created)])
+
+                # Rank the events that created any in the order of the
+                # whole simulation, and name the creators of messages by it.
+                ranks = [[None] * len(created) for created in done]
+                for _, index, position in merge(*done):
+                    ranks[index][position] = rank
+                    rank += 1
+                late = False
+                for region, message in outgoing:
+                    order = message[0][1]
+                    time, _, index, position = order[1]
+                    order[1] = (time, [-1, ranks[index][position]])
+                    inboxes[region].append(message)
+                    late = late or message[0][0] < until
+
+                if not late and all(time is None or time >= until
+                                    for time in pending):
+                    break
+                depth += 1
+
+        monitor = LifecycleMonitor()
+        for connection in connections:
+            connection.send(("report", None))
+            monitor.merge(_receive(connection))
+        return monitor.report()
+    except BaseException:
+        # The other regions are waiting for commands that will not come.
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        for process in processes:
+            process.join()
+
+
+def compare(filename, regions):
+    """Return the reports of the events in <filename> from the parallel
+    simulation, the sequential simulation with the same regional dispatch,
+    and the sequential simulation with city-wide dispatch.
+
+    @type filename: str
+    @type regions: int
+    @rtype: (dict[str, object], dict[str, object], dict[str, object])
+    """
+
+    events = create_event_list(filename)
+    boundaries = band_boundaries(events, regions)
+    parallel = run_partitioned(events, regions)
+    regional = Simulation(dispatcher=RegionDispatcher(boundaries)).run(
+        create_event_list(filename))
+    citywide = Simulation().run(create_event_list(filename))
+    return parallel, regional, citywide
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run a simulation split into regions, in parallel.")
+    parser.add_argument("filename", nargs="?", default="events.txt")
+    parser.add_argument("--regions", type=int, default=4)
+    arguments = parser.parse_args()
+
+    for name, report in zip(("parallel", "regional", "city-wide"),
+                            compare(arguments.filename, arguments.regions)):
+        print("{}: {}".format(name, report))
@@ -0,0 +1,91 @@
+from monitor import RIDER, DRIVER
+
+
+class Registry:
+    """Dense integer handles for the names of riders and drivers.
+
+    Riders and drivers are numbered separately, from 0, in the order their
+    names are first seen, so a handle can index a list of per-rider or
+    per-driver state. Names are only needed again to show results.
+    """
+
+    # === Private Attributes ===
+    # @type _handles: dict[str, dict[str, int]]
+    #     The handle of each name, by category.
+    # @type _names: dict[str, list[str]]
+    #     The name of each handle, by category.
+
+    def __init__(self):
+        """Initialize an empty Registry.
+
+        @type self: Registry
+        @rtype: None
+        """
+
+        self._handles = {RIDER: {}, DRIVER: {}}
+        self._names = {RIDER: [], DRIVER: []}
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: Registry
+        @rtype: str
+
+        >>> registry = Registry()
+        >>> registry.handle(DRIVER, 'Ann')
+        0
+        >>> print(registry)
+        Registry (0 riders, 1 drivers)
+        """
+
+        return "Registry ({} riders, {} drivers)".format(
+            len(self._names[RIDER]), len(self._names[DRIVER]))
+
+    def handle(self, category, name):
+        """Return the handle of the rider or driver <name>, assigning the
+        next one if the name is new.
+
+        @type self: Registry
+        @type category: RIDER | DRIVER
+        @type name: str
+        @rtype: int
+
+        >>> registry = Registry()
+        >>> registry.handle(RIDER, 'Bo'), registry.handle(RIDER, 'Cy')
+        (0, 1)
+        >>> registry.handle(DRIVER, 'Bo'), registry.handle(RIDER, 'Bo')
+        (0, 0)
+        """
+
+        handles = self._handles[category]
+        handle = handles.get(name)
+        if handle is None:
+            handle = len(handles)
+            handles[name] = handle
+            self._names[category].append(name)
+        return handle
+
+    def name(self, category, handle):
+        """Return the name of the rider or driver with <handle>.
+
+        @type self: Registry
+        @type category: RIDER | DRIVER
+        @type handle: int
+        @rtype: str
+
+        >>> registry = Registry()
+        >>> registry.name(DRIVER, registry.handle(DRIVER, 'Ann'))
+        'Ann'
+        """
+
+        return self._names[category][handle]
+
+    def count(self, category):
+        """Return the number of riders or drivers registered.
+
+        @type self: Registry
+        @type category: RIDER | DRIVER
+        @rtype: int
+        """
+
+        return len(self._names[category])
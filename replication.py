@@ -0,0 +1,250 @@
+"""
+The replication module runs Monte Carlo replications of a scenario and
+summarizes each report metric with a confidence interval.
+
+Every replication perturbs the scenario with its own seeded random streams
+(see Scenario.perturbed), and the replications are run in parallel by the
+sweep module. Comparisons between two configurations use common random
+numbers: replication r of both configurations sees exactly the same
+perturbations, so the interval is computed on the paired differences.
+"""
+
+from math import sqrt, tan, pi
+from statistics import NormalDist, mean, stdev
+
+from event import create_event_list
+from sweep import run_sweep
+
+
+class Estimate:
+    """The estimate of a metric over a number of replications.
+
+    === Attributes ===
+    @type mean: float
+        The sample mean.
+    @type half_width: float
+        The half width of the confidence interval around the mean.
+    @type replications: int
+        The number of replications the estimate is based on.
+    """
+
+    def __init__(self, mean, half_width, replications):
+        """Initialize an Estimate.
+
+        @type self: Estimate
+        @type mean: float
+        @type half_width: float
+        @type replications: int
+        @rtype: None
+        """
+
+        self.mean = mean
+        self.half_width = half_width
+        self.replications = replications
+
+    def __str__(self):
+        """Return a string representation.
+
+        @type self: Estimate
+        @rtype: str
+
+        >>> print(Estimate(2.5, 0.25, 10))
+        2.5 +- 0.25 (10 replications)
+        """
+
+        return "{} +- {} ({} replications)".format(
+            self.mean, self.half_width, self.replications)
+
+    def low(self):
+        """Return the lower end of the confidence interval.
+
+        @type self: Estimate
+        @rtype: float
+        """
+
+        return self.mean - self.half_width
+
+    def high(self):
+        """Return the upper end of the confidence interval.
+
+        @type self: Estimate
+        @rtype: float
+        """
+
+        return self.mean + self.half_width
+
+
+def t_quantile(probability, df):
+    """Return the <probability> quantile of Student's t distribution with
+    <df> degrees of freedom.
+
+    The quantile is exact for one and two degrees of freedom, and uses the
+    Cornish-Fisher expansion around the normal quantile otherwise.
+
+    @type probability: float
+    @type df: int
+    @rtype: float
+
+    >>> round(t_quantile(0.975, 1), 3)
+    12.706
+    >>> round(t_quantile(0.975, 9), 3)
+    2.262
+    >>> round(t_quantile(0.975, 1000), 2)
+    1.96
+    """
+
+    if df == 1:
+        return tan(pi * (probability - 0.5))
+    if df == 2:
+        return (2 * probability - 1) / sqrt(2 * probability * (1 - probability))
+
+    z = NormalDist().inv_cdf(probability)
+    return (z
+            + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z)
+            / (384 * df ** 3)
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3
+               - 945 * z) / (92160 * df ** 4))
+
+
+def estimate(samples, confidence=0.95):
+    """Return the Estimate of the mean of <samples>.
+
+    @type samples: list[float]
+    @type confidence: float
+    @rtype: Estimate
+
+    >>> result = estimate([1.0, 2.0, 3.0])
+    >>> result.mean, round(result.half_width, 3)
+    (2.0, 2.484)
+    >>> print(estimate([4.0]))
+    4.0 +- inf (1 replications)
+    """
+
+    if len(samples) < 2:
+        return Estimate(mean(samples), float("inf"), len(samples))
+    half_width = t_quantile((1 + confidence) / 2, len(samples) - 1) \
+        * stdev(samples) / sqrt(len(samples))
+    return Estimate(mean(samples), half_width, len(samples))
+
+
+def _replication_configs(config, replications, seed, perturbation):
+    """Return the sweep configurations of <replications> replications of
+    <config>.
+
+    @type config: dict[str, object]
+    @type replications: int
+    @type seed: int
+    @type perturbation: dict[str, object]
+    @rtype: list[dict[str, object]]
+    """
+
+    configs = []
+    for replication in range(replications):
+        replicated = dict(config)
+        replicated.update(perturbation)
+        replicated["seed"] = seed
+        replicated["replication"] = replication
+        configs.append(replicated)
+    return configs
+
+
+def replicate(events, replications, config=None, seed=0, jitter=0,
+              patience_spread=0.0, speed_spread=0.0, confidence=0.95,
+              processes=None):
+    """Return an Estimate of each report metric over <replications>
+    perturbed runs of <events> under <config>.
+
+    @type events: list[Event] | Scenario
+    @type replications: int
+    @type config: dict[str, object] | None
+        A sweep configuration; see the sweep module.
+    @type seed: int
+    @type jitter: int
+    @type patience_spread: float
+    @type speed_spread: float
+        How much to perturb the scenario; see Scenario.perturbed.
+    @type confidence: float
+    @type processes: int | None
+    @rtype: dict[str, Estimate]
+    """
+
+    perturbation = {"jitter": jitter, "patience_spread": patience_spread,
+                    "speed_spread": speed_spread}
+    configs = _replication_configs(config or {}, replications, seed,
+                                   perturbation)
+    rows = run_sweep(events, configs, processes)
+    rows.sort(key=lambda row: row["replication"])
+
+    report_keys = [key for key in rows[0] if key not in configs[0]]
+    return {key: estimate([row[key] for row in rows], confidence)
+            for key in report_keys}
+
+
+def compare(events, config_a, config_b, replications, seed=0, jitter=0,
+            patience_spread=0.0, speed_spread=0.0, confidence=0.95,
+            processes=None):
+    """Return an Estimate of the difference (a - b) in each report metric
+    between configurations <config_a> and <config_b>.
+
+    Both configurations are run on the same perturbations, and the
+    interval is computed on the paired differences.
+
+    @type events: list[Event] | Scenario
+    @type config_a: dict[str, object]
+    @type config_b: dict[str, object]
+    @type replications: int
+    @type seed: int
+    @type jitter: int
+    @type patience_spread: float
+    @type speed_spread: float
+    @type confidence: float
+    @type processes: int | None
+    @rtype: dict[str, Estimate]
+    """
+
+    perturbation = {"jitter": jitter, "patience_spread": patience_spread,
+                    "speed_spread": speed_spread}
+    configs = []
+    for arm, config in enumerate((config_a, config_b)):
+        for replicated in _replication_configs(config, replications, seed,
+                                               perturbation):
+            replicated["arm"] = arm
+            configs.append(replicated)
+    rows = run_sweep(events, configs, processes)
+
+    paired = {}
+    for row in rows:
+        paired[(row["arm"], row["replication"])] = row
+    config_keys = set(configs[0]) | set(configs[-1])
+    report_keys = [key for key in rows[0] if key not in config_keys]
+    return {key: estimate([paired[(0, replication)][key]
+                           - paired[(1, replication)][key]
+                           for replication in range(replications)],
+                          confidence)
+            for key in report_keys}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run Monte Carlo replications of a scenario.")
+    parser.add_argument("filename", nargs="?", default="events.txt")
+    parser.add_argument("--replications", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jitter", type=int, default=0)
+    parser.add_argument("--patience-spread", type=float, default=0.0)
+    parser.add_argument("--speed-spread", type=float, default=0.0)
+    parser.add_argument("--processes", type=int, default=None)
+    arguments = parser.parse_args()
+
+    estimates = replicate(create_event_list(arguments.filename),
+                          arguments.replications, seed=arguments.seed,
+                          jitter=arguments.jitter,
+                          patience_spread=arguments.patience_spread,
+                          speed_spread=arguments.speed_spread,
+                          processes=arguments.processes)
+    for metric, metric_estimate in estimates.items():
+        print("{}: {}".format(metric, metric_estimate))
@@ -22,8 +22,9 @@ class Rider:
     """A rider within the simulation.
 
     === Attributes ===
-    @type id: str
-        A unique identifier for the rider.
+    @type id: str | int
+        A unique identifier for the rider: their name, or their handle in a
+        Registry.
     @type origin: Location
         The starting location of the rider.
     @type destination: Location
@@ -0,0 +1,245 @@
+"""
+The scenario module contains the Scenario class, a compact, immutable form
+of a list of initial events that can be turned into fresh Rider, Driver and
+Event objects as many times as needed.
+
+Simulations mutate their riders and drivers, so every run needs its own
+objects. A Scenario is parsed once, encoded to bytes (for example into
+shared memory), and decoded by each run with any per-run changes to the
+fleet applied on the way.
+
+=== Constants ===
+@type RIDER_REQUEST: int
+    The kind of a RiderRequest record.
+@type DRIVER_REQUEST: int
+    The kind of a DriverRequest record.
+"""
+
+from array import array
+from random import Random
+from struct import Struct
+
+from driver import Driver
+from event import RiderRequest, DriverRequest
+from location import Location
+from rider import Rider
+
+RIDER_REQUEST = 0
+DRIVER_REQUEST = 1
+
+_COUNT = Struct("<Q")
+# kind, timestamp, name, row, column, destination row, destination column,
+# speed or patience
+_RECORD = Struct("<bqIiiiii")
+
+
+class Scenario:
+    """The initial events of a simulation, stored as plain records.
+
+    === Attributes ===
+    @type names: list[str]
+        The identifiers of the riders and drivers.
+    @type records: list[(int, int, int, int, int, int, int, int)]
+        One (kind, timestamp, name, row, column, destination row,
+        destination column, value) record per event, in input order. name
+        is an index into names, and value is the driver's speed or the
+        rider's patience. Destinations of drivers are unused.
+    """
+
+    def __init__(self, names, records):
+        """Initialize a Scenario.
+
+        @type self: Scenario
+        @type names: list[str]
+        @type records: list[tuple]
+        @rtype: None
+        """
+
+        self.names = names
+        self.records = records
+
+    @classmethod
+    def from_events(cls, events):
+        """Return the Scenario of a list of RiderRequest and DriverRequest
+        events, such as the one returned by create_event_list.
+
+        @type events: list[Event]
+        @rtype: Scenario
+
+        >>> events = [DriverRequest(0, Driver('Ann', Location(1, 2), 3)),
+        ...           RiderRequest(4, Rider('Bo', Location(0, 0),
+        ...                                 Location(5, 5), 9))]
+        >>> scenario = Scenario.from_events(events)
+        >>> scenario.names
+        ['Ann', 'Bo']
+        >>> scenario.records
+        [(1, 0, 0, 1, 2, 0, 0, 3), (0, 4, 1, 0, 0, 5, 5, 9)]
+        """
+
+        names = []
+        records = []
+        for event in events:
+            if isinstance(event, RiderRequest):
+                rider = event.rider
+                records.append((RIDER_REQUEST, event.timestamp, len(names),
+                                rider.origin.row, rider.origin.column,
+                                rider.destination.row,
+                                rider.destination.column, rider.patience))
+                names.append(rider.id)
+            elif isinstance(event, DriverRequest):
+                driver = event.driver
+                records.append((DRIVER_REQUEST, event.timestamp, len(names),
+                                driver.location.row, driver.location.column,
+                                0, 0, driver.speed))
+                names.append(driver.id)
+            else:
+                raise ValueError("Cannot store {} in a scenario".format(
+                    type(event).__name__))
+        return cls(names, records)
+
+    def to_bytes(self):
+        """Return the binary encoding of this Scenario.
+
+        @type self: Scenario
+        @rtype: bytes
+        """
+
+        encoded = [name.encode("utf-8") for name in self.names]
+        return b"".join([_COUNT.pack(len(encoded)),
+                         array("I", [len(name) for name in encoded]).tobytes(),
+                         b"".join(encoded),
+                         _COUNT.pack(len(self.records)),
+                         b"".join(_RECORD.pack(*record)
+                                  for record in self.records)])
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """Return the Scenario encoded in <buffer> by to_bytes.
+
+        <buffer> may be longer than the encoding; the rest is ignored.
+
+        @type buffer: bytes | memoryview
+        @rtype: Scenario
+
+        >>> scenario = Scenario(['Ann'], [(1, 0, 0, 1, 2, 0, 0, 3)])
+        >>> copy = Scenario.from_buffer(scenario.to_bytes() + bytes(8))
+        >>> copy.names, copy.records
+        (['Ann'], [(1, 0, 0, 1, 2, 0, 0, 3)])
+        """
+
+        buffer = memoryview(buffer)
+        offset = _COUNT.size
+        count = _COUNT.unpack_from(buffer)[0]
+        lengths = array("I")
+        lengths.frombytes(buffer[offset:offset + count * lengths.itemsize])
+        offset += count * lengths.itemsize
+        names = []
+        for length in lengths:
+            names.append(bytes(buffer[offset:offset + length]).decode("utf-8"))
+            offset += length
+        count = _COUNT.unpack_from(buffer, offset)[0]
+        offset += _COUNT.size
+        records = list(_RECORD.iter_unpack(
+            buffer[offset:offset + count * _RECORD.size]))
+        return cls(names, records)
+
+    def perturbed(self, seed, replication, jitter=0, patience_spread=0.0,
+                  speed_spread=0.0):
+        """Return a copy of this Scenario with randomly perturbed arrival
+        times, rider patience and driver speeds.
+
+        Each kind of perturbation draws from its own random stream, seeded
+        by (<seed>, <replication>, kind), and every record takes the same
+        position in its stream whatever the other settings are. Two
+        configurations perturbed with the same seed and replication
+        therefore see the same draws (common random numbers).
+
+        @type self: Scenario
+        @type seed: int
+        @type replication: int
+        @type jitter: int
+            Arrival times move by up to this much either way, but never
+            below zero.
+        @type patience_spread: float
+            Patience is scaled by a uniform factor in 1 +- patience_spread.
+        @type speed_spread: float
+            Speed is scaled by a uniform factor in 1 +- speed_spread.
+        @rtype: Scenario
+
+        >>> scenario = Scenario(['Ann', 'Bo'], [(1, 0, 0, 1, 2, 0, 0, 3),
+        ...                                     (0, 9, 1, 0, 0, 5, 5, 10)])
+        >>> first = scenario.perturbed(1, 0, jitter=2, patience_spread=0.5)
+        >>> second = scenario.perturbed(1, 0, jitter=2, patience_spread=0.5)
+        >>> first.records == second.records
+        True
+        >>> [7 <= record[1] <= 11 for record in first.records[1:]]
+        [True]
+        >>> first.records[0][7]
+        3
+        """
+
+        arrivals = Random("{}:{}:arrival".format(seed, replication))
+        patiences = Random("{}:{}:patience".format(seed, replication))
+        speeds = Random("{}:{}:speed".format(seed, replication))
+
+        records = []
+        for kind, timestamp, name, row, column, dest_row, dest_column, value \
+                in self.records:
+            shift = arrivals.randint(-jitter, jitter)
+            patience_factor = patiences.uniform(1 - patience_spread,
+                                                1 + patience_spread)
+            speed_factor = speeds.uniform(1 - speed_spread, 1 + speed_spread)
+            timestamp = max(0, timestamp + shift)
+            if kind == RIDER_REQUEST:
+                value = max(1, round(value * patience_factor))
+            else:
+                value = max(1, round(value * speed_factor))
+            records.append((kind, timestamp, name, row, column, dest_row,
+                            dest_column, value))
+        return Scenario(self.names, records)
+
+    def driver_count(self):
+        """Return the number of drivers in this Scenario.
+
+        @type self: Scenario
+        @rtype: int
+        """
+
+        return sum(1 for record in self.records if record[0] == DRIVER_REQUEST)
+
+    def events(self, fleet_size=None, speed=None):
+        """Return a new list of events for this Scenario, with fresh riders
+        and drivers.
+
+        @type self: Scenario
+        @type fleet_size: int | None
+            If given, only the first <fleet_size> drivers come online.
+        @type speed: int | None
+            If given, every driver has this speed.
+        @rtype: list[Event]
+
+        >>> scenario = Scenario(['Ann', 'Bo', 'Cy'],
+        ...                     [(1, 0, 0, 1, 2, 0, 0, 3),
+        ...                      (0, 1, 1, 0, 0, 5, 5, 9),
+        ...                      (1, 2, 2, 3, 3, 0, 0, 1)])
+        >>> [str(event) for event in scenario.events(fleet_size=1, speed=2)]
+        ['0 -- Driver: Ann: Request a rider', '1 -- Rider: Bo: Request a driver']
+        """
+
+        names = self.names
+        events = []
+        drivers = 0
+        for kind, timestamp, name, row, column, dest_row, dest_column, value \
+                in self.records:
+            if kind == RIDER_REQUEST:
+                events.append(RiderRequest(timestamp, Rider(
+                    names[name], Location(row, column),
+                    Location(dest_row, dest_column), value)))
+            else:
+                if fleet_size is not None and drivers >= fleet_size:
+                    continue
+                drivers += 1
+                events.append(DriverRequest(timestamp, Driver(
+                    names[name], Location(row, column),
+                    value if speed is None else speed)))
+        return events
@@ -1,7 +1,15 @@
-from container import PriorityQueue
+import os
+import pickle
+import sys
+from collections import deque
+from copy import deepcopy
+from time import perf_counter
+from container import EventQueue
 from dispatcher import Dispatcher
-from event import Event, create_event_list
+from event import Event, create_event_list, use_driver_request_pool
 from monitor import Monitor
+from profiler import EventProfile
+from snapshot import write_snapshot, read_snapshot
 
 
 class Simulation:
@@ -10,66 +18,570 @@ class Simulation:
     This is the class which is responsible for setting up and running a
     simulation.
 
-    The API is given to you: your main task is to implement the run
-    method below according to its docstring.
+    run does a whole scenario and returns its report. A run can also be
+    driven piece by piece: schedule adds events, run_until and step do
+    them, and now, pending, status and report tell where the run is.
+    retire_idle_drivers lets drivers leave a long run, snapshot and restore
+    save and resume it, and fork runs several continuations of it in
+    parallel.
 
-    Of course, you may add whatever private attributes and methods you want.
-    But because you should not change the interface, you may not add any public
-    attributes or methods.
-
-    This is the entry point into your program, and in particular is used for
-    auto-testing purposes. This makes it ESSENTIAL that you do not change the
-    interface in any way!
+    run and the report it returns are the entry point used for
+    auto-testing, so their interface must not change.
     """
 
+    # === Attributes ===
+    # @type profile: EventProfile | None
+    #     The per-event-type profile of the run, or None if the simulation
+    #     was not created with profile=True.
+    #
     # === Private Attributes ===
-    # @type _events: PriorityQueue[Event]
-    #     A sequence of events arranged in priority determined by the event
-    #     sorting order.
+    # @type _events: EventQueue | ListEventQueue
+    #     A sequence of events arranged in timestamp order, with ties
+    #     resolved in FIFO order.
     # @type _dispatcher: Dispatcher
     #     The dispatcher associated with the simulation.
+    # @type _now: int
+    #     The current simulated time.
+    # @type _observer: object | None
+    #     An object with begin(event), end(spawned) and tap(monitor)
+    #     methods, such as a TraceRecorder, that is told about every event.
+    # @type _loop: callable
+    #     The loop that does the queued events; swapped for an instrumented
+    #     loop when profiling or observing, so a plain run pays nothing for
+    #     either.
+    # @type _driver_requests: list[DriverRequest]
+    #     The spent DriverRequest events of this simulation, waiting to be
+    #     reissued.
 
-    def __init__(self):
+    def __init__(self, profile=False, dispatcher=None, observer=None,
+                 monitor=None, queue=None):
         """Initialize a Simulation.
 
         @type self: Simulation
+        @type profile: bool
+            Whether to collect per-event-type counters in self.profile.
+        @type dispatcher: Dispatcher | None
+            The dispatcher to use, or None for a new Dispatcher.
+        @type observer: object | None
+            An observer of every event done, such as a TraceRecorder.
+            Observing and profiling cannot be combined.
+        @type monitor: Monitor | None
+            The monitor to use, or None for a new Monitor. A
+            LifecycleMonitor keeps memory bounded in long runs.
+        @type queue: EventQueue | ListEventQueue | None
+            The empty event queue to use, or None for a new EventQueue.
+            Only an EventQueue can be written to a snapshot.
         @rtype: None
         """
 
-        self._events = PriorityQueue()
-        self._dispatcher = Dispatcher()
-        self._monitor = Monitor()
+        if profile and observer is not None:
+            raise ValueError("Cannot profile and observe the same run")
+
+        self._events = EventQueue() if queue is None else queue
+        self._dispatcher = Dispatcher() if dispatcher is None else dispatcher
+        self._monitor = Monitor() if monitor is None else monitor
+        self._now = 0
+        self.profile = None
+        self._observer = observer
+        self._driver_requests = []
+        self._loop = self._process_events
+        if profile:
+            self.profile = EventProfile()
+            self._loop = self._process_profiled
+        elif observer is not None:
+            self._loop = self._process_observed
 
-    def run(self, initial_events):
+    def run(self, initial_events, checkpoint_file=None, checkpoint_every=None):
         """Run the simulation on the list of events in <initial_events>.
 
         Return a dictionary containing statistics of the simulation,
         according to the specifications in the assignment handout.
 
+        If <checkpoint_file> is given, a snapshot of the simulation is
+        written to it every <checkpoint_every> units of simulated time, so
+        the run can be resumed with Simulation.restore after a crash.
+
         @type self: Simulation
         @type initial_events: list[Event]
             An initial list of events.
+        @type checkpoint_file: str | None
+        @type checkpoint_every: int | None
+            Required, and positive, when <checkpoint_file> is given.
         @rtype: dict[str, object]
+
+        >>> Simulation().run([], checkpoint_file="run.snapshot")
+        Traceback (most recent call last):
+        ...
+        ValueError: checkpoint_every must be a positive number of time units
         """
 
+        if checkpoint_file is not None and (checkpoint_every is None
+                                            or checkpoint_every <= 0):
+            raise ValueError(
+                "checkpoint_every must be a positive number of time units")
+
         # Add all initial events to the event queue.
+        self.schedule(initial_events)
+
+        if checkpoint_file is None:
+            self._process()
+        else:
+            while not self._events.is_empty():
+                next_time = self._events.next_timestamp()
+                horizon = (next_time // checkpoint_every + 1) * checkpoint_every
+                self._process(horizon)
+                self.snapshot(checkpoint_file)
+
+        return self._monitor.report()
+
+    def schedule(self, events):
+        """Add <events> to the event queue.
+
+        Events may be added at any point of a run; an event timestamped
+        before the current simulated time is done next.
+
+        @type self: Simulation
+        @type events: list[Event]
+        @rtype: None
+        """
+
+        for event in events:
+            self._events.add(event)
+
+    def run_until(self, time):
+        """Do every queued event at or before simulated time <time>, and
+        advance the simulated time to <time>.
+
+        Return the number of events that were done.
+
+        @type self: Simulation
+        @type time: int
+        @rtype: int
+
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> from rider import Rider
+        >>> from event import DriverRequest, RiderRequest
+        >>> simulation = Simulation()
+        >>> simulation.schedule([
+        ...     DriverRequest(0, Driver('Ann', Location(1, 1), 1)),
+        ...     RiderRequest(2, Rider('Bo', Location(1, 3), Location(4, 3), 5))])
+        >>> simulation.run_until(3)
+        2
+        >>> simulation.now(), simulation.pending()
+        (3, 2)
+        >>> simulation.step()
+        1
+        >>> simulation.now()
+        4
+        >>> simulation.report()["rider_wait_time"]
+        2.0
+        """
+
+        done = self._process(time + 1)
+        if time > self._now:
+            self._now = time
+        return done
+
+    def step(self, count=1):
+        """Do the next <count> queued events, or as many as there are.
+
+        Return the number of events that were done.
+
+        @type self: Simulation
+        @type count: int
+        @rtype: int
+        """
+
+        return self._process(None, count)
+
+    def now(self):
+        """Return the current simulated time.
+
+        @type self: Simulation
+        @rtype: int
+        """
+
+        return self._now
+
+    def pending(self):
+        """Return the number of events waiting in the event queue.
+
+        @type self: Simulation
+        @rtype: int
+        """
+
+        return len(self._events)
+
+    def report(self):
+        """Return the statistics of the simulation so far, in the same form
+        as run.
+
+        @type self: Simulation
+        @rtype: dict[str, object]
+        """
+
+        return self._monitor.report()
+
+    def status(self):
+        """Return the progress of the simulation: the current time, the
+        events queued, the riders waiting, the idle drivers, and the
+        monitor's running totals.
+
+        @type self: Simulation
+        @rtype: dict[str, int]
+
+        >>> Simulation().status()  # doctest: +NORMALIZE_WHITESPACE
+        {'simulated_time': 0, 'queue_depth': 0, 'waiting_riders': 0,
+         'idle_drivers': 0, 'rider_wait_time': 0, 'riders_waited': 0,
+         'driver_distance': 0, 'ride_distance': 0, 'drivers': 0}
+        """
+
+        wait_time, waits, distance, ride_distance, drivers = \
+            self._monitor.totals()
+        return {"simulated_time": self._now,
+                "queue_depth": len(self._events),
+                "waiting_riders": self._dispatcher.waiting_count(),
+                "idle_drivers": len(self._dispatcher.idle_drivers()),
+                "rider_wait_time": wait_time, "riders_waited": waits,
+                "driver_distance": distance, "ride_distance": ride_distance,
+                "drivers": drivers}
+
+    def retire_idle_drivers(self, horizon):
+        """Retire every idle driver whose last activity was more than
+        <horizon> units of simulated time ago, and return how many were
+        retired.
+
+        Retired drivers are no longer offered riders, and a
+        LifecycleMonitor folds them into its statistics and forgets them.
+
+        @type self: Simulation
+        @type horizon: int
+        @rtype: int
+
+        >>> from driver import Driver
+        >>> from location import Location
+        >>> from event import DriverRequest
+        >>> from monitor import LifecycleMonitor
+        >>> simulation = Simulation(monitor=LifecycleMonitor())
+        >>> simulation.schedule([
+        ...     DriverRequest(0, Driver('Ann', Location(1, 1), 1)),
+        ...     DriverRequest(8, Driver('Bo', Location(2, 2), 1))])
+        >>> simulation.run_until(10)
+        2
+        >>> simulation.retire_idle_drivers(5)
+        1
+        >>> print(simulation._monitor)
+        LifecycleMonitor (1 drivers, 0 waiting riders)
+        """
+
+        cutoff = self._now - horizon
+        retired = 0
+        for driver in self._dispatcher.idle_drivers():
+            last_active = self._monitor.last_active(driver.id)
+            if last_active is not None and last_active < cutoff:
+                self._dispatcher.remove_driver(driver)
+                self._monitor.retire(driver.id)
+                retired += 1
+        return retired
+
+    def snapshot(self, filename):
+        """Write the complete state of this simulation to <filename>.
+
+        The file is replaced atomically, so a crash while writing leaves the
+        previous snapshot intact.
+
+        @type self: Simulation
+        @type filename: str
+        @rtype: None
+        """
+
+        partial = filename + ".part"
+        with open(partial, "wb") as file:
+            write_snapshot(file, self._events, self._dispatcher, self._monitor,
+                           self._now)
+        os.replace(partial, filename)
+
+    @classmethod
+    def restore(cls, filename, profile=False):
+        """Return a Simulation restored from the snapshot in <filename>.
+
+        Calling run on the result continues from where the snapshot was
+        taken; pass it any further events, or an empty list.
+
+        @type filename: str
+        @type profile: bool
+        @rtype: Simulation
+        """
+
+        simulation = cls(profile=profile)
+        with open(filename, "rb") as file:
+            simulation._events, simulation._dispatcher, simulation._monitor, \
+                simulation._now = read_snapshot(file,
+                                                simulation._driver_requests)
+        return simulation
+
+    def fork(self, branches, at=None, initial_events=(), processes=None):
+        """Branch this simulation into one child per entry of <branches>,
+        and return the final report of each child, in order.
+
+        The events in <initial_events> are added first, and if <at> is
+        given, events before simulated time <at> are then done.
+        Each child then adds the events of its branch, for example drivers
+        coming online, and runs until its queue is empty. This simulation
+        itself is left at the branch point, so it can be forked again or
+        run on.
+
+        Children are forked processes, so they share the state of the
+        common prefix copy-on-write and run in parallel, at most
+        <processes> at a time. Where os.fork is not available, each child
+        is a deep copy run in this process.
+
+        @type self: Simulation
+        @type branches: list[list[Event]]
+        @type at: int | None
+        @type initial_events: list[Event]
+        @type processes: int | None
+            The most children to run at once, or None for one per core.
+        @rtype: list[dict[str, object]]
+        """
+
         for event in initial_events:
             self._events.add(event)
+        if at is not None:
+            self._process(at)
+
+        if not hasattr(os, "fork"):
+            return [deepcopy(self).run(branch) for branch in branches]
+
+        processes = processes or os.cpu_count() or 1
+        reports = []
+        for start in range(0, len(branches), processes):
+            reports.extend(self._fork_children(
+                branches[start:start + processes]))
+        return reports
 
+    def _fork_children(self, branches):
+        """Run one forked child per branch, and return their reports.
+
+        @type self: Simulation
+        @type branches: list[list[Event]]
+        @rtype: list[dict[str, object]]
+        """
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        children = []
+        for branch in branches:
+            read_end, write_end = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_end)
+                try:
+                    result = (True, self.run(branch))
+                except Exception as error:
+                    result = (False, repr(error))
+                with os.fdopen(write_end, "wb") as pipe:
+                    pickle.dump(result, pipe)
+                os._exit(0)
+            os.close(write_end)
+            children.append((pid, read_end))
+
+        reports = []
+        for pid, read_end in children:
+            with os.fdopen(read_end, "rb") as pipe:
+                succeeded, result = pickle.load(pipe)
+            os.waitpid(pid, 0)
+            if not succeeded:
+                raise RuntimeError("Forked simulation failed: " + result)
+            reports.append(result)
+        return reports
+
+    def _process(self, until=None, limit=None):
+        """Do events with self._loop, recycling DriverRequest events
+        through this simulation's own pool. Return the number of events
+        that were done.
+
+        @type self: Simulation
+        @type until: int | None
+        @type limit: int | None
+        @rtype: int
+        """
+
+        previous = use_driver_request_pool(self._driver_requests)
+        try:
+            return self._loop(until, limit)
+        finally:
+            use_driver_request_pool(previous)
+
+    def _process_events(self, until=None, limit=None):
+        """Do events until the event queue is empty, until the next event
+        is at or after the simulated time <until>, or until <limit> events
+        have been done. Return the number of events that were done.
+
+        @type self: Simulation
+        @type until: int | None
+        @type limit: int | None
+        @rtype: int
+        """
 
         # Until there are no more events, remove an event
         # from the event queue and do it. Add any returned
         # events to the event queue.
+        #
+        # An event returned for the current time, such as the DriverRequest
+        # after a Dropoff, goes into a FIFO lane instead. Everything queued
+        # for the current time was added before it, so the lane is only run
+        # once the queue holds nothing more for now; that is exactly the
+        # order the queue would have given.
+
+        events = self._events
+        lane = deque()
+        done = 0
+        now = self._now
+        while done != limit:
+            if lane and (events.is_empty() or events.next_timestamp() > now):
+                event_to_do = lane.popleft()
+            elif events.is_empty():
+                break
+            elif until is not None and events.next_timestamp() >= until:
+                break
+            else:
+                event_to_do = events.remove()
+                if event_to_do.timestamp > now:
+                    now = event_to_do.timestamp
+                    self._now = now
 
-        while not self._events.is_empty():
-            event_to_do = (self._events.remove())
             returned_events = event_to_do.do(self._dispatcher, self._monitor)
+            done += 1
 
             if returned_events != None:
                 for event in returned_events:
-                    self._events.add(event)
+                    if event.timestamp == now:
+                        lane.append(event)
+                    else:
+                        events.add(event)
 
-        return self._monitor.report()
+        self._requeue(lane)
+        return done
+
+    def _requeue(self, lane):
+        """Return the events left in <lane> to the event queue, in order.
+
+        @type self: Simulation
+        @type lane: deque[Event]
+        @rtype: None
+        """
+
+        for event in lane:
+            self._events.add(event)
+
+    def _process_profiled(self, until=None, limit=None):
+        """Do events like _process_events, recording the time spent on each
+        one in self.profile. Time spent on the same-time lane counts as
+        queue time.
+
+        @type self: Simulation
+        @type until: int | None
+        @type limit: int | None
+        @rtype: int
+        """
+
+        events = self._events
+        profile = self.profile
+        clock = perf_counter
+        lane = deque()
+        last_timestamp = None
+        done = 0
+        now = self._now
+        loop_start = clock()
+
+        while done != limit:
+            started = clock()
+            if lane and (events.is_empty() or events.next_timestamp() > now):
+                event_to_do = lane.popleft()
+            elif events.is_empty():
+                break
+            elif until is not None and events.next_timestamp() >= until:
+                break
+            else:
+                event_to_do = events.remove()
+            removed = clock()
+            profile.queue_time += removed - started
+
+            if event_to_do.timestamp != last_timestamp:
+                last_timestamp = event_to_do.timestamp
+                profile.sample_queue(last_timestamp,
+                                     len(events) + len(lane) + 1)
+                if last_timestamp > now:
+                    now = last_timestamp
+                    self._now = now
+
+            returned_events = event_to_do.do(self._dispatcher, self._monitor)
+            finished = clock()
+            done += 1
+
+            spawned = 0
+            if returned_events != None:
+                spawned = len(returned_events)
+                for event in returned_events:
+                    if event.timestamp == now:
+                        lane.append(event)
+                    else:
+                        events.add(event)
+                profile.queue_time += clock() - finished
+
+            profile.record(type(event_to_do).__name__, finished - removed,
+                           spawned)
+
+        self._requeue(lane)
+        profile.wall_time += clock() - loop_start
+        return done
+
+    def _process_observed(self, until=None, limit=None):
+        """Do events like _process_events, telling self._observer about
+        each one and about the notifications it gives the monitor.
+
+        @type self: Simulation
+        @type until: int | None
+        @type limit: int | None
+        @rtype: int
+        """
+
+        events = self._events
+        observer = self._observer
+        monitor = observer.tap(self._monitor)
+        lane = deque()
+        done = 0
+        now = self._now
+
+        while done != limit:
+            if lane and (events.is_empty() or events.next_timestamp() > now):
+                event_to_do = lane.popleft()
+            elif events.is_empty():
+                break
+            elif until is not None and events.next_timestamp() >= until:
+                break
+            else:
+                event_to_do = events.remove()
+                if event_to_do.timestamp > now:
+                    now = event_to_do.timestamp
+                    self._now = now
+
+            observer.begin(event_to_do)
+            returned_events = event_to_do.do(self._dispatcher, monitor)
+            observer.end(returned_events)
+            done += 1
+
+            if returned_events != None:
+                for event in returned_events:
+                    if event.timestamp == now:
+                        lane.append(event)
+                    else:
+                        events.add(event)
+
+        self._requeue(lane)
+        return done
 
 
 if __name__ == "__main__":
@@ -0,0 +1,337 @@
+"""
+The snapshot module writes the complete state of a simulation to a compact
+binary file, and reads it back.
+
+A snapshot holds the simulated time, the pending event queue, the dispatcher's drivers and
+waiting riders, and the monitor's recorded activities, or, for a
+LifecycleMonitor, its running totals and the state of its live riders and
+drivers. Riders and drivers are written once each to fixed-width tables
+and referred to by index, so shared references (a rider held by both a Pickup and a Cancellation, a
+driver held by the dispatcher and an event) come back as shared objects.
+All identifiers go into a single string table; integer handles from a
+Registry are written as their decimal strings and flagged as such.
+
+=== Constants ===
+@type MAGIC: bytes
+    The bytes every snapshot file starts with.
+"""
+
+from array import array
+from struct import Struct
+
+from container import EventQueue
+from dispatcher import Dispatcher
+from driver import Driver
+from event import RiderRequest, DriverRequest, Cancellation, Pickup, \
+    Dropoff, EndShift
+from location import Location
+from monitor import Monitor, LifecycleMonitor, RIDER, DRIVER, REQUEST, \
+    CANCEL, PICKUP, DROPOFF
+from rider import Rider, WAITING, CANCELLED, SATISFIED
+
+MAGIC = b"TAXISNP\x04"
+
+_COUNT = Struct("<Q")
+_TIME = Struct("<q")
+# name, row, column, speed, destination row, destination column, flags
+_DRIVER = Struct("<Iiiiiib")
+# name, origin row, origin column, destination row, destination column,
+# patience, status
+_RIDER = Struct("<Iiiiiib")
+# kind, timestamp, sequence, rider index, driver index, pooled
+_EVENT = Struct("<bqqiib")
+# category, name, timestamp, description, row, column
+_ACTIVITY = Struct("<bIqbii")
+# rider wait time, waits, driver distance, ride distance, retired drivers
+_TOTALS = Struct("<qqqqq")
+# name, request time
+_WAITING = Struct("<Iq")
+# name, row, column, description, time
+_LAST = Struct("<Iiibq")
+
+_EVENT_KINDS = [RiderRequest, DriverRequest, Cancellation, Pickup, Dropoff,
+                EndShift]
+_STATUSES = [WAITING, CANCELLED, SATISFIED]
+_CATEGORIES = [RIDER, DRIVER]
+_DESCRIPTIONS = [REQUEST, CANCEL, PICKUP, DROPOFF]
+
+# Driver flags.
+_IDLE = 1
+_HAS_DESTINATION = 2
+_OFF_SHIFT = 4
+
+
+class _Strings:
+    """A table of the identifiers written to a snapshot.
+
+    === Attributes ===
+    @type names: list[str]
+        The identifiers, in the order they were added.
+    @type index: dict[str, int]
+        The position of each identifier in names.
+    """
+
+    def __init__(self):
+        """Initialize an empty _Strings table.
+
+        @type self: _Strings
+        @rtype: None
+        """
+
+        self.names = []
+        self.index = {}
+
+    def add(self, name):
+        """Return the index of <name>, adding it if it is new.
+
+        @type self: _Strings
+        @type name: str
+        @rtype: int
+        """
+
+        position = self.index.get(name)
+        if position is None:
+            position = len(self.names)
+            self.index[name] = position
+            self.names.append(name)
+        return position
+
+
+def write_snapshot(file, events, dispatcher, monitor, now=0):
+    """Write the state of a simulation to the binary <file>.
+
+    @type file: io.BufferedIOBase
+    @type events: EventQueue
+    @type dispatcher: Dispatcher
+    @type monitor: Monitor
+    @type now: int
+        The simulated time.
+    @rtype: None
+    """
+
+    strings = _Strings()
+    drivers, driver_index = [], {}
+    riders, rider_index = [], {}
+
+    def add_driver(driver):
+        if driver is None:
+            return -1
+        position = driver_index.get(id(driver))
+        if position is None:
+            position = len(drivers)
+            driver_index[id(driver)] = position
+            drivers.append(driver)
+        return position
+
+    def add_rider(rider):
+        if rider is None:
+            return -1
+        position = rider_index.get(id(rider))
+        if position is None:
+            position = len(riders)
+            rider_index[id(rider)] = position
+            riders.append(rider)
+        return position
+
+    event_records = []
+    for timestamp, sequence, event in events._items:
+        kind = _EVENT_KINDS.index(type(event))
+        event_records.append(_EVENT.pack(
+            kind, timestamp, sequence,
+            add_rider(getattr(event, "rider", None)),
+            add_driver(getattr(event, "driver", None)),
+            getattr(event, "_pool", None) is not None))
+
+    available = array("i", [add_driver(driver)
+                            for driver in dispatcher._available_drivers])
+    waiting = array("i", [add_rider(rider)
+                          for rider in dispatcher._waiting_riders.values()])
+
+    driver_records = []
+    for driver in drivers:
+        flags = _IDLE if driver.is_idle else 0
+        if driver.off_shift:
+            flags |= _OFF_SHIFT
+        destination = driver.destination
+        if destination is not None:
+            flags |= _HAS_DESTINATION
+        else:
+            destination = driver.location
+        driver_records.append(_DRIVER.pack(
+            strings.add(driver.id), driver.location.row,
+            driver.location.column, driver.speed, destination.row,
+            destination.column, flags))
+
+    rider_records = []
+    for rider in riders:
+        rider_records.append(_RIDER.pack(
+            strings.add(rider.id), rider.origin.row, rider.origin.column,
+            rider.destination.row, rider.destination.column, rider.patience,
+            _STATUSES.index(rider.status)))
+
+    activity_records = []
+    for category, by_identifier in monitor._activities.items():
+        category_code = _CATEGORIES.index(category)
+        for identifier, activities in by_identifier.items():
+            name = strings.add(identifier)
+            for activity in activities:
+                activity_records.append(_ACTIVITY.pack(
+                    category_code, name, activity.time,
+                    _DESCRIPTIONS.index(activity.description),
+                    activity.location.row, activity.location.column))
+
+    lifecycle = isinstance(monitor, LifecycleMonitor)
+    lifecycle_records = []
+    if lifecycle:
+        lifecycle_records.append(_TOTALS.pack(
+            monitor._wait_time, monitor._waits, monitor._total_distance,
+            monitor._ride_distance, monitor._retired))
+        waiting_records = [_WAITING.pack(strings.add(identifier), time)
+                           for identifier, time in monitor._waiting.items()]
+        lifecycle_records.append(_COUNT.pack(len(waiting_records)))
+        lifecycle_records.extend(waiting_records)
+        lifecycle_records.append(_COUNT.pack(len(monitor._drivers)))
+        for identifier, (location, description, time) \
+                in monitor._drivers.items():
+            lifecycle_records.append(_LAST.pack(
+                strings.add(identifier), location.row, location.column,
+                _DESCRIPTIONS.index(description), time))
+
+    handles = any(isinstance(name, int) for name in strings.names)
+    encoded = [str(name).encode("utf-8") for name in strings.names]
+
+    file.write(MAGIC)
+    file.write(_TIME.pack(now))
+    file.write(_COUNT.pack(handles))
+    file.write(_COUNT.pack(len(encoded)))
+    file.write(array("I", [len(name) for name in encoded]).tobytes())
+    file.write(b"".join(encoded))
+    for records in (driver_records, rider_records):
+        file.write(_COUNT.pack(len(records)))
+        file.write(b"".join(records))
+    file.write(_COUNT.pack(events._sequence))
+    file.write(_COUNT.pack(len(event_records)))
+    file.write(b"".join(event_records))
+    for indices in (available, waiting):
+        file.write(_COUNT.pack(len(indices)))
+        file.write(indices.tobytes())
+    file.write(_COUNT.pack(len(activity_records)))
+    file.write(b"".join(activity_records))
+    file.write(_COUNT.pack(lifecycle))
+    file.write(b"".join(lifecycle_records))
+
+
+def read_snapshot(file, pool=None):
+    """Return the (events, dispatcher, monitor, simulated time) stored in
+    the binary <file>.
+
+    @type file: io.BufferedIOBase
+    @type pool: list[DriverRequest] | None
+        The pool that reissued DriverRequest events go back to once they
+        are done, or None to not recycle them.
+    @rtype: (EventQueue, Dispatcher, Monitor, int)
+
+    >>> from io import BytesIO
+    >>> events = EventQueue()
+    >>> events.add(DriverRequest(2, Driver('Ann', Location(1, 2), 1)))
+    >>> file = BytesIO()
+    >>> write_snapshot(file, events, Dispatcher(), Monitor(), 1)
+    >>> _ = file.seek(0)
+    >>> restored, _, _, now = read_snapshot(file)
+    >>> event = restored.remove()
+    >>> print(now, event.timestamp, event.driver, event.driver.location)
+    1 2 Driver: Ann Location Row: 1, Column: 2
+    """
+
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a simulation snapshot")
+    now = _TIME.unpack(file.read(_TIME.size))[0]
+
+    def read_count():
+        return _COUNT.unpack(file.read(_COUNT.size))[0]
+
+    def read_records(record):
+        return record.iter_unpack(file.read(read_count() * record.size))
+
+    def read_indices():
+        indices = array("i")
+        indices.frombytes(file.read(read_count() * indices.itemsize))
+        return indices
+
+    handles = read_count()
+    lengths = array("I")
+    lengths.frombytes(file.read(read_count() * lengths.itemsize))
+    blob = file.read(sum(lengths))
+    names = []
+    start = 0
+    for length in lengths:
+        names.append(blob[start:start + length].decode("utf-8"))
+        start += length
+    if handles:
+        names = [int(name) for name in names]
+
+    drivers = []
+    for name, row, column, speed, dest_row, dest_column, flags \
+            in read_records(_DRIVER):
+        driver = Driver(names[name], Location(row, column), speed)
+        if flags & _HAS_DESTINATION:
+            driver.destination = Location(dest_row, dest_column)
+        driver.is_idle = bool(flags & _IDLE)
+        driver.off_shift = bool(flags & _OFF_SHIFT)
+        drivers.append(driver)
+
+    riders = []
+    for name, row, column, dest_row, dest_column, patience, status \
+            in read_records(_RIDER):
+        rider = Rider(names[name], Location(row, column),
+                      Location(dest_row, dest_column), patience)
+        rider.status = _STATUSES[status]
+        riders.append(rider)
+
+    events = EventQueue()
+    events._sequence = read_count()
+    for kind, timestamp, sequence, rider, driver, pooled \
+            in read_records(_EVENT):
+        event_class = _EVENT_KINDS[kind]
+        if event_class is DriverRequest:
+            event = DriverRequest(timestamp, drivers[driver])
+            event._pool = pool if pooled else None
+        elif event_class is Dropoff:
+            event = Dropoff(timestamp, drivers[driver], riders[rider])
+        elif event_class is Pickup:
+            event = Pickup(timestamp, riders[rider], drivers[driver])
+        elif event_class is EndShift:
+            event = EndShift(timestamp, drivers[driver])
+        else:
+            event = event_class(timestamp, riders[rider])
+        # The heap was written in heap order, so it is still a valid heap.
+        events._items.append((timestamp, sequence, event))
+
+    dispatcher = Dispatcher()
+    dispatcher._available_drivers = [drivers[i] for i in read_indices()]
+    dispatcher._registered = {driver.id
+                              for driver in dispatcher._available_drivers}
+    for i in read_indices():
+        dispatcher._waiting_riders[id(riders[i])] = riders[i]
+
+    # Replaying the activities rebuilds the monitor's running totals too.
+    activities = list(read_records(_ACTIVITY))
+    if not read_count():
+        monitor = Monitor()
+        for category, name, timestamp, description, row, column \
+                in activities:
+            monitor.notify(timestamp, _CATEGORIES[category],
+                           _DESCRIPTIONS[description], names[name],
+                           Location(row, column))
+        return events, dispatcher, monitor, now
+
+    monitor = LifecycleMonitor()
+    monitor._wait_time, monitor._waits, monitor._total_distance, \
+        monitor._ride_distance, monitor._retired = \
+        _TOTALS.unpack(file.read(_TOTALS.size))
+    for name, time in read_records(_WAITING):
+        monitor._waiting[names[name]] = time
+    for name, row, column, description, time in read_records(_LAST):
+        monitor._drivers[names[name]] = (Location(row, column),
+                                         _DESCRIPTIONS[description], time)
+    return events, dispatcher, monitor, now
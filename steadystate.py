@@ -0,0 +1,339 @@
+"""
+The steadystate module stops a run once its statistics have settled, and
+estimates them with their precision.
+
+SteadyStateMonitor is a LifecycleMonitor that also records a series of
+observations: the wait of each rider, and the ride distance and total
+distance driven for each ride. Each series is kept as the means of
+consecutive batches of five observations.
+
+The warm-up of a series is found with MSER-5: the number of leading
+batches whose removal leaves the remaining batch means with the least
+variance about their mean, per remaining batch. The remaining batches are
+then grouped into a fixed number of larger batches, whose means are
+treated as independent to give a confidence interval. A series is settled
+once its warm-up is less than half of it and its interval is narrower
+than the precision asked for.
+
+The report's per-driver distances grow with the length of a run, so the
+estimates are of the distances per ride rather than per driver.
+"""
+
+from math import sqrt
+
+from event import create_event_list
+from location import manhattan_distance
+from monitor import LifecycleMonitor, RIDER, PICKUP, DROPOFF
+from replication import Estimate, t_quantile
+from simulation import Simulation
+
+# The number of observations in a batch for MSER.
+BATCH = 5
+
+# The series a SteadyStateMonitor records.
+SERIES = ("rider_wait_time", "ride_distance", "distance_per_ride")
+
+
+class SteadyStateMonitor(LifecycleMonitor):
+    """A LifecycleMonitor that records series of observations and tells
+    when they have reached a steady state.
+
+    === Attributes ===
+    @type precision: float
+        The largest half width of a settled estimate, relative to its mean.
+    @type confidence: float
+    @type batches: int
+        The number of batches the settled part of a series is grouped into
+        for its confidence interval.
+    @type min_observations: int
+        The fewest observations of each series after the warm-up.
+    """
+
+    # === Private Attributes ===
+    # @type _means: dict[str, list[float]]
+    #     The batch means of each series.
+    # @type _partial: dict[str, list[float]]
+    #     The observations of each series not yet in a full batch.
+    # @type _legs: dict[str, int]
+    #     The distance each driver has driven since their last dropoff.
+    # @type _checked: int
+    #     The number of batch means when the series were last checked.
+    # @type _settled: dict[str, Estimate] | None
+    #     The estimates, once every series has settled.
+
+    def __init__(self, precision=0.05, confidence=0.95, batches=20,
+                 min_observations=500):
+        """Initialize a SteadyStateMonitor.
+
+        @type self: SteadyStateMonitor
+        @type precision: float
+        @type confidence: float
+        @type batches: int
+        @type min_observations: int
+        @rtype: None
+
+        >>> SteadyStateMonitor(batches=1)
+        Traceback (most recent call last):
+        ...
+        ValueError: batches must be at least 2
+        """
+
+        if batches < 2:
+            raise ValueError("batches must be at least 2")
+        super().__init__()
+        self.precision = precision
+        self.confidence = confidence
+        self.batches = batches
+        self.min_observations = min_observations
+        self._means = {name: [] for name in SERIES}
+        self._partial = {name: [] for name in SERIES}
+        self._legs = {}
+        self._checked = 0
+        self._settled = None
+
+    def notify(self, timestamp, category, description, identifier, location):
+        """Notify the monitor of the activity, and record any observation
+        it completes.
+
+        @type self: SteadyStateMonitor
+        @type timestamp: int
+        @type category: DRIVER | RIDER
+        @type description: REQUEST | CANCEL | PICKUP | DROPOFF
+        @type identifier: str | int
+        @type location: Location
+        @rtype: None
+        """
+
+        if category == RIDER:
+            requested = self._waiting.get(identifier)
+            if requested is not None:
+                self._observe("rider_wait_time", timestamp - requested)
+        else:
+            last = self._drivers.get(identifier)
+            if last is not None:
+                distance = manhattan_distance(last[0], location)
+                leg = self._legs.get(identifier, 0) + distance
+                if description == DROPOFF:
+                    if last[1] == PICKUP:
+                        self._observe("ride_distance", distance)
+                    self._observe("distance_per_ride", leg)
+                    leg = 0
+                self._legs[identifier] = leg
+        super().notify(timestamp, category, description, identifier,
+                       location)
+
+    def retire(self, identifier):
+        """Fold the driver <identifier> into the statistics, and forget
+        them.
+
+        @type self: SteadyStateMonitor
+        @type identifier: str | int
+        @rtype: None
+        """
+
+        super().retire(identifier)
+        self._legs.pop(identifier, None)
+
+    def settled(self):
+        """Return the estimate of each series if every series has reached a
+        steady state with the precision asked for, or None if not yet.
+
+        The series are only checked again once they have grown by a tenth,
+        so asking often is cheap.
+
+        @type self: SteadyStateMonitor
+        @rtype: dict[str, Estimate] | None
+        """
+
+        if self._settled is not None:
+            return self._settled
+        size = min(len(means) for means in self._means.values())
+        if size * BATCH < self.min_observations or size < self._checked * 1.1:
+            return None
+        self._checked = size
+
+        estimates = {}
+        for name in SERIES:
+            estimate = self.estimate(name)
+            if estimate is None or estimate.half_width \
+                    > self.precision * abs(estimate.mean):
+                return None
+            estimates[name] = estimate
+        self._settled = estimates
+        return estimates
+
+    def estimate(self, name):
+        """Return the Estimate of the steady-state mean of series <name>,
+        or None if it is still warming up or too short. A series is too
+        short if the part after the warm-up has fewer than min_observations
+        observations, or fewer batch means than self.batches.
+
+        @type self: SteadyStateMonitor
+        @type name: str
+        @rtype: Estimate | None
+
+        >>> from location import Location
+        >>> monitor = SteadyStateMonitor(min_observations=100)
+        >>> for i in range(300):
+        ...     monitor.notify(i, RIDER, "request", i, Location(0, 0))
+        ...     monitor.notify(i + 2 + i % 5, RIDER, PICKUP, i, Location(0, 0))
+        >>> print(monitor.estimate("rider_wait_time"))
+        4.0 +- 0.0 (20 replications)
+        >>> monitor = SteadyStateMonitor(min_observations=10)
+        >>> for i in range(60):
+        ...     monitor.notify(i, RIDER, "request", i, Location(0, 0))
+        ...     monitor.notify(i + 4, RIDER, PICKUP, i, Location(0, 0))
+        >>> print(monitor.estimate("rider_wait_time"))
+        None
+        """
+
+        means = self._means[name]
+        truncation = mser(means)
+        if truncation is None:
+            return None
+        settled = means[truncation:]
+        if len(settled) < self.batches \
+                or len(settled) * BATCH < self.min_observations:
+            return None
+        return batch_means(settled, self.batches, self.confidence)
+
+    def _observe(self, name, value):
+        """Add <value> to series <name>.
+
+        @type self: SteadyStateMonitor
+        @type name: str
+        @type value: int
+        @rtype: None
+        """
+
+        partial = self._partial[name]
+        partial.append(value)
+        if len(partial) == BATCH:
+            self._means[name].append(sum(partial) / BATCH)
+            partial.clear()
+
+
+def mser(means):
+    """Return the number of leading batches of <means> to drop as warm-up,
+    or None if the warm-up may not be over.
+
+    The truncation minimizes the variance of the remaining batch means
+    about their mean, divided by the number remaining; if the best
+    truncation drops half of the batches or more, the warm-up is taken to
+    be still going.
+
+    @type means: list[float]
+    @rtype: int | None
+
+    >>> mser([9, 7, 5, 3] + [1, 2] * 10)
+    4
+    >>> print(mser([1, 2, 3, 4, 5, 6]))
+    None
+    """
+
+    count = len(means)
+    if count < 2:
+        return None
+    # Sums of the means and of their squares from each position to the end.
+    total = [0.0] * (count + 1)
+    squares = [0.0] * (count + 1)
+    for position in range(count - 1, -1, -1):
+        total[position] = total[position + 1] + means[position]
+        squares[position] = squares[position + 1] + means[position] ** 2
+
+    best, best_statistic = None, None
+    for truncation in range(count // 2 + 1):
+        remaining = count - truncation
+        mean = total[truncation] / remaining
+        statistic = (squares[truncation] - remaining * mean * mean) \
+            / remaining ** 2
+        if best_statistic is None or statistic < best_statistic - 1e-12:
+            best, best_statistic = truncation, statistic
+    if best >= count // 2:
+        return None
+    return best
+
+
+def batch_means(means, batches, confidence=0.95):
+    """Return the Estimate of the mean of <means>, grouped into <batches>
+    batches whose means are taken to be independent.
+
+    Leading means that do not fill a batch are dropped.
+
+    Precondition: len(means) >= batches >= 2.
+
+    @type means: list[float]
+    @type batches: int
+    @type confidence: float
+    @rtype: Estimate
+
+    >>> result = batch_means([1.0, 3.0] * 10, 5)
+    >>> result.mean, result.half_width
+    (2.0, 0.0)
+    """
+
+    size = len(means) // batches
+    start = len(means) - size * batches
+    grouped = [sum(means[start + i * size:start + (i + 1) * size]) / size
+               for i in range(batches)]
+    mean = sum(grouped) / batches
+    variance = sum((value - mean) ** 2 for value in grouped) / (batches - 1)
+    return Estimate(mean, t_quantile((1 + confidence) / 2, batches - 1)
+                    * sqrt(variance / batches), batches)
+
+
+def run_to_steady_state(initial_events, monitor=None, check_every=1000,
+                        dispatcher=None):
+    """Run <initial_events> until the series of <monitor> reach a steady
+    state, or until there are no events left.
+
+    Return the estimates, or None if the run ended before settling, with
+    the report and the simulated time at which the run stopped.
+
+    @type initial_events: list[Event]
+    @type monitor: SteadyStateMonitor | None
+        The monitor to use, or None for one with the default precision.
+    @type check_every: int
+        The number of events between checks.
+    @type dispatcher: Dispatcher | None
+    @rtype: (dict[str, Estimate] | None, dict[str, object], int)
+
+    >>> from workload import generate
+    >>> estimates, report, time = run_to_steady_state(
+    ...     generate(20000, 60, seed=1), SteadyStateMonitor(precision=0.1))
+    >>> estimates is not None and time < 40000
+    True
+    """
+
+    monitor = SteadyStateMonitor() if monitor is None else monitor
+    simulation = Simulation(dispatcher=dispatcher, monitor=monitor)
+    simulation.schedule(initial_events)
+    estimates = None
+    while estimates is None and simulation.step(check_every):
+        estimates = monitor.settled()
+    return estimates, simulation.report(), simulation.now()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run a simulation until it reaches a steady state.")
+    parser.add_argument("filename", nargs="?", default="events.txt")
+    parser.add_argument("--precision", type=float, default=0.05)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--check-every", type=int, default=1000)
+    arguments = parser.parse_args()
+
+    estimates, report, time = run_to_steady_state(
+        create_event_list(arguments.filename),
+        SteadyStateMonitor(arguments.precision, arguments.confidence),
+        arguments.check_every)
+    if estimates is None:
+        print("no steady state before the events ran out at time", time)
+    else:
+        print("steady state by time", time)
+        for name, estimate in estimates.items():
+            print("{}: {:.3f} +- {:.3f}".format(name, estimate.mean,
+                                               estimate.half_width))
+    print(report)
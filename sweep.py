@@ -0,0 +1,169 @@
+"""
+The sweep module runs one scenario under many configurations in parallel,
+across a pool of worker processes.
+
+The scenario is parsed once, encoded into a block of shared memory, and
+decoded once by each worker when it starts; tasks only carry their
+configuration. Each configuration is a dictionary with any of the keys
+
+    fleet_size: int     only the first fleet_size drivers come online
+    speed: int          every driver has this speed
+    dispatcher: type    the Dispatcher class to use
+
+and, to run a randomized replication of the scenario (see
+Scenario.perturbed),
+
+    seed: int, replication: int, jitter: int,
+    patience_spread: float, speed_spread: float
+
+Each configuration produces one row of the result table: the
+configuration followed by the Monitor report of its run.
+"""
+
+from itertools import product
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+from dispatcher import Dispatcher
+from event import create_event_list
+from scenario import Scenario
+from simulation import Simulation
+
+# The scenario of the sweep, decoded from shared memory when a worker
+# process starts.
+_scenario = None
+
+
+def run_config(scenario, config):
+    """Return the report of a simulation of <scenario> under <config>.
+
+    @type scenario: Scenario
+    @type config: dict[str, object]
+    @rtype: dict[str, object]
+    """
+
+    if "seed" in config:
+        scenario = scenario.perturbed(
+            config["seed"], config.get("replication", 0),
+            config.get("jitter", 0), config.get("patience_spread", 0.0),
+            config.get("speed_spread", 0.0))
+    events = scenario.events(config.get("fleet_size"), config.get("speed"))
+    dispatcher = config.get("dispatcher", Dispatcher)()
+    return Simulation(dispatcher=dispatcher).run(events)
+
+
+def _attach(name, size):
+    """Decode the scenario in the shared memory block <name> for this
+    worker process.
+
+    @type name: str
+    @type size: int
+    @rtype: None
+    """
+
+    global _scenario
+    memory = SharedMemory(name)
+    try:
+        _scenario = Scenario.from_buffer(memory.buf[:size])
+    finally:
+        memory.close()
+
+
+def _run_task(task):
+    """Return (index, report) for the indexed configuration <task>.
+
+    @type task: (int, dict[str, object])
+    @rtype: (int, dict[str, object])
+    """
+
+    index, config = task
+    return index, run_config(_scenario, config)
+
+
+def iter_sweep(events, configs, processes=None):
+    """Run the scenario of <events> under each of <configs> and yield a
+    result row for each run as soon as it completes.
+
+    @type events: list[Event] | Scenario
+    @type configs: list[dict[str, object]]
+    @type processes: int | None
+        The number of worker processes, or None for one per core.
+    @rtype: generator[dict[str, object]]
+    """
+
+    scenario = events if isinstance(events, Scenario) \
+        else Scenario.from_events(events)
+    data = scenario.to_bytes()
+    memory = SharedMemory(create=True, size=len(data))
+    try:
+        memory.buf[:len(data)] = data
+        with Pool(processes, initializer=_attach,
+                  initargs=(memory.name, len(data))) as pool:
+            for index, report in pool.imap_unordered(_run_task,
+                                                     enumerate(configs)):
+                row = dict(configs[index])
+                row.update(report)
+                yield row
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def run_sweep(events, configs, processes=None):
+    """Return the result table of a sweep, with rows in completion order.
+
+    @type events: list[Event] | Scenario
+    @type configs: list[dict[str, object]]
+    @type processes: int | None
+    @rtype: list[dict[str, object]]
+    """
+
+    return list(iter_sweep(events, configs, processes))
+
+
+def grid(**values):
+    """Return the configurations for every combination of <values>.
+
+    @type values: dict[str, list[object]]
+    @rtype: list[dict[str, object]]
+
+    >>> grid(fleet_size=[10, 20], speed=[1])
+    [{'fleet_size': 10, 'speed': 1}, {'fleet_size': 20, 'speed': 1}]
+    """
+
+    keys = list(values)
+    return [dict(zip(keys, combination))
+            for combination in product(*(values[key] for key in keys))]
+
+
+def format_row(row):
+    """Return a one-line string representation of a result row.
+
+    @type row: dict[str, object]
+    @rtype: str
+
+    >>> format_row({'fleet_size': 10, 'dispatcher': Dispatcher,
+    ...             'rider_wait_time': 1.5})
+    'fleet_size=10 dispatcher=Dispatcher rider_wait_time=1.5'
+    """
+
+    return " ".join("{}={}".format(key, getattr(value, "__name__", value))
+                    for key, value in row.items())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run a scenario under many configurations.")
+    parser.add_argument("filename", nargs="?", default="events.txt")
+    parser.add_argument("--fleet-size", type=int, nargs="+", default=[None])
+    parser.add_argument("--speed", type=int, nargs="+", default=[None])
+    parser.add_argument("--processes", type=int, default=None)
+    arguments = parser.parse_args()
+
+    for result in iter_sweep(create_event_list(arguments.filename),
+                             grid(fleet_size=arguments.fleet_size,
+                                  speed=arguments.speed),
+                             arguments.processes):
+        print(format_row(result))
@@ -0,0 +1,327 @@
+"""
+The tracelog module writes a human-readable log of a simulation, as text
+or as JSON lines.
+
+A TraceSink is passed to a Simulation as its observer. For every event
+that passes its filters it captures a tuple of the event's class,
+timestamp, rider and driver; at higher levels also the dispatch decision
+and the notifications the event gave the monitor. The tuples are handed to
+a writer in batches, and a background thread formats and writes them, so
+the simulation never formats a string. A simulation without a sink runs
+its plain loop and pays nothing.
+
+=== Constants ===
+@type EVENTS: int
+    Log every event done.
+@type DECISIONS: int
+    Also log the driver or rider each event was matched with.
+@type NOTIFICATIONS: int
+    Also log the notifications each event gave the monitor.
+"""
+
+import json
+from queue import Queue
+from threading import Thread
+
+from event import Pickup
+from recorder import Tap
+
+EVENTS = 1
+DECISIONS = 2
+NOTIFICATIONS = 3
+
+
+class TraceSink:
+    """A Simulation observer that logs the events done to a writer.
+
+    === Attributes ===
+    @type level: int
+        EVENTS, DECISIONS or NOTIFICATIONS.
+    @type logged: int
+        The number of events logged so far.
+    """
+
+    # === Private Attributes ===
+    # @type _writer: _BatchWriter
+    # @type _types: set[str] | None
+    #     The class names of the events to log, or None for all.
+    # @type _actors: set[str] | None
+    #     The riders and drivers whose events to log, or None for all.
+    # @type _record: tuple | None
+    #     The captured event being done, or None if it is filtered out.
+    # @type _notes: list[tuple]
+    #     The notifications given by the event being done.
+
+    def __init__(self, writer, level=EVENTS, types=None, actors=None):
+        """Initialize a TraceSink.
+
+        @type self: TraceSink
+        @type writer: _BatchWriter
+            A TextWriter or JsonLinesWriter.
+        @type level: int
+        @type types: list[str] | None
+            The class names of the events to log, or None for all.
+        @type actors: list[str] | None
+            The ids of the riders and drivers whose events to log, or None
+            for all.
+        @rtype: None
+        """
+
+        self.level = level
+        self.logged = 0
+        self._writer = writer
+        self._types = None if types is None else set(types)
+        self._actors = None if actors is None else set(actors)
+        self._record = None
+        self._notes = []
+
+    def tap(self, monitor):
+        """Return the monitor for events to notify: <monitor> itself, or a
+        stand-in that also captures the notifications if they are logged.
+
+        @type self: TraceSink
+        @type monitor: Monitor
+        @rtype: Monitor | Tap
+        """
+
+        if self.level < NOTIFICATIONS:
+            return monitor
+        return Tap(self._notes, monitor)
+
+    def begin(self, event):
+        """Capture <event>, which is about to be done, if it passes the
+        filters.
+
+        @type self: TraceSink
+        @type event: Event
+        @rtype: None
+        """
+
+        kind = type(event).__name__
+        rider = getattr(event, "rider", None)
+        driver = getattr(event, "driver", None)
+        rider = None if rider is None else rider.id
+        driver = None if driver is None else driver.id
+        if (self._types is not None and kind not in self._types) or \
+                (self._actors is not None and rider not in self._actors
+                 and driver not in self._actors):
+            self._record = None
+        else:
+            self._record = (kind, event.timestamp, rider, driver)
+
+    def end(self, spawned):
+        """Log the captured event, which returned <spawned>.
+
+        @type self: TraceSink
+        @type spawned: list[Event] | None
+        @rtype: None
+        """
+
+        record = self._record
+        if record is None:
+            self._notes.clear()
+            return
+
+        if self.level >= DECISIONS:
+            decision = None
+            for new_event in spawned or ():
+                if type(new_event) is Pickup:
+                    decision = new_event.driver.id if record[3] is None \
+                        else new_event.rider.id
+            record += (decision,)
+            if self.level >= NOTIFICATIONS:
+                record += (tuple(self._notes),)
+                self._notes.clear()
+        self._writer.write(record)
+        self.logged += 1
+
+    def close(self):
+        """Write out everything logged, and close the writer.
+
+        @type self: TraceSink
+        @rtype: None
+        """
+
+        self._writer.close()
+
+
+class _BatchWriter:
+    """A writer of captured event records that formats and writes them in
+    batches on a background thread.
+
+    This class is abstract; subclasses implement format().
+    """
+
+    # === Private Attributes ===
+    # @type _file: io.TextIOWrapper
+    # @type _batch: list[tuple]
+    #     Records not yet handed to the thread.
+    # @type _batch_size: int
+    # @type _batches: queue.Queue
+    #     Batches waiting for the thread, then None once closed.
+    # @type _thread: threading.Thread
+
+    def __init__(self, filename, batch_size=4096, max_batches=16):
+        """Initialize a _BatchWriter that writes to <filename>.
+
+        @type self: _BatchWriter
+        @type filename: str
+        @type batch_size: int
+            How many records to hand to the thread at a time.
+        @type max_batches: int
+            How many batches may wait for the thread before write blocks.
+        @rtype: None
+        """
+
+        self._file = open(filename, "w")
+        self._batch = []
+        self._batch_size = batch_size
+        self._batches = Queue(max_batches)
+        self._thread = Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def format(self, record):
+        """Return the line to write for <record>, without a newline.
+
+        @type self: _BatchWriter
+        @type record: tuple
+        @rtype: str
+        """
+
+        raise NotImplementedError("Implemented in a subclass")
+
+    def write(self, record):
+        """Queue <record> to be written.
+
+        @type self: _BatchWriter
+        @type record: tuple
+        @rtype: None
+        """
+
+        batch = self._batch
+        batch.append(record)
+        if len(batch) >= self._batch_size:
+            self._batches.put(batch)
+            self._batch = []
+
+    def close(self):
+        """Write every queued record, and close the file.
+
+        @type self: _BatchWriter
+        @rtype: None
+        """
+
+        if self._batch:
+            self._batches.put(self._batch)
+            self._batch = []
+        self._batches.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _drain(self):
+        """Format and write batches until the writer is closed.
+
+        @type self: _BatchWriter
+        @rtype: None
+        """
+
+        format_record = self.format
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                break
+            self._file.write("".join(format_record(record) + "\n"
+                                     for record in batch))
+        self._file.flush()
+
+
+class TextWriter(_BatchWriter):
+    """A writer of one line of text per event, with each notification on
+    an indented line of its own.
+    """
+
+    def format(self, record):
+        """Return the lines to write for <record>, without a final newline.
+
+        @type self: TextWriter
+        @type record: tuple
+        @rtype: str
+
+        >>> from location import Location
+        >>> writer = TextWriter.__new__(TextWriter)
+        >>> print(writer.format(('Pickup', 4, 'Bo', 'Ann')))
+        4 -- Pickup rider=Bo driver=Ann
+        >>> print(writer.format(('RiderRequest', 2, 'Bo', None, 'Ann',
+        ...     (('rider', 'request', 'Bo', Location(1, 2)),))))
+        2 -- RiderRequest rider=Bo -> Ann
+            rider request Bo at 1,2
+        """
+
+        kind, timestamp, rider, driver = record[:4]
+        line = "{} -- {}".format(timestamp, kind)
+        if rider is not None:
+            line += " rider={}".format(rider)
+        if driver is not None:
+            line += " driver={}".format(driver)
+        if len(record) > 4 and record[4] is not None:
+            line += " -> {}".format(record[4])
+        if len(record) > 5:
+            for category, description, identifier, location in record[5]:
+                line += "\n    {} {} {} at {},{}".format(
+                    category, description, identifier, location.row,
+                    location.column)
+        return line
+
+
+class JsonLinesWriter(_BatchWriter):
+    """A writer of one JSON object per event."""
+
+    def format(self, record):
+        """Return the JSON line to write for <record>.
+
+        @type self: JsonLinesWriter
+        @type record: tuple
+        @rtype: str
+
+        >>> writer = JsonLinesWriter.__new__(JsonLinesWriter)
+        >>> print(writer.format(('DriverRequest', 0, None, 'Ann', None)))
+        {"time": 0, "event": "DriverRequest", "rider": null, "driver": "Ann", "decision": null}
+        """
+
+        kind, timestamp, rider, driver = record[:4]
+        fields = {"time": timestamp, "event": kind, "rider": rider,
+                  "driver": driver}
+        if len(record) > 4:
+            fields["decision"] = record[4]
+        if len(record) > 5:
+            fields["notes"] = [
+                {"category": category, "description": description,
+                 "id": identifier, "location": [location.row,
+                                                location.column]}
+                for category, description, identifier, location
+                in record[5]]
+        return json.dumps(fields)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from event import create_event_list
+    from simulation import Simulation
+
+    parser = argparse.ArgumentParser(description="Log a simulation run.")
+    parser.add_argument("filename", nargs="?", default="events.txt")
+    parser.add_argument("--output", default="trace.log")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--level", type=int, default=EVENTS)
+    parser.add_argument("--types", nargs="+", default=None)
+    parser.add_argument("--actors", nargs="+", default=None)
+    arguments = parser.parse_args()
+
+    writer = (JsonLinesWriter if arguments.json else TextWriter)(
+        arguments.output)
+    sink = TraceSink(writer, arguments.level, arguments.types,
+                     arguments.actors)
+    print(Simulation(observer=sink).run(
+        create_event_list(arguments.filename)))
+    sink.close()
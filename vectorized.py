@@ -0,0 +1,448 @@
+"""
+The vectorized module contains VectorizedSimulation, an alternative engine
+that advances the whole system in integer ticks, with rider and driver
+state held in NumPy arrays.
+
+Instead of a queue of event objects, each driver has a state and the tick
+at which its current drive or ride ends, and each rider has a status and
+the tick at which they run out of patience. Each pickup, dropoff and
+cancellation also has the sequence number the event-driven Simulation
+would have given its event when scheduling it, and so does each request of
+a freed driver. A tick does, in order:
+
+    1. the rider and driver requests from the input at that tick, in input
+       order, matching each rider with the nearest idle driver;
+    2. every dropoff, pickup and cancellation due at that tick that comes
+       before the first pending driver request, as array operations; a
+       pickup beats a cancellation of its rider if it comes first;
+    3. the pending driver requests that come before anything else still
+       due, in order, each taking the longest-waiting rider.
+
+Steps 2 and 3 repeat while anything is due at the tick, and ticks where
+nothing is due are skipped. Events are thus done in the same order as in
+the event-driven Simulation, so both engines give exactly the same report;
+validate() checks this.
+
+This module requires NumPy.
+"""
+
+from collections import deque
+
+import numpy as np
+
+from scenario import Scenario, RIDER_REQUEST
+from simulation import Simulation
+
+# Driver states.
+_OFFLINE = 0
+_IDLE = 1
+_EN_ROUTE = 2
+_RIDING = 3
+
+# Rider statuses.
+_PENDING = 0
+_QUEUED = 1
+_ASSIGNED = 2
+_SATISFIED = 3
+_CANCELLED = 4
+
+
+def _travel_time(distance, speed):
+    """Return the travel times for <distance> at <speed>, rounded half to
+    even like Driver.get_travel_time.
+
+    @type distance: numpy.ndarray | int
+    @type speed: numpy.ndarray | int
+    @rtype: numpy.ndarray | int
+
+    >>> _travel_time(np.array([5, 3, 4]), np.array([2, 2, 1]))
+    array([2, 2, 4])
+    """
+
+    return np.rint(distance / speed).astype(np.int64)
+
+
+class VectorizedSimulation:
+    """A time-stepped simulation over arrays of riders and drivers.
+
+    It has the same run() interface, and produces the same report keys, as
+    Simulation.
+    """
+
+    # === Private Attributes ===
+    # Drivers are indexed in the order they first request a rider, and
+    # riders in the order they request a driver, so argmin ties and the
+    # FIFO waiting list fall out of index order.
+    #
+    # @type _row, _column: numpy.ndarray
+    #     The current location of each driver.
+    # @type _last_row, _last_column: numpy.ndarray
+    #     The location of each driver's last recorded activity.
+    # @type _speed: numpy.ndarray
+    # @type _state: numpy.ndarray
+    #     _OFFLINE, _IDLE, _EN_ROUTE or _RIDING for each driver.
+    # @type _until: numpy.ndarray
+    #     The tick at which each driver's drive or ride ends.
+    # @type _rider: numpy.ndarray
+    #     The rider each busy driver is serving, or -1.
+    # @type _total, _ride: numpy.ndarray
+    #     The total and on-ride distance of each driver.
+    # @type _origin_row, _origin_column, _dest_row, _dest_column: ndarray
+    # @type _requested: numpy.ndarray
+    #     The tick of each rider's request.
+    # @type _deadline: numpy.ndarray
+    #     The tick at which each rider cancels.
+    # @type _status: numpy.ndarray
+    #     _PENDING, _QUEUED, _ASSIGNED, _SATISFIED or _CANCELLED.
+    # @type _scheduled: numpy.ndarray
+    #     The sequence number of each busy driver's pickup or dropoff.
+    # @type _cancel_sequence: numpy.ndarray
+    #     The sequence number of each rider's cancellation.
+    # @type _sequence: int
+    #     The sequence number of the next event scheduled.
+    # @type _wait_total: int
+    # @type _wait_count: int
+    #     The sum and number of finished rider waits.
+
+    def run(self, initial_events):
+        """Run the simulation on the list of events in <initial_events>.
+
+        Return a dictionary containing statistics of the simulation, with
+        the same keys as Simulation.run.
+
+        @type self: VectorizedSimulation
+        @type initial_events: list[Event] | Scenario
+        @rtype: dict[str, object]
+
+        >>> from workload import generate
+        >>> (VectorizedSimulation().run(generate(3, 0, seed=1))
+        ...  == Simulation().run(generate(3, 0, seed=1)))
+        True
+        >>> VectorizedSimulation().run(generate(0, 2, seed=1))
+        {'rider_wait_time': 0.0, 'driver_total_distance': 0.0, 'driver_ride_distance': 0.0}
+        """
+
+        scenario = initial_events if isinstance(initial_events, Scenario) \
+            else Scenario.from_events(initial_events)
+        arrivals = self._load(scenario)
+
+        position = 0
+        while True:
+            now = self._next_tick(arrivals, position)
+            if now is None:
+                break
+            while position < len(arrivals) and arrivals[position][0] == now:
+                _, _, is_rider, index = arrivals[position]
+                if is_rider:
+                    self._request_driver(now, index)
+                else:
+                    self._request_rider(now, np.array([index]), first=True)
+                position += 1
+            self._settle(now)
+
+        online = self._state != _OFFLINE
+        drivers = int(np.count_nonzero(online))
+        if drivers == 0:
+            total_distance = ride_distance = 0.0
+        else:
+            total_distance = int(self._total[online].sum()) / drivers
+            ride_distance = int(self._ride[online].sum()) / drivers
+        return {"rider_wait_time": self._wait_total / self._wait_count
+                if self._wait_count else 0.0,
+                "driver_total_distance": total_distance,
+                "driver_ride_distance": ride_distance}
+
+    def _load(self, scenario):
+        """Set up the rider and driver arrays for <scenario>, and return its
+        requests as (tick, input position, is rider, index) tuples in the
+        order they happen.
+
+        @type self: VectorizedSimulation
+        @type scenario: Scenario
+        @rtype: list[(int, int, bool, int)]
+        """
+
+        ordered = sorted(enumerate(scenario.records),
+                         key=lambda item: (item[1][1], item[0]))
+        riders = [record for _, record in ordered
+                  if record[0] == RIDER_REQUEST]
+        drivers = [record for _, record in ordered
+                   if record[0] != RIDER_REQUEST]
+
+        def column(records, field):
+            return np.array([record[field] for record in records],
+                            dtype=np.int64)
+
+        self._row = column(drivers, 3)
+        self._column = column(drivers, 4)
+        self._last_row = self._row.copy()
+        self._last_column = self._column.copy()
+        self._speed = column(drivers, 7)
+        self._state = np.full(len(drivers), _OFFLINE, dtype=np.int8)
+        self._until = np.zeros(len(drivers), dtype=np.int64)
+        self._rider = np.full(len(drivers), -1, dtype=np.int64)
+        self._scheduled = np.zeros(len(drivers), dtype=np.int64)
+        self._total = np.zeros(len(drivers), dtype=np.int64)
+        self._ride = np.zeros(len(drivers), dtype=np.int64)
+
+        self._requested = column(riders, 1)
+        self._origin_row = column(riders, 3)
+        self._origin_column = column(riders, 4)
+        self._dest_row = column(riders, 5)
+        self._dest_column = column(riders, 6)
+        self._deadline = self._requested + column(riders, 7)
+        self._status = np.full(len(riders), _PENDING, dtype=np.int8)
+        self._cancel_sequence = np.zeros(len(riders), dtype=np.int64)
+        self._sequence = 0
+        self._wait_total = 0
+        self._wait_count = 0
+
+        arrivals = []
+        rider_index = driver_index = 0
+        for position, record in ordered:
+            if record[0] == RIDER_REQUEST:
+                arrivals.append((record[1], position, True, rider_index))
+                rider_index += 1
+            else:
+                arrivals.append((record[1], position, False, driver_index))
+                driver_index += 1
+        return arrivals
+
+    def _next_tick(self, arrivals, position):
+        """Return the next tick at which anything happens, or None if the
+        simulation is over.
+
+        @type self: VectorizedSimulation
+        @type arrivals: list[(int, int, bool, int)]
+        @type position: int
+        @rtype: int | None
+        """
+
+        candidates = []
+        if position < len(arrivals):
+            candidates.append(arrivals[position][0])
+        busy = self._state >= _EN_ROUTE
+        if busy.any():
+            candidates.append(int(self._until[busy].min()))
+        open_riders = (self._status == _QUEUED) | (self._status == _ASSIGNED)
+        if open_riders.any():
+            candidates.append(int(self._deadline[open_riders].min()))
+        return min(candidates) if candidates else None
+
+    def _assign(self, now, driver, rider):
+        """Send <driver> towards <rider>, scheduling the pickup.
+
+        @type self: VectorizedSimulation
+        @type now: int
+        @type driver: int
+        @type rider: int
+        @rtype: None
+        """
+
+        distance = abs(self._row[driver] - self._origin_row[rider]) \
+            + abs(self._column[driver] - self._origin_column[rider])
+        self._state[driver] = _EN_ROUTE
+        self._until[driver] = now + _travel_time(distance, self._speed[driver])
+        self._rider[driver] = rider
+        self._scheduled[driver] = self._sequence
+        self._sequence += 1
+        self._status[rider] = _ASSIGNED
+
+    def _request_driver(self, now, rider):
+        """Match <rider> with the nearest idle driver, or queue them, and
+        schedule their cancellation.
+
+        @type self: VectorizedSimulation
+        @type now: int
+        @type rider: int
+        @rtype: None
+        """
+
+        idle = np.flatnonzero(self._state == _IDLE)
+        if len(idle) == 0:
+            self._status[rider] = _QUEUED
+        else:
+            distance = np.abs(self._row[idle] - self._origin_row[rider]) \
+                + np.abs(self._column[idle] - self._origin_column[rider])
+            times = _travel_time(distance, self._speed[idle])
+            self._assign(now, idle[np.argmin(times)], rider)
+        self._cancel_sequence[rider] = self._sequence
+        self._sequence += 1
+
+    def _request_rider(self, now, drivers, first=False):
+        """Record requests by <drivers>, in order, and give each of them the
+        longest-waiting rider, if there is one.
+
+        @type self: VectorizedSimulation
+        @type now: int
+        @type drivers: numpy.ndarray
+        @type first: bool
+            True iff these are the drivers' first requests.
+        @rtype: None
+        """
+
+        if not first:
+            self._total[drivers] += \
+                np.abs(self._row[drivers] - self._last_row[drivers]) \
+                + np.abs(self._column[drivers] - self._last_column[drivers])
+        self._last_row[drivers] = self._row[drivers]
+        self._last_column[drivers] = self._column[drivers]
+        self._state[drivers] = _IDLE
+
+        waiting = np.flatnonzero(self._status == _QUEUED)[:len(drivers)]
+        for driver, rider in zip(drivers, waiting):
+            self._assign(now, driver, rider)
+
+    def _settle(self, now):
+        """Do every dropoff, pickup and cancellation due at <now>, and the
+        requests of the drivers they free, in the order the event-driven
+        Simulation would do them.
+
+        @type self: VectorizedSimulation
+        @type now: int
+        @rtype: None
+        """
+
+        # The (sequence number, driver) of each request of a freed driver
+        # not yet done, in order.
+        requests = deque()
+        while True:
+            due = np.flatnonzero((self._state >= _EN_ROUTE)
+                                 & (self._until == now))
+            cancels = np.flatnonzero(
+                ((self._status == _QUEUED) | (self._status == _ASSIGNED))
+                & (self._deadline == now))
+            if requests:
+                # Only events scheduled before the first request come
+                # before it.
+                first = requests[0][0]
+                later = np.concatenate([self._scheduled[due],
+                                        self._cancel_sequence[cancels]])
+                due = due[self._scheduled[due] < first]
+                cancels = cancels[self._cancel_sequence[cancels] < first]
+                if len(due) == 0 and len(cancels) == 0:
+                    # Do the requests that come before anything else due.
+                    limit = later.min() if len(later) else None
+                    drivers = []
+                    while requests and (limit is None
+                                        or requests[0][0] < limit):
+                        drivers.append(requests.popleft()[1])
+                    self._request_rider(now, np.array(drivers))
+                    continue
+            elif len(due) == 0 and len(cancels) == 0:
+                return
+
+            # The events in this batch only affect each other through
+            # pickups and cancellations of the same rider, so they are done
+            # together; what they schedule is numbered in their order.
+            due = due[np.argsort(self._scheduled[due], kind="stable")]
+            numbers = self._sequence + np.arange(len(due))
+            self._sequence += len(due)
+            riding = self._state[due] == _RIDING
+            dropoffs = due[riding]
+
+            # Dropoff: the driver arrives at the rider's destination.
+            distance = np.abs(self._row[dropoffs] - self._last_row[dropoffs]) \
+                + np.abs(self._column[dropoffs]
+                         - self._last_column[dropoffs])
+            self._total[dropoffs] += distance
+            self._ride[dropoffs] += distance
+            self._last_row[dropoffs] = self._row[dropoffs]
+            self._last_column[dropoffs] = self._column[dropoffs]
+            self._rider[dropoffs] = -1
+
+            # Pickup: succeeds if the rider is still waiting, and has not
+            # cancelled earlier at this very tick.
+            pickups = due[~riding]
+            riders = self._rider[pickups]
+            picked = (self._status[riders] == _ASSIGNED) \
+                & ((self._deadline[riders] > now)
+                   | (self._cancel_sequence[riders]
+                      > self._scheduled[pickups]))
+            missed = pickups[~picked]
+            succeeded = ~riding
+            succeeded[~riding] = picked
+            pickups, riders = pickups[picked], riders[picked]
+
+            self._status[riders] = _SATISFIED
+            self._wait_total += int((now - self._requested[riders]).sum())
+            self._wait_count += len(riders)
+            self._row[pickups] = self._origin_row[riders]
+            self._column[pickups] = self._origin_column[riders]
+            self._total[pickups] += \
+                np.abs(self._row[pickups] - self._last_row[pickups]) \
+                + np.abs(self._column[pickups] - self._last_column[pickups])
+            self._last_row[pickups] = self._row[pickups]
+            self._last_column[pickups] = self._column[pickups]
+            distance = np.abs(self._dest_row[riders] - self._row[pickups]) \
+                + np.abs(self._dest_column[riders] - self._column[pickups])
+            self._until[pickups] = now + _travel_time(distance,
+                                                      self._speed[pickups])
+            self._scheduled[pickups] = numbers[succeeded]
+            self._state[pickups] = _RIDING
+            # The driver is at the destination once the ride ends; nothing
+            # else reads the location of a riding driver before then.
+            self._row[pickups] = self._dest_row[riders]
+            self._column[pickups] = self._dest_column[riders]
+            self._rider[missed] = -1
+
+            # Cancellation of riders who are still waiting.
+            cancels = cancels[(self._status[cancels] == _QUEUED)
+                              | (self._status[cancels] == _ASSIGNED)]
+            self._status[cancels] = _CANCELLED
+            self._wait_total += int((now - self._requested[cancels]).sum())
+            self._wait_count += len(cancels)
+
+            # Dropoffs and missed pickups free their drivers, who ask for a
+            # rider again in the order their events were done.
+            freed = ~succeeded
+            self._state[due[freed]] = _IDLE
+            requests.extend(zip(numbers[freed].tolist(),
+                                due[freed].tolist()))
+
+
+def validate(initial_events, tolerance=0.0):
+    """Run <initial_events> on both the event-driven Simulation and the
+    VectorizedSimulation, and compare their reports.
+
+    Return a dictionary from each report key to (event-driven value,
+    vectorized value, relative difference, within tolerance).
+
+    @type initial_events: list[Event] | Scenario
+    @type tolerance: float
+        The largest relative difference allowed; by default, the reports
+        must be exactly the same.
+    @rtype: dict[str, (float, float, float, bool)]
+
+    >>> from workload import generate
+    >>> all(ok for _, _, _, ok in
+    ...     validate(generate(3, 2, size=6, seed=47)).values())
+    True
+    >>> all(ok for seed in range(40)
+    ...     for _, _, _, ok in validate(generate(30, 6, 8, seed)).values())
+    True
+    """
+
+    scenario = initial_events if isinstance(initial_events, Scenario) \
+        else Scenario.from_events(initial_events)
+    expected = Simulation().run(scenario.events())
+    actual = VectorizedSimulation().run(scenario)
+
+    comparison = {}
+    for key, value in expected.items():
+        difference = abs(actual[key] - value) / abs(value) if value else \
+            abs(actual[key])
+        comparison[key] = (value, actual[key], difference,
+                           difference <= tolerance)
+    return comparison
+
+
+if __name__ == "__main__":
+    import sys
+    from event import create_event_list
+
+    filename = sys.argv[1] if len(sys.argv) > 1 else "events.txt"
+    for key, (expected, actual, difference, ok) in \
+            validate(create_event_list(filename)).items():
+        print("{}: event-driven {} vectorized {} ({:.2%}{})".format(
+            key, expected, actual, difference, "" if ok else ", MISMATCH"))
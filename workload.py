@@ -0,0 +1,93 @@
+"""
+The workload module generates random scenarios of a given size, for
+measuring how the simulation scales.
+
+Drivers come online during the first quarter of the scenario and riders
+request rides throughout it, at uniformly random locations on a square
+grid. A scenario is determined by its sizes and seed.
+"""
+
+from random import Random
+
+from driver import Driver
+from event import RiderRequest, DriverRequest
+from location import Location
+from rider import Rider
+
+
+def generate(riders, drivers, size=20, seed=0, duration=None):
+    """Return the initial events of a random scenario with <riders> riders
+    and <drivers> drivers, in timestamp order.
+
+    @type riders: int
+    @type drivers: int
+    @type size: int
+        The side of the square grid.
+    @type seed: int
+    @type duration: int | None
+        The time over which riders arrive, or None for two time units per
+        rider.
+    @rtype: list[Event]
+
+    >>> events = generate(3, 1, seed=4)
+    >>> len(events), sum(isinstance(event, DriverRequest) for event in events)
+    (4, 1)
+    >>> [event.timestamp for event in events] == sorted(
+    ...     event.timestamp for event in events)
+    True
+    """
+
+    random = Random(seed)
+    duration = duration or 2 * riders
+
+    def place():
+        return Location(random.randrange(size), random.randrange(size))
+
+    events = [DriverRequest(random.randrange(duration // 4 + 1),
+                            Driver("D{}".format(i), place(),
+                                   random.randint(1, 3)))
+              for i in range(drivers)]
+    events += [RiderRequest(random.randrange(duration),
+                            Rider("R{}".format(i), place(), place(),
+                                  random.randint(5, 30)))
+               for i in range(riders)]
+    events.sort(key=lambda event: event.timestamp)
+    return events
+
+
+def write(events, filename):
+    """Write <events> to <filename> in the format of create_event_list.
+
+    @type events: list[Event]
+    @type filename: str
+    @rtype: None
+    """
+
+    with open(filename, "w") as file:
+        for event in events:
+            if isinstance(event, DriverRequest):
+                driver = event.driver
+                file.write("{} DriverRequest {} {},{} {}\n".format(
+                    event.timestamp, driver.id, driver.location.row,
+                    driver.location.column, driver.speed))
+            else:
+                rider = event.rider
+                file.write("{} RiderRequest {} {},{} {},{} {}\n".format(
+                    event.timestamp, rider.id, rider.origin.row,
+                    rider.origin.column, rider.destination.row,
+                    rider.destination.column, rider.patience))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a scenario.")
+    parser.add_argument("filename")
+    parser.add_argument("riders", type=int)
+    parser.add_argument("drivers", type=int)
+    parser.add_argument("--size", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    write(generate(arguments.riders, arguments.drivers, arguments.size,
+                   arguments.seed), arguments.filename)